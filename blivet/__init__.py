@@ -67,6 +67,7 @@ import parted
 from pykickstart.constants import AUTOPART_TYPE_LVM, CLEARPART_TYPE_ALL, CLEARPART_TYPE_LINUX, CLEARPART_TYPE_LIST, CLEARPART_TYPE_NONE
 
 from .storage_log import log_exception_info, log_method_call
+from .instrumentation import recorder
 from .errors import DeviceError, DirtyFSError, FSResizeError, FSTabTypeMismatchError, LUKSDeviceWithoutKeyError, UnknownSourceDeviceError, SanityError, SanityWarning, StorageError, UnrecognizedFSTabEntryError
 from .devices import BTRFSDevice, BTRFSSubVolumeDevice, BTRFSVolumeDevice, DirectoryDevice, FileDevice, LVMLogicalVolumeDevice, LVMThinLogicalVolumeDevice, LVMThinPoolDevice, LVMVolumeGroupDevice, MDRaidArrayDevice, NetworkStorageDevice, NFSDevice, NoDevice, OpticalDevice, PartitionDevice, TmpFSDevice, devicePathToName
 from .devicetree import DeviceTree
@@ -75,10 +76,12 @@ from .formats import getFormat
 from .formats import get_device_format_class
 from .formats import get_default_filesystem_type
 from . import devicefactory
+from .snapshot import Snapshot
 from .devicelibs.dm import name_from_dm_node
 from .devicelibs.crypto import generateBackupPassphrase
 from .devicelibs.edd import get_edd_dict
 from .devicelibs.dasd import make_dasd_list, write_dasd_conf
+from .devicelibs import lvm
 from .udev import udev_trigger
 from . import iscsi
 from . import fcoe
@@ -308,7 +311,12 @@ class Blivet(object):
 
     def doIt(self):
         """ Commit queued changes to disk. """
-        self.devicetree.processActions()
+        try:
+            self.devicetree.processActions()
+        finally:
+            # the time spent in each phase since the last reset
+            recorder.logSummary()
+
         if not flags.installer_mode:
             return
 
@@ -376,14 +384,17 @@ class Blivet(object):
         return newid
 
     def shutdown(self):
-        """ Deactivate all devices (installer_mode only). """
-        if not flags.installer_mode:
-            return
+        """ Deactivate all devices (installer_mode only).
 
-        try:
-            self.devicetree.teardownAll()
-        except Exception: # pylint: disable=broad-except
-            log_exception_info(log.error, "failure tearing down device tree")
+            This also stops the lvm shell, if lvm commands were run in one.
+        """
+        if flags.installer_mode:
+            try:
+                self.devicetree.teardownAll()
+            except Exception: # pylint: disable=broad-except
+                log_exception_info(log.error, "failure tearing down device tree")
+
+        lvm.stop_shell()
 
     def reset(self, cleanupOnly=False):
         """ Reset storage configuration to reflect actual system state.
@@ -398,6 +409,7 @@ class Blivet(object):
             about the cleanupOnly keyword argument.
         """
         log.info("resetting Blivet (version %s) instance %s", __version__, self)
+        recorder.reset()
         if flags.installer_mode:
             # save passphrases for luks devices so we don't have to reprompt
             self.encryptionPassphrase = None
@@ -444,6 +456,7 @@ class Blivet(object):
             self.devicetree.getActiveMounts()
 
         self.updateBootLoaderDiskList()
+        recorder.logSummary()
 
     @property
     def unusedDevices(self):
@@ -473,9 +486,7 @@ class Blivet(object):
     @property
     def devices(self):
         """ A list of all the devices in the device tree. """
-        devices = self.devicetree.devices
-        devices.sort(key=lambda d: d.name)
-        return devices
+        return sorted(self.devicetree.devices, key=lambda d: d.name)
 
     @property
     def disks(self):
@@ -1997,6 +2008,19 @@ class Blivet(object):
         log.debug("finished Blivet copy")
         return new
 
+    def snapshot(self):
+        """ Return a snapshot of the device tree that can be restored later.
+
+            :rtype: :class:`~.snapshot.Snapshot`
+
+            Unlike :meth:`copy`, this does not copy the devices, formats and
+            actions; it shares them with this instance and only saves their
+            state the first time each is about to change. Use it to undo
+            changes to this instance, use :meth:`copy` to get an independent
+            instance. Release the snapshot when it is no longer needed.
+        """
+        return Snapshot(self)
+
     def updateKSData(self):
         """ Update ksdata to reflect the settings of this Blivet instance. """
         if not self.ksdata or not self.mountpoints:
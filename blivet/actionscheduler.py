@@ -0,0 +1,244 @@
+# actionscheduler.py
+# Parallel execution of device actions.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+import collections
+import sys
+import threading
+import Queue
+
+from .storage_log import log_exception_info
+from .tsort import CyclicGraphError
+
+import logging
+log = logging.getLogger("blivet")
+
+class ActionScheduler(object):
+    """ Run sorted actions in parallel, subject to their ordering requirements.
+
+        The requirements are given as a graph like those returned by
+        :func:`~.tsort.create_graph`, whose items are indices into the list
+        of actions. An action can start once every action it requires has
+        completed and every earlier action on any of the same disks has
+        completed. Actions on the same disk therefore run one at a time and
+        in list order, which keeps the disk label commits for each disk
+        serialized.
+    """
+    def __init__(self, actions, graph, jobs=1):
+        """
+            :param actions: the actions, in a valid (topological) order
+            :type actions: list of :class:`~.deviceaction.DeviceAction`
+            :param graph: the ordering requirements
+            :type graph: dict (see :func:`~.tsort.create_graph`)
+            :keyword int jobs: the maximum number of actions to run at once
+        """
+        self.actions = actions
+        self.jobs = max(1, jobs)
+
+        self._children = collections.defaultdict(list)
+        for (parent, child) in graph['edges']:
+            self._children[parent].append(child)
+
+        self._incoming = dict(graph['incoming'])
+        self._ranks = graph.get('ranks') or {}
+
+        # ranked actions wait for every action of a higher rank
+        self._ranked = collections.defaultdict(list)
+        for (idx, rank) in self._ranks.items():
+            self._ranked[rank].append(idx)
+
+        self._above = {}
+        remaining = 0
+        for rank in sorted(self._ranked, reverse=True):
+            self._above[rank] = remaining
+            remaining += len(self._ranked[rank])
+
+        # actions on each disk, in list order
+        self._disks = []
+        self._queues = collections.defaultdict(collections.deque)
+        for (idx, action) in enumerate(actions):
+            disks = self._getDiskKeys(action)
+            self._disks.append(disks)
+            for disk in disks:
+                self._queues[disk].append(idx)
+
+        self._started = set()
+        self._pending = set(range(len(actions)))
+
+    @staticmethod
+    def _getDiskKeys(action):
+        """ Return ids of the disks an action may touch.
+
+            Actions on devices that are not backed by any disk are keyed by
+            their device's id instead.
+        """
+        devices = [action.device]
+        container = getattr(action, "container", None)
+        if container is not None:
+            devices.append(container)
+
+        keys = set()
+        for device in devices:
+            disks = device.disks
+            if disks:
+                keys.update(d.id for d in disks)
+            else:
+                keys.add(device.id)
+
+        return keys
+
+    def _isReady(self, idx):
+        rank = self._ranks.get(idx)
+        return (idx not in self._started and
+                self._incoming[idx] == 0 and
+                (rank is None or self._above[rank] == 0) and
+                all(self._queues[disk][0] == idx for disk in self._disks[idx]))
+
+    def _getReady(self, candidates):
+        return sorted(idx for idx in set(candidates) if self._isReady(idx))
+
+    def _finish(self, idx):
+        """ Record the completion of an action.
+
+            :returns: indices of actions that may have become ready
+            :rtype: list of int
+        """
+        self._pending.discard(idx)
+        candidates = []
+        for disk in self._disks[idx]:
+            queue = self._queues[disk]
+            queue.popleft()
+            if queue:
+                candidates.append(queue[0])
+
+        for child in self._children[idx]:
+            self._incoming[child] -= 1
+            candidates.append(child)
+
+        rank = self._ranks.get(idx)
+        if rank is not None:
+            for lower in (r for r in self._above if r < rank):
+                self._above[lower] -= 1
+                if self._above[lower] == 0:
+                    candidates.extend(self._ranked[lower])
+
+        return candidates
+
+    def plan(self):
+        """ Return the order in which the actions would run.
+
+            :returns: a list of steps, each a list of actions that would run
+                      at the same time
+            :rtype: list of lists of :class:`~.deviceaction.DeviceAction`
+
+            Each step starts once the whole of the previous step completes.
+            The scheduler cannot be used to run the actions afterwards.
+        """
+        steps = []
+        ready = self._getReady(self._pending)
+        while ready:
+            step = ready[:self.jobs]
+            self._started.update(step)
+            steps.append([self.actions[idx] for idx in step])
+
+            candidates = ready[self.jobs:]
+            for idx in step:
+                candidates.extend(self._finish(idx))
+
+            ready = self._getReady(candidates)
+
+        if self._pending:
+            raise CyclicGraphError("actions cannot all be scheduled")
+
+        return steps
+
+    def run(self, execute, complete):
+        """ Run the actions.
+
+            :param execute: the function that executes an action, called in
+                            a worker thread
+            :type execute: callable taking a single action
+            :param complete: the function to call after an action succeeds,
+                             called in the calling thread
+            :type complete: callable taking a single action
+
+            If executing an action raises an exception, no more actions are
+            started. The first such exception is raised again, with its
+            original traceback, once all of the running actions have
+            finished.
+        """
+        todo = Queue.Queue()
+        done = Queue.Queue()
+
+        def worker():
+            while True:
+                idx = todo.get()
+                if idx is None:
+                    return
+
+                try:
+                    execute(self.actions[idx])
+                except Exception: # pylint: disable=broad-except
+                    log_exception_info(fmt_str="action failed: %s",
+                                       fmt_args=[self.actions[idx]])
+                    done.put((idx, sys.exc_info()))
+                else:
+                    done.put((idx, None))
+
+        workers = [threading.Thread(target=worker)
+                   for _i in range(min(self.jobs, len(self.actions)))]
+        for thread in workers:
+            thread.daemon = True
+            thread.start()
+
+        error = None
+        running = 0
+        ready = self._getReady(self._pending)
+        try:
+            while True:
+                while ready and running < self.jobs and error is None:
+                    idx = ready.pop(0)
+                    self._started.add(idx)
+                    todo.put(idx)
+                    running += 1
+
+                if not running:
+                    break
+
+                (idx, exc_info) = done.get()
+                running -= 1
+                if exc_info is not None:
+                    error = error or exc_info
+                    continue
+
+                complete(self.actions[idx])
+                ready = self._getReady(ready + self._finish(idx))
+        finally:
+            for _thread in workers:
+                todo.put(None)
+
+            for thread in workers:
+                thread.join()
+
+        if error is not None:
+            (exc_type, exc_value, tb) = error
+            raise exc_type, exc_value, tb
+
+        if self._pending:
+            raise CyclicGraphError("actions cannot all be scheduled")
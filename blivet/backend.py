@@ -0,0 +1,170 @@
+# backend.py
+# Recording and replaying what blivet learns from the running system.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+import copy
+import errno
+import json
+import threading
+
+import logging
+log = logging.getLogger("blivet")
+
+class SystemBackend(object):
+    """ Queries of the running system: external programs, sysfs and udev.
+
+        Every query has a kind, like "run" or "file", and a key, like the
+        command line or the path of the file. Results must be made of
+        types JSON can represent, so that they can be recorded.
+    """
+    def query(self, kind, key, func, *args):
+        """ Return func(*args), the answer to the query key of kind kind.
+
+            :param str kind: the kind of query
+            :param str key: what is queried
+            :param func: the function that queries the system
+            :type func: callable
+            :param args: arguments to call func with
+            :raises: :class:`EnvironmentError` raised by func
+        """
+        return func(*args)
+
+class RecordingBackend(SystemBackend):
+    """ Queries of the running system, with the results saved for replay.
+
+        Queries that raise :class:`EnvironmentError` are recorded as the
+        error. A query made more than once is recorded each time, so that
+        results that change, like the output of lvs after an lv was
+        created, are replayed in order. See :class:`ReplayBackend`.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {}
+
+    def _record(self, kind, key, record):
+        with self._lock:
+            self._records.setdefault(kind, {}).setdefault(key, []).append(record)
+
+    def query(self, kind, key, func, *args):
+        try:
+            result = func(*args)
+        except EnvironmentError as e:
+            self._record(kind, key, {"error": [e.errno, e.strerror]})
+            raise
+
+        self._record(kind, key, {"result": copy.deepcopy(result)})
+        return result
+
+    @property
+    def records(self):
+        """ The results recorded so far.
+
+            :returns: lists of results by key by kind; each result is a dict
+                      with either a "result" or an "error" key, the latter
+                      holding the error's errno and strerror
+            :rtype: dict
+        """
+        with self._lock:
+            return dict((kind, dict((key, list(records))
+                                    for (key, records) in keys.items()))
+                        for (kind, keys) in self._records.items())
+
+    def save(self, path):
+        """ Write the results recorded so far to the file at path, as JSON. """
+        # strings are taken as latin-1, which maps every byte to a character
+        # and back, so program output that is not valid utf-8 survives too
+        with open(path, "w") as f:
+            json.dump(self.records, f, indent=1, sort_keys=True,
+                      encoding="latin-1")
+
+def _native(value):
+    """ Return value, loaded from a recording, with str in place of unicode. """
+    if isinstance(value, dict):
+        return dict((_native(k), _native(v)) for (k, v) in value.items())
+    elif isinstance(value, list):
+        return [_native(v) for v in value]
+    elif isinstance(value, unicode):
+        return value.encode("latin-1")
+
+    return value
+
+def load(path):
+    """ Return the results :meth:`RecordingBackend.save` wrote to path. """
+    with open(path) as f:
+        return _native(json.load(f))
+
+class ReplayBackend(SystemBackend):
+    """ Answers to queries, as recorded by :class:`RecordingBackend`.
+
+        Results of a query are returned in the order they were recorded,
+        and the last one is returned again once they run out. Queries that
+        were not recorded raise :class:`OSError` with errno ENOENT, as if
+        the program or file did not exist.
+    """
+    def __init__(self, records):
+        """
+            :param records: the recorded results, or the path of a file
+                            :meth:`RecordingBackend.save` wrote them to
+            :type records: dict or str
+        """
+        if not isinstance(records, dict):
+            records = load(records)
+
+        self._lock = threading.Lock()
+        self._records = records
+        self._next = {}
+        self.misses = 0
+
+    def query(self, kind, key, func, *args):
+        records = self._records.get(kind, {}).get(key)
+        with self._lock:
+            if not records:
+                self.misses += 1
+                log.debug("replay: no %s result recorded for %s", kind, key)
+                raise OSError(errno.ENOENT, "no %s result recorded for %s"
+                                            % (kind, key))
+
+            idx = self._next.get((kind, key), 0)
+            self._next[(kind, key)] = idx + 1
+
+        record = records[min(idx, len(records) - 1)]
+        if "error" in record:
+            (err, strerror) = record["error"]
+            raise OSError(err, strerror)
+
+        return copy.deepcopy(record["result"])
+
+_backend = SystemBackend()
+
+def get_backend():
+    """ Return the backend queries of the system go through. """
+    return _backend
+
+def set_backend(backend):
+    """ Make queries of the system go through backend.
+
+        :param backend: the new backend
+        :type backend: :class:`SystemBackend`
+        :returns: the previous backend
+        :rtype: :class:`SystemBackend`
+    """
+    global _backend # pylint: disable=global-statement
+    previous = _backend
+    _backend = backend
+    return previous
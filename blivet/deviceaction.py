@@ -22,6 +22,7 @@
 
 
 from . import util
+from . import snapshot
 
 from . import udev
 from .devices import StorageDevice
@@ -157,6 +158,10 @@ class DeviceAction(util.ObjectID):
         self.container = getattr(self.device, "container", None)
         self._applied = False
 
+    def __setattr__(self, name, value):
+        snapshot.willChange(self)
+        super(DeviceAction, self).__setattr__(name, value)
+
     def apply(self):
         """ apply changes related to the action to the device(s) """
         self._applied = True
@@ -273,6 +278,53 @@ class DeviceAction(util.ObjectID):
                 self.obj == action.obj and
                 self.id > action.id)
 
+    def relationKeys(self):
+        """ Return the keys relating this action to others it may require.
+
+            :returns: this action's own keys and the keys within its reach
+            :rtype: tuple of two sets
+
+            Two actions can only require one another, other than by action
+            type, if the own keys of either intersect the reach keys of the
+            other. The keys cover every relationship examined by the
+            :meth:`requires` methods:
+
+                - actions on the same device or on devices that depend on
+                  one another
+                - actions on partitions on the same disk
+                - actions on logical volumes in the same volume group when
+                  one of them is restricted to a single physical volume
+                - container member actions and actions on devices in the
+                  same container
+        """
+        device = self.device
+        own = set([("device", device.id)])
+        reach = set()
+        for ancestor in device.ancestors:
+            reach.add(("device", ancestor.id))
+            if isinstance(ancestor, PartitionDevice) and ancestor.isLogical:
+                reach.add(("extended", getattr(ancestor.disk, "id", None)))
+
+        if isinstance(device, PartitionDevice):
+            disk_id = getattr(device.disk, "id", None)
+            own.add(("disk", disk_id))
+            reach.add(("disk", disk_id))
+            if device.isExtended:
+                own.add(("extended", disk_id))
+        elif isinstance(device, LVMLogicalVolumeDevice):
+            if device.singlePV:
+                own.add(("vg", device.vg.id))
+            reach.add(("vg", device.vg.id))
+
+        if self.isContainer:
+            own.add(("container", self.container.id))
+
+        for container in (self.container, getattr(device, "container", None)):
+            if container is not None:
+                reach.add(("container", container.id))
+
+        return (own, reach)
+
 
 class ActionCreateDevice(DeviceAction):
     """ Action representing the creation of a new device. """
@@ -291,6 +343,19 @@ class ActionCreateDevice(DeviceAction):
         super(ActionCreateDevice, self).execute()
         self.device.create()
 
+    @staticmethod
+    def executePartitions(actions):
+        """ Execute partition create actions with a single disklabel commit.
+
+            :param actions: create actions for partitions on one disk, in
+                            execution order
+            :type actions: list of :class:`ActionCreateDevice`
+        """
+        for action in actions:
+            DeviceAction.execute(action)
+
+        PartitionDevice.createMany([a.device for a in actions])
+
     def requires(self, action):
         """ Return True if self requires action.
 
@@ -339,7 +404,24 @@ class ActionDestroyDevice(DeviceAction):
     def execute(self):
         super(ActionDestroyDevice, self).execute()
         self.device.destroy()
+        self._removeFromPartedCache()
+
+    @staticmethod
+    def executePartitions(actions):
+        """ Execute partition destroy actions with a single disklabel commit.
+
+            :param actions: destroy actions for partitions on one disk, in
+                            execution order
+            :type actions: list of :class:`ActionDestroyDevice`
+        """
+        for action in actions:
+            DeviceAction.execute(action)
+
+        PartitionDevice.destroyMany([a.device for a in actions])
+        for action in actions:
+            action._removeFromPartedCache()
 
+    def _removeFromPartedCache(self):
         # Make sure libparted does not keep cached info for this device
         # and returns it when we create a new device with the same name
         if self.device.partedDevice:
@@ -300,10 +300,7 @@ class DeviceFactory(object):
         self.parent_factory = None
 
         # used for error recovery
-        self.__devices = []
-        self.__actions = []
-        self.__names = []
-        self.__roots = []
+        self.__snapshot = None
 
     #
     # methods related to device size and disk space requirements
@@ -739,6 +736,9 @@ class DeviceFactory(object):
                 e = DeviceFactoryError(str(e))
 
             raise(e)
+        finally:
+            if self.parent_factory is None:
+                self._release_devicetree()
 
     def _configure(self):
         self._set_container()
@@ -787,17 +787,14 @@ class DeviceFactory(object):
     # methods for error recovery
     #
     def _save_devicetree(self):
-        _blivet_copy = self.storage.copy()
-        self.__devices = _blivet_copy.devicetree._devices
-        self.__actions = _blivet_copy.devicetree._actions
-        self.__names = _blivet_copy.devicetree.names
-        self.__roots = _blivet_copy.roots
+        self.__snapshot = self.storage.snapshot()
 
     def _revert_devicetree(self):
-        self.storage.devicetree._devices = self.__devices
-        self.storage.devicetree._actions = self.__actions
-        self.storage.devicetree.names = self.__names
-        self.storage.roots = self.__roots
+        self.__snapshot.restore()
+
+    def _release_devicetree(self):
+        self.__snapshot.release()
+        self.__snapshot = None
 
 class PartitionFactory(DeviceFactory):
     """ Factory class for creating a partition. """
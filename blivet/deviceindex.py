@@ -0,0 +1,422 @@
+# deviceindex.py
+# Hash indexes for device lookups in the device tree.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+import collections
+import copy
+import functools
+import itertools
+import threading
+import weakref
+
+from .errors import DeviceTreeError
+
+# functions returning the keys a device is indexed under, by index name
+_keyFuncs = {"name": lambda d: (d.name,),
+             "path": lambda d: (d.path,),
+             "sysfsPath": lambda d: (d.sysfsPath,),
+             "uuid": lambda d: (d.uuid, getattr(d.format, "uuid", None)),
+             "label": lambda d: (getattr(d.format, "label", None),),
+             "id": lambda d: (d.id,)}
+
+# devices and formats mapped to (a weak reference to) the index tracking them
+_tracked = weakref.WeakKeyDictionary()
+
+def keysChanged(obj):
+    """ Notify the index tracking obj, if any, that its keys may have changed.
+
+        :param obj: the device or format that changed
+        :type obj: :class:`~.devices.Device` or :class:`~.formats.DeviceFormat`
+
+        This is called by :class:`~.devices.Device` and
+        :class:`~.formats.DeviceFormat` whenever an attribute that determines
+        a lookup key is set.
+    """
+    index = _getIndex(obj)
+    if index is not None:
+        index.update(obj)
+
+def stateChanged(obj):
+    """ Notify the index tracking obj, if any, that its state changed.
+
+        :param obj: the device that changed
+        :type obj: :class:`~.devices.Device`
+
+        This is for changes that do not alter a device's lookup keys but
+        may alter the tree's view of complete devices, such as changes to
+        whether it exists.
+    """
+    index = _getIndex(obj)
+    if index is not None:
+        index.touch()
+
+def parentsChanged(device):
+    """ Notify the index tracking device, if any, that its parents changed.
+
+        :param device: the device whose parent list is about to change
+        :type device: :class:`~.devices.Device`
+
+        This is called before the parent list is modified, so the index only
+        notes the device and resynchronizes its links before the next query.
+    """
+    index = _getIndex(device)
+    if index is not None:
+        index.reparent(device)
+
+def _locked(func):
+    """ Run a method of :class:`DeviceIndex` with the index's lock held. """
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return func(self, *args, **kwargs)
+
+    return wrapper
+
+def _getIndex(obj):
+    ref = _tracked.get(obj)
+    return ref() if ref is not None else None
+
+class DeviceIndex(object):
+    """ Hash indexes over the devices in a :class:`~.devicetree.DeviceTree`.
+
+        The index owns the tree's lists of visible and hidden devices and keeps
+        a dict per lookup key (name, path, sysfs path, uuid, label and id) that
+        maps each key to the set of devices having it. Devices and their
+        formats report changes to their keys via :func:`keysChanged`.
+
+        Lookups return devices in list order, visible devices before hidden
+        ones, so the result matches that of a linear scan of the lists.
+
+        The index also maps each device to its children so that the devices
+        built on a given device can be found without scanning the whole tree.
+
+        Every change to the index or to a tracked device increments
+        :attr:`generation`. The view of complete devices returned by
+        :meth:`getCompleteDevices` is cached until the generation changes.
+
+        Actions executed in parallel change devices from worker threads, so
+        every method holds the index's lock.
+    """
+    def __init__(self, devices=None, hidden=None):
+        """
+            :keyword devices: the initial list of visible devices
+            :type devices: list of :class:`~.devices.StorageDevice`
+            :keyword hidden: the initial list of hidden devices
+            :type hidden: list of :class:`~.devices.StorageDevice`
+        """
+        self._lock = threading.RLock()
+
+        self.devices = []
+        """ the list of visible devices """
+
+        self.hidden = []
+        """ the list of hidden devices """
+
+        self._stamps = {}       # device -> (hidden, insertion stamp)
+        self._keys = {}         # device -> {index name: keys}
+        self._formats = {}      # device -> format indexed with it
+        self._owners = {}       # format -> device
+        self._maps = dict((name, {}) for name in _keyFuncs)
+        self._counter = itertools.count()
+        self._parents = {}      # device -> parents it is linked to
+        self._children = {}     # device -> set of devices it is a parent of
+        self._reparented = set()    # devices whose links may be stale
+
+        self.generation = 0
+        """ incremented whenever the index or one of its devices changes """
+
+        self._view = None           # cached tuple of complete devices
+        self._viewGeneration = None
+        self._viewUUIDs = set()     # device uuids in the cached view
+        self._appended = []         # devices added since the view was built
+
+        self.reset(devices or [], hidden or [])
+
+    def __deepcopy__(self, memo):
+        new = self.__class__.__new__(self.__class__)
+        memo[id(self)] = new
+        new.__init__(copy.deepcopy(self.devices, memo),
+                     copy.deepcopy(self.hidden, memo))
+        return new
+
+    @_locked
+    def reset(self, devices, hidden):
+        """ Replace the contents of the index.
+
+            :param devices: the new list of visible devices
+            :type devices: list of :class:`~.devices.StorageDevice`
+            :param hidden: the new list of hidden devices
+            :type hidden: list of :class:`~.devices.StorageDevice`
+        """
+        for device in list(self._stamps.keys()):
+            self._unindex(device)
+            self._untrack(device)
+
+        self.devices = []
+        self.hidden = []
+        self._stamps.clear()
+        self._parents.clear()
+        self._children.clear()
+        self._reparented.clear()
+        self.touch()
+        for device in devices:
+            self.add(device)
+
+        for device in hidden:
+            self.add(device, hidden=True)
+
+    @_locked
+    def add(self, device, hidden=False):
+        """ Append a device to the visible or hidden list and index it. """
+        if hidden:
+            self.hidden.append(device)
+        else:
+            self.devices.append(device)
+
+        self._stamps[device] = (hidden, next(self._counter))
+        _tracked[device] = weakref.ref(self)
+        self._index(device)
+        self._link(device)
+        self.generation += 1
+        if not hidden:
+            self._appended.append(device)
+
+    @_locked
+    def remove(self, device):
+        """ Remove a device from whichever list contains it. """
+        (hidden, _stamp) = self._stamps.pop(device)
+        if hidden:
+            self.hidden.remove(device)
+        else:
+            self.devices.remove(device)
+
+        self._unindex(device)
+        self._untrack(device)
+        self._unlink(device)
+        self._reparented.discard(device)
+        self.touch()
+
+    @_locked
+    def reparent(self, device):
+        """ Note that the parents of device are changing. """
+        if device in self._stamps:
+            self._reparented.add(device)
+            self.touch()
+
+    @_locked
+    def isVisible(self, device):
+        """ Return True if device is in the list of visible devices. """
+        return self._stamps.get(device, (True,))[0] is False
+
+    @_locked
+    def isHidden(self, device):
+        """ Return True if device is in the list of hidden devices. """
+        return self._stamps.get(device, (False,))[0] is True
+
+    @_locked
+    def lookup(self, index, key, hidden=False):
+        """ Return the devices indexed under a key, in list order.
+
+            :param str index: the index to search (eg: "name", "uuid")
+            :param key: the key to look up
+            :keyword bool hidden: include hidden devices
+            :rtype: list of :class:`~.devices.StorageDevice`
+        """
+        candidates = self._maps[index].get(key)
+        if not candidates:
+            return []
+
+        keyfunc = _keyFuncs[index]
+        found = [d for d in candidates
+                    if (hidden or not self._stamps[d][0]) and key in keyfunc(d)]
+        return self.sort(found)
+
+    @_locked
+    def sort(self, devices):
+        """ Return devices sorted by their position in the lists. """
+        return sorted(devices, key=self._stamps.get)
+
+    @_locked
+    def getChildren(self, device, hidden=False):
+        """ Return the devices that have device as a parent, in list order.
+
+            :param device: the parent device
+            :type device: :class:`~.devices.Device`
+            :keyword bool hidden: include hidden devices
+            :rtype: list of :class:`~.devices.StorageDevice`
+        """
+        self._syncParents()
+        children = self._children.get(device, ())
+        return self.sort(c for c in children
+                            if hidden or not self._stamps[c][0])
+
+    @_locked
+    def getDescendants(self, devices, hidden=False):
+        """ Return all devices built on any of devices, in list order.
+
+            :param devices: the devices to start from
+            :type devices: list of :class:`~.devices.Device`
+            :keyword bool hidden: include hidden devices
+            :rtype: list of :class:`~.devices.StorageDevice`
+
+            The children of each device are visited breadth-first, so the cost
+            is proportional to the number of descendants rather than to the
+            size of the tree. The starting devices themselves are only
+            included if they descend from one another.
+        """
+        self._syncParents()
+        found = set()
+        queue = collections.deque(devices)
+        while queue:
+            for child in self._children.get(queue.popleft(), ()):
+                if child not in found:
+                    found.add(child)
+                    queue.append(child)
+
+        return self.sort(d for d in found if hidden or not self._stamps[d][0])
+
+    @_locked
+    def update(self, obj):
+        """ Re-index the device obj, or the device whose format obj is. """
+        device = self._owners.get(obj, obj)
+        if device not in self._stamps:
+            return
+
+        old_name = self._keys[device]["name"]
+        self._unindex(device)
+        self._index(device)
+        self.touch()
+
+        # the names and paths of some devices are derived from those of their
+        # ancestors, eg: lvm logical volumes
+        if self._keys[device]["name"] != old_name and not device.isleaf:
+            for dep in self.getDescendants([device], hidden=True):
+                self._unindex(dep)
+                self._index(dep)
+
+    @_locked
+    def touch(self):
+        """ Note a change that invalidates the cached view of the tree. """
+        self.generation += 1
+        self._view = None
+        self._appended = []
+
+    @_locked
+    def getCompleteDevices(self, exempt=()):
+        """ Return the visible devices that are complete, in list order.
+
+            :keyword exempt: device classes whose uuids need not be unique
+            :type exempt: tuple of classes
+            :returns: complete devices
+            :rtype: tuple of :class:`~.devices.StorageDevice`
+            :raises: :class:`~.errors.DeviceTreeError` if two of the devices
+                     have the same uuid
+
+            The result is cached until :attr:`generation` changes. Devices
+            appended since the last call are checked and added without
+            rebuilding the whole view.
+        """
+        if self._viewGeneration == self.generation:
+            return self._view
+
+        if self._view is None:
+            view = []
+            self._viewUUIDs = set()
+            devices = self.devices
+        else:
+            view = list(self._view)
+            devices = self._appended
+
+        for device in devices:
+            if not getattr(device, "complete", True):
+                continue
+
+            if device.uuid and not isinstance(device, exempt):
+                if device.uuid in self._viewUUIDs:
+                    self._view = None
+                    self._appended = []
+                    raise DeviceTreeError("duplicate uuids in device tree")
+
+                self._viewUUIDs.add(device.uuid)
+
+            view.append(device)
+
+        self._view = tuple(view)
+        self._viewGeneration = self.generation
+        self._appended = []
+        return self._view
+
+    def _index(self, device):
+        keys = {}
+        for (name, keyfunc) in _keyFuncs.items():
+            keys[name] = tuple(set(k for k in keyfunc(device) if k or k == 0))
+            for key in keys[name]:
+                self._maps[name].setdefault(key, set()).add(device)
+
+        self._keys[device] = keys
+
+        fmt = getattr(device, "format", None)
+        if fmt is not None:
+            self._formats[device] = fmt
+            self._owners[fmt] = device
+            _tracked[fmt] = weakref.ref(self)
+
+    def _link(self, device):
+        parents = tuple(device.parents)
+        self._parents[device] = parents
+        for parent in parents:
+            self._children.setdefault(parent, set()).add(device)
+
+    def _unlink(self, device):
+        for parent in self._parents.pop(device, ()):
+            children = self._children.get(parent)
+            if children is None:
+                continue
+
+            children.discard(device)
+            if not children:
+                del self._children[parent]
+
+    def _syncParents(self):
+        while self._reparented:
+            device = self._reparented.pop()
+            self._unlink(device)
+            self._link(device)
+
+    def _unindex(self, device):
+        keys = self._keys.pop(device, {})
+        for (name, values) in keys.items():
+            for key in values:
+                devices = self._maps[name].get(key)
+                if devices is None:
+                    continue
+
+                devices.discard(device)
+                if not devices:
+                    del self._maps[name][key]
+
+        fmt = self._formats.pop(device, None)
+        if fmt is not None and self._owners.get(fmt) is device:
+            del self._owners[fmt]
+            self._untrack(fmt)
+
+    def _untrack(self, obj):
+        ref = _tracked.get(obj)
+        if ref is not None and ref() is self:
+            del _tracked[obj]
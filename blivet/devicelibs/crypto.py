@@ -20,12 +20,19 @@
 #            Martin Sivak <msivak@redhat.com>
 #
 
+from collections import namedtuple
+import errno
+import json
 import random
+import struct
 from pycryptsetup import CryptSetup
 
 from ..errors import CryptoError
 from ..size import Size
 
+import logging
+log = logging.getLogger("blivet")
+
 LUKS_METADATA_SIZE = Size("2 MiB")
 
 # Keep the character set size a power of two to make sure all characters are
@@ -52,13 +59,102 @@ yesDialog = lambda q: True
 logFunc = lambda p, t: None
 passwordDialog = lambda t: None
 
+LUKS_MAGIC = b"LUKS\xba\xbe"
+LUKS1_KEY_ENABLED = 0x00AC71F3
+LUKS1_KEY_SLOTS = 8
+LUKS1_SECTOR_SIZE = 512
+LUKS2_HEADER_SIZE = 4096
+LUKS2_MAX_METADATA_SIZE = 4 * 1024 * 1024
+
+class LUKSHeader(namedtuple("LUKSHeader", ["version", "uuid", "cipher",
+                                           "key_size", "key_slots",
+                                           "payload_offset"])):
+    """ The fields of a LUKS header.
+
+        cipher is in the form used by :func:`luks_format`, like
+        "aes-xts-plain64", key_size is in bits, key_slots lists the numbers
+        of the slots in use and payload_offset is in bytes.
+    """
+    __slots__ = ()
+
+def _luks1_header(hdr):
+    (cipher_name, cipher_mode) = struct.unpack_from(">32s32s", hdr, 8)
+    (payload_offset, key_bytes) = struct.unpack_from(">II", hdr, 104)
+    (uuid,) = struct.unpack_from(">40s", hdr, 168)
+
+    slots = []
+    for slot in range(LUKS1_KEY_SLOTS):
+        (active,) = struct.unpack_from(">I", hdr, 208 + slot * 48)
+        if active == LUKS1_KEY_ENABLED:
+            slots.append(slot)
+
+    cipher = "%s-%s" % (cipher_name.rstrip(b"\0"), cipher_mode.rstrip(b"\0"))
+    return LUKSHeader(version=1, uuid=uuid.rstrip(b"\0"), cipher=cipher,
+                      key_size=key_bytes * 8, key_slots=slots,
+                      payload_offset=payload_offset * LUKS1_SECTOR_SIZE)
+
+def _luks2_header(f, hdr):
+    (hdr_size,) = struct.unpack_from(">Q", hdr, 8)
+    (uuid,) = struct.unpack_from(">40s", hdr, 168)
+    if not LUKS2_HEADER_SIZE < hdr_size <= LUKS2_MAX_METADATA_SIZE:
+        raise ValueError("bad header size %d" % hdr_size)
+
+    f.seek(LUKS2_HEADER_SIZE)
+    metadata = json.loads(f.read(hdr_size - LUKS2_HEADER_SIZE).rstrip(b"\0"))
+
+    slots = sorted(int(slot) for slot in metadata["keyslots"])
+    key_size = None
+    if slots:
+        key_size = metadata["keyslots"][str(slots[0])]["key_size"] * 8
+
+    segment = metadata["segments"][min(metadata["segments"], key=int)]
+    return LUKSHeader(version=2, uuid=uuid.rstrip(b"\0"),
+                      cipher=str(segment["encryption"]), key_size=key_size,
+                      key_slots=slots, payload_offset=int(segment["offset"]))
+
+def luks_header(device):
+    """ Read the LUKS header on device without going through libcryptsetup.
+
+        :param str device: path to the device node
+        :returns: the header, or None if device is not a LUKS device
+        :rtype: :class:`LUKSHeader` or NoneType
+        :raises: IOError if the device can not be read
+    """
+    with open(device, "rb") as f:
+        hdr = f.read(LUKS2_HEADER_SIZE)
+        if len(hdr) < LUKS2_HEADER_SIZE or hdr[:6] != LUKS_MAGIC:
+            return None
+
+        (version,) = struct.unpack_from(">H", hdr, 6)
+        try:
+            if version == 1:
+                return _luks1_header(hdr)
+            elif version == 2:
+                return _luks2_header(f, hdr)
+        except (ValueError, KeyError, TypeError, struct.error) as e:
+            log.debug("failed to parse LUKS%d header on %s: %s", version,
+                      device, e)
+
+    return None
+
 def is_luks(device):
-    cs = CryptSetup(device=device, yesDialog=yesDialog, logFunc=logFunc, passwordDialog=passwordDialog)
-    return cs.isLuks()
+    """ Return 0 if device is a LUKS device and -EINVAL if it is not.
+
+        This keeps the return value of libcryptsetup's isLuks; use
+        :func:`luks_header` to get a true value for LUKS devices.
+    """
+    try:
+        header = luks_header(device)
+    except IOError as e:
+        raise IOError(e.errno, "Device cannot be opened: %s" % e.strerror)
+
+    return 0 if header is not None else -errno.EINVAL
 
 def luks_uuid(device):
-    cs = CryptSetup(device=device, yesDialog=yesDialog, logFunc=logFunc, passwordDialog=passwordDialog)
-    return cs.luksUUID()
+    header = luks_header(device)
+    if header is None:
+        return None
+    return header.uuid
 
 def luks_status(name):
     """True means active, False means inactive (or non-existent)"""
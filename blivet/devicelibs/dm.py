@@ -45,10 +45,10 @@ def dm_remove(map_name):
 
 def name_from_dm_node(dm_node):
     # first, try sysfs
-    name_file = "/sys/class/block/%s/dm/name" % dm_node
-    try:
-        name = open(name_file).read().strip()
-    except IOError:
+    name = util.read_file("/sys/class/block/%s/dm/name" % dm_node)
+    if name is not None:
+        name = name.strip()
+    else:
         # next, try pyblock
         name = block.getNameFromDmNode(dm_node)
 
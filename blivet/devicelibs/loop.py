@@ -44,12 +44,8 @@ def losetup(args, capture=False):
     return ret
 
 def get_backing_file(name):
-    path = ""
-    sys_path  = "/sys/class/block/%s/loop/backing_file" % name
-    if os.access(sys_path, os.R_OK):
-        path = open(sys_path).read().strip()
-
-    return path
+    path = util.read_file("/sys/class/block/%s/loop/backing_file" % name)
+    return path.strip() if path is not None else ""
 
 def get_loop_name(path):
     args = ["-j", path]
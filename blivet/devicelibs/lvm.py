@@ -20,7 +20,13 @@
 # Author(s): Dave Lehman <dlehman@redhat.com>
 #
 
+import fcntl
 import math
+import os
+import select
+import subprocess
+import threading
+import time
 from decimal import Decimal
 
 import logging
@@ -29,7 +35,10 @@ log = logging.getLogger("blivet")
 from ..size import Size
 from .. import util
 from .. import arch
-from ..errors import LVMError
+from ..backend import get_backend
+from ..instrumentation import recorder
+from ..errors import LVMError, LVMShellError
+from ..flags import flags
 from ..i18n import _
 
 MAX_LV_SLOTS = 256
@@ -203,8 +212,296 @@ def is_valid_thin_pool_chunk_size(size, discard=False):
     else:
         return (size % LVM_THINP_MIN_CHUNK_SIZE == 0)
 
+def _closeInheritedFDs(keep):
+    """ Close the file descriptors a child process would inherit, but keep.
+
+        This runs in the child, between fork and exec. Descriptors above
+        stderr that are not close-on-exec are closed, except keep.
+    """
+    for name in os.listdir("/proc/self/fd"):
+        fd = int(name)
+        if fd <= 2 or fd == keep:
+            continue
+
+        try:
+            if not fcntl.fcntl(fd, fcntl.F_GETFD) & fcntl.FD_CLOEXEC:
+                os.close(fd)
+        except EnvironmentError:
+            # the descriptor listdir read the directory with
+            pass
+
+class LVMShell(object):
+    """ An lvm shell process that runs one lvm command after another.
+
+        Starting lvm, reading its configuration and setting up its tool
+        context costs more than many of the commands blivet runs, so running
+        them all in one ``lvm`` shell saves that for each command. Commands
+        are written to the shell's stdin, and their output is read up to the
+        next prompt. Each command's exit status is taken from lvm's command
+        log, which the shell writes to the file descriptor in LVM_REPORT_FD.
+
+        Commands are run one at a time; callers in different threads wait
+        for each other.
+    """
+    prompt = "lvm> "
+
+    # the log settings added to each command's --config, so that its status
+    # is reported as the last line written to LVM_REPORT_FD
+    _logConfig = (' log { report_command_log=1 command_log_cols="log_ret_code" '
+                  'command_log_selection="log_type=status" } ')
+
+    # how long to wait for the shell's first prompt, in seconds
+    startTimeout = 10
+
+    # lvm's return code for a command that succeeded
+    _ECMD_PROCESSED = 1
+
+    def __init__(self):
+        self._proc = None
+        self._reportFD = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self):
+        """ Start the shell.
+
+            :raises: :class:`~.errors.LVMShellError` if this lvm has no
+                     shell or does not report command status
+        """
+        (read_fd, write_fd) = os.pipe()
+        env = os.environ.copy()
+        env.update({"LC_ALL": "C",
+                    "LVM_REPORT_FD": str(write_fd)})
+        try:
+            # the write end of the pipe has to stay open in the child, but
+            # nothing else the process has open should leak into the shell,
+            # which runs for the whole session
+            self._proc = subprocess.Popen(["lvm"],
+                                          stdin=subprocess.PIPE,
+                                          stdout=subprocess.PIPE,
+                                          stderr=subprocess.STDOUT,
+                                          close_fds=False, env=env,
+                                          preexec_fn=lambda: _closeInheritedFDs(write_fd))
+        except OSError as e:
+            os.close(read_fd)
+            raise LVMShellError("failed to start lvm shell: %s" % e.strerror)
+        finally:
+            os.close(write_fd)
+
+        self._reportFD = read_fd
+        try:
+            self._readResponse(timeout=self.startTimeout)
+            (rc, _out) = self.run(["version"])
+        except LVMError as e:
+            self.stop()
+            raise LVMShellError("lvm shell is not usable: %s" % e)
+
+        if rc:
+            self.stop()
+            raise LVMShellError("lvm shell failed to run 'version'")
+
+    def stop(self):
+        """ Stop the shell. """
+        if self._proc is None:
+            return
+
+        try:
+            self._proc.stdin.close()
+            self._proc.wait()
+        except (IOError, OSError):
+            pass
+
+        os.close(self._reportFD)
+        self._proc = None
+        self._reportFD = None
+
+    @staticmethod
+    def _quote(arg):
+        """ Quote an argument the way lvm's shell splits its input. """
+        if arg and not any(c.isspace() or c in "\"'#" for c in arg):
+            return arg
+        elif "'" not in arg:
+            return "'%s'" % arg
+        elif '"' not in arg:
+            return '"%s"' % arg
+
+        raise LVMShellError("cannot quote %r for the lvm shell" % arg)
+
+    def _command(self, args):
+        """ Return the line that runs lvm with args in the shell. """
+        args = list(args)
+        if "--config" in args:
+            idx = args.index("--config") + 1
+            args[idx] += self._logConfig
+        else:
+            args[1:1] = ["--config", self._logConfig]
+
+        return " ".join(self._quote(arg) for arg in args) + "\n"
+
+    def _readResponse(self, timeout=None):
+        """ Read the output of a command, up to the shell's next prompt.
+
+            :returns: the output and what was written to LVM_REPORT_FD
+            :rtype: tuple of str
+        """
+        out = ""
+        report = ""
+        stdout = self._proc.stdout.fileno()
+        fds = [stdout, self._reportFD]
+        deadline = time.time() + timeout if timeout else None
+        while not out.endswith(self.prompt):
+            wait = max(deadline - time.time(), 0) if deadline else None
+            (readable, _w, _x) = select.select(fds, [], [], wait)
+            if not readable:
+                raise LVMShellError("timed out waiting for the lvm shell")
+
+            for fd in readable:
+                data = os.read(fd, 65536)
+                if fd == stdout:
+                    if not data:
+                        raise LVMShellError("lvm shell exited")
+                    out += data
+                else:
+                    report += data
+
+        # lvm writes its report before the prompt, but it may still be
+        # waiting in the pipe
+        while select.select([self._reportFD], [], [], 0)[0]:
+            data = os.read(self._reportFD, 65536)
+            if not data:
+                break
+            report += data
+
+        return (out[:-len(self.prompt)], report)
+
+    def run(self, args):
+        """ Run an lvm command in the shell.
+
+            :param list args: the command and its arguments, without "lvm"
+            :returns: the exit status and output, like
+                      :func:`~.util.run_program_and_capture_output`
+            :rtype: tuple of (int, str)
+            :raises: :class:`~.errors.LVMShellError` if the command could not
+                     be sent to the shell
+            :raises: :class:`~.errors.LVMError` if the command was sent but
+                     its status could not be read
+        """
+        if not self.running:
+            raise LVMShellError("lvm shell is not running")
+
+        cmd = self._command(args)
+        with self._lock:
+            try:
+                self._proc.stdin.write(cmd)
+                self._proc.stdin.flush()
+            except IOError as e:
+                raise LVMShellError("failed to write to lvm shell: %s" % e)
+
+            try:
+                (out, report) = self._readResponse()
+            except LVMShellError as e:
+                # the command may have run, so it cannot be retried
+                raise LVMError("lost lvm shell running %s: %s" % (args[0], e))
+
+        # some builds of readline echo the input
+        if out.startswith(cmd):
+            out = out[len(cmd):]
+
+        try:
+            status = int(report.split()[-1])
+        except (IndexError, ValueError):
+            raise LVMError("lvm shell reported no status for %s" % args[0])
+
+        rc = 0 if status == self._ECMD_PROCESSED else status
+        with util.program_log_lock:
+            util.program_log.info("Running in lvm shell... lvm %s",
+                                  " ".join(args))
+            for line in out.splitlines():
+                util.program_log.info("%s", line)
+
+            util.program_log.debug("Return code: %d", rc)
+
+        return (rc, out)
+
+_shell = None
+_shell_lock = threading.Lock()
+
+def _get_shell():
+    """ Return the running lvm shell, starting it the first time.
+
+        Returns None if :attr:`~.flags.Flags.lvm_shell` is not set, or if the
+        shell could not be started, in which case it is not tried again.
+    """
+    global _shell
+    if not flags.lvm_shell:
+        return None
+
+    with _shell_lock:
+        if _shell is None:
+            _shell = LVMShell()
+            try:
+                _shell.start()
+            except LVMShellError as e:
+                log.warning("not using an lvm shell: %s", e)
+
+        return _shell if _shell.running else None
+
+def stop_shell():
+    """ Stop the lvm shell, if one is running.
+
+        The next lvm command starts a new one if
+        :attr:`~.flags.Flags.lvm_shell` is still set.
+    """
+    global _shell
+    with _shell_lock:
+        if _shell is not None:
+            _shell.stop()
+            _shell = None
+
+class _NoShellError(LVMShellError):
+    """ There is no lvm shell to run a command in. """
+
+def _run_in_shell(args):
+    shell = _get_shell()
+    if shell is None:
+        raise _NoShellError("no lvm shell")
+
+    return shell.run(args)
+
+def _run(args):
+    """ Run lvm with args, in the lvm shell if there is one.
+
+        :returns: the exit status and the output
+        :rtype: tuple of (int, str)
+
+        Commands run in the shell go through the system backend and are
+        counted by the recorder like any other program, with the same key,
+        so a recording made with or without the shell replays either way.
+    """
+    argv = ["lvm"] + args
+    if flags.lvm_shell:
+        start = time.time()
+        try:
+            (rc, out) = get_backend().query("run", " ".join(argv),
+                                            _run_in_shell, args)
+        except _NoShellError:
+            pass
+        except LVMShellError as e:
+            log.warning("lvm shell failed, running lvm directly: %s", e)
+        except EnvironmentError:
+            recorder.command(argv, time.time() - start, None)
+            raise
+        else:
+            recorder.command(argv, time.time() - start, rc)
+            return (rc, out)
+
+    return util.run_program_and_capture_output(argv)
+
 def lvm(args):
-    ret = util.run_program(["lvm"] + args)
+    ret = _run(args)[0]
     if ret:
         raise LVMError("running lvm " + " ".join(args) + " failed")
 
@@ -309,7 +606,7 @@ def pvinfo(device=None):
     if device:
         args.append(device)
 
-    buf = util.capture_output(["lvm"] + args)
+    buf = _run(args)[1]
     pvs = {}
     for line in buf.splitlines():
         info = parse_lvm_vars(line)
@@ -414,7 +711,7 @@ def vginfo(vg_name):
             "-o", "uuid,size,free,extent_size,extent_count,free_count,pv_count"] + \
             _getConfigArgs(read_only_locking=True) + [vg_name]
 
-    buf = util.capture_output(["lvm"] + args)
+    buf = _run(args)[1]
     info = parse_lvm_vars(buf)
     if len(info.keys()) != 7:
         raise LVMError(_("vginfo failed for %s") % vg_name)
@@ -433,16 +730,16 @@ def lvs(vg_name=None):
     args = ["lvs",
             "-a", "--unit", "k", "--nosuffix", "--nameprefixes",
             "--unquoted", "--noheadings",
-            "-ovg_name,lv_name,lv_uuid,lv_size,lv_attr,segtype"] + \
+            "-ovg_name,lv_name,lv_uuid,lv_size,lv_attr,segtype,origin,pool_lv"] + \
             _getConfigArgs(read_only_locking=True)
     if vg_name:
         args.append(vg_name)
 
-    buf = util.capture_output(["lvm"] + args)
+    buf = _run(args)[1]
     logvols = {}
     for line in buf.splitlines():
         info = parse_lvm_vars(line)
-        if len(info.keys()) != 6:
+        if len(info.keys()) != 8:
             log.debug("ignoring lvs output line: %s", line)
             continue
 
@@ -451,12 +748,63 @@ def lvs(vg_name=None):
 
     return logvols
 
+class LVMReport(object):
+    """ A snapshot of lvm's reports on all PVs, VGs and LVs.
+
+        The snapshot is built from the output of :func:`pvinfo` and
+        :func:`lvs`, which between them include everything blivet asks lvm
+        about while populating. The LVs are grouped by VG once, so looking up
+        a VG's LVs, or an LV's origin or pool, does not run lvm again. The VG
+        properties are in each of its PVs' entries in :attr:`pvInfo`.
+    """
+    def __init__(self, pv_info=None, lv_info=None):
+        """
+            :keyword dict pv_info: the output of :func:`pvinfo`
+            :keyword dict lv_info: the output of :func:`lvs`
+
+            lvm is run for whichever of the two is not given.
+        """
+        if pv_info is None:
+            pv_info = pvinfo()
+        if lv_info is None:
+            lv_info = lvs()
+
+        self.pvInfo = pv_info
+        self.lvInfo = lv_info
+
+        self._vgLVs = {}
+        for (name, info) in lv_info.items():
+            self._vgLVs.setdefault(info["LVM2_VG_NAME"], {})[name] = info
+
+    def vgLVs(self, vg_name):
+        """ Return the LVs in a VG.
+
+            :param str vg_name: the name of the VG
+            :returns: a dict like the one :func:`lvs` returns for the VG
+            :rtype: dict
+        """
+        return dict(self._vgLVs.get(vg_name, {}))
+
+    def _lvField(self, vg_name, lv_name, field):
+        try:
+            return self.lvInfo["%s-%s" % (vg_name, lv_name)][field]
+        except KeyError:
+            return ''
+
+    def lvorigin(self, vg_name, lv_name):
+        """ Return the name of a snapshot's origin, like :func:`lvorigin`. """
+        return self._lvField(vg_name, lv_name, "LVM2_ORIGIN")
+
+    def thinlvpoolname(self, vg_name, lv_name):
+        """ Return the name of a thin LV's pool, like :func:`thinlvpoolname`. """
+        return self._lvField(vg_name, lv_name, "LVM2_POOL_LV")
+
 def lvorigin(vg_name, lv_name):
     args = ["lvs", "--noheadings", "-o", "origin"] + \
             _getConfigArgs(read_only_locking=True) + \
             ["%s/%s" % (vg_name, lv_name)]
 
-    buf = util.capture_output(["lvm"] + args)
+    buf = _run(args)[1]
 
     try:
         origin = buf.splitlines()[0].strip()
@@ -557,7 +905,7 @@ def thinlvpoolname(vg_name, lv_name):
             _getConfigArgs(read_only_locking=True) + \
             ["%s/%s" % (vg_name, lv_name)]
 
-    buf = util.capture_output(["lvm"] + args)
+    buf = _run(args)[1]
 
     try:
         pool = buf.splitlines()[0].strip()
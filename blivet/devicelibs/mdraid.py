@@ -33,6 +33,8 @@ log = logging.getLogger("blivet")
 # these defaults were determined empirically
 MD_SUPERBLOCK_SIZE = Size("2 MiB")
 MD_CHUNK_SIZE = Size("512 KiB")
+MD_MIN_HEADROOM = Size("1 MiB")
+MD_MAX_HEADROOM = Size("128 MiB")
 
 class MDRaidLevels(raid.RAIDLevels):
     @classmethod
@@ -96,8 +98,8 @@ def get_raid_superblock_size(size, version=None):
         # MDADM: operations, but limit this to 128Meg (0.1% of 10Gig)
         # MDADM: which is plenty for efficient reshapes
         # NOTE: In the mdadm code this is in 512b sectors. Converted to use MiB
-        headroom = int(Size("128 MiB"))
-        while headroom << 10 > size and headroom > Size("1 MiB"):
+        headroom = int(MD_MAX_HEADROOM)
+        while headroom << 10 > size and headroom > MD_MIN_HEADROOM:
             headroom >>= 1
 
         headroom = Size(headroom)
@@ -254,6 +256,64 @@ def mdexamine(device):
 
     return info
 
+# the fields of "mdadm --examine --brief --verbose" that mdexamine reports,
+# and the names "mdadm --examine --export" gives them
+_BRIEF_FIELDS = {"level": "MD_LEVEL",
+                 "num-devices": "MD_DEVICES",
+                 "UUID": "MD_UUID",
+                 "metadata": "MD_METADATA",
+                 "name": "MD_NAME"}
+
+def mdexamine_devices(devices):
+    """ Return information about the md superblocks on several devices.
+
+        :param devices: paths to the device nodes to examine
+        :type devices: list of str
+        :returns: a dict with device path keys and values like the ones
+                  :func:`mdexamine` returns
+        :rtype: dict
+
+        All of the devices are examined by a single mdadm process. Only
+        members of arrays with native (0.90 or 1.x) metadata are included;
+        examine other devices, like members of firmware raid containers, with
+        :func:`mdexamine`.
+    """
+    if not devices:
+        return {}
+
+    buf = util.capture_output(["mdadm", "--examine", "--brief", "--verbose"] +
+                              list(devices))
+
+    members = {}
+    info = None
+    native = False
+    prev = None
+    for var in buf.split():
+        if var == "ARRAY":
+            info = {}
+            native = False
+        elif info is None:
+            pass
+        elif prev == "ARRAY" and var.startswith("/dev/md"):
+            info["DEVICE"] = var
+        else:
+            (name, equals, value) = var.partition("=")
+            if not equals:
+                pass
+            elif name in _BRIEF_FIELDS:
+                info[_BRIEF_FIELDS[name]] = value.strip('"')
+                # external metadata is reported without a level
+                native = native or name == "level"
+            elif name in ("container", "member"):
+                info = None
+            elif name == "devices" and native:
+                for device in value.split(","):
+                    members[device] = dict(info)
+
+        prev = var
+
+    return members
+
 def md_node_from_name(name):
     named_path = "/dev/md/" + name
     try:
@@ -0,0 +1,254 @@
+#
+# superblock.py
+# Read filesystem superblocks without running external programs.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+from collections import namedtuple
+import os
+import struct
+import uuid
+
+import logging
+log = logging.getLogger("blivet")
+
+class Superblock(namedtuple("Superblock", ["block_size", "block_count",
+                                             "free_blocks", "uuid", "label",
+                                             "dirty", "errors"])):
+    """ The fields of a filesystem's superblock.
+
+        block_count and free_blocks are in units of block_size bytes. Fields
+        the filesystem does not record are None.
+    """
+    __slots__ = ()
+
+# ext2 s_state flags
+EXT2_VALID_FS = 0x1
+EXT2_ERROR_FS = 0x2
+EXT4_FEATURE_INCOMPAT_64BIT = 0x80
+
+# fat directory entry attributes
+FAT_ATTR_VOLUME_ID = 0x08
+FAT_ATTR_DIR = 0x10
+FAT_ATTR_LONG_NAME = 0x0F
+
+# the label fat uses for a filesystem without one
+FAT_NO_LABEL = b"NO NAME"
+
+# the most clusters of a FAT32 root directory searched for its label
+FAT32_MAX_ROOT_CLUSTERS = 256
+
+def _read(fd, offset, length):
+    os.lseek(fd, offset, os.SEEK_SET)
+    buf = os.read(fd, length)
+    if len(buf) != length:
+        raise ValueError("short read at offset %d" % offset)
+    return buf
+
+def _cstr(buf):
+    return buf.split(b"\0", 1)[0]
+
+def _uuid(buf):
+    return str(uuid.UUID(bytes=buf))
+
+def _read_ext2(fd):
+    sb = _read(fd, 1024, 1024)
+    (magic, state) = struct.unpack_from("<HH", sb, 0x38)
+    if magic != 0xEF53:
+        raise ValueError("bad ext2 magic")
+
+    (count, _r_count, free, _free_inodes, _first, log_size) = \
+        struct.unpack_from("<6I", sb, 0x4)
+    (incompat,) = struct.unpack_from("<I", sb, 0x60)
+    if incompat & EXT4_FEATURE_INCOMPAT_64BIT:
+        (count_hi, _r_count_hi, free_hi) = struct.unpack_from("<3I", sb, 0x150)
+        count |= count_hi << 32
+        free |= free_hi << 32
+
+    return Superblock(block_size=1024 << log_size, block_count=count,
+                      free_blocks=free, uuid=_uuid(sb[0x68:0x78]),
+                      label=_cstr(sb[0x78:0x88]),
+                      dirty=not state & EXT2_VALID_FS,
+                      errors=bool(state & EXT2_ERROR_FS))
+
+def _read_xfs(fd):
+    sb = _read(fd, 0, 152)
+    if sb[:4] != b"XFSB":
+        raise ValueError("bad xfs magic")
+
+    (block_size, count) = struct.unpack_from(">IQ", sb, 4)
+    (free,) = struct.unpack_from(">Q", sb, 144)
+    return Superblock(block_size=block_size, block_count=count,
+                      free_blocks=free, uuid=_uuid(sb[32:48]),
+                      label=_cstr(sb[108:120]), dirty=None, errors=None)
+
+def _read_btrfs(fd):
+    sb = _read(fd, 0x10000, 0x22b)
+    if sb[0x40:0x48] != b"_BHRfS_M":
+        raise ValueError("bad btrfs magic")
+
+    (total, used, _root_dir, num_devices, sector_size) = \
+        struct.unpack_from("<4QI", sb, 0x70)
+
+    # the totals are for the whole volume, not for this member
+    count = free = None
+    if num_devices == 1:
+        count = total // sector_size
+        free = (total - used) // sector_size
+
+    return Superblock(block_size=sector_size, block_count=count,
+                      free_blocks=free, uuid=_uuid(sb[0x20:0x30]),
+                      label=_cstr(sb[0x12b:0x22b]), dirty=None, errors=None)
+
+def _fat_dir_label(buf):
+    """ Look for the volume label entry in the fat directory entries in buf.
+
+        :returns: the label, or None if there is none, and whether the end of
+                  the directory was found
+        :rtype: tuple of (str or NoneType, bool)
+    """
+    for offset in range(0, len(buf) - 31, 32):
+        entry = buf[offset:offset + 32]
+        if entry[0] == b"\0":
+            return (None, True)
+        elif entry[0] == b"\xe5":
+            # deleted
+            continue
+
+        attr = ord(entry[11])
+        if attr & 0x3F == FAT_ATTR_LONG_NAME:
+            continue
+
+        if attr & (FAT_ATTR_VOLUME_ID | FAT_ATTR_DIR) == FAT_ATTR_VOLUME_ID:
+            name = entry[:11]
+            if name[0] == b"\x05":
+                name = b"\xe5" + name[1:]
+            return (name.rstrip(b" \0"), True)
+
+    return (None, False)
+
+def _read_fat_root_label(fd, sector_size, cluster_sectors, reserved, fats,
+                         fat_size, root_entries, bs):
+    """ Return the label in the root directory of a fat filesystem.
+
+        :returns: the label, or None if the root directory has no label entry
+        :rtype: str or NoneType
+    """
+    if root_entries:
+        # FAT12 and FAT16 have a fixed size root directory after the FATs
+        start = (reserved + fats * fat_size) * sector_size
+        return _fat_dir_label(_read(fd, start, root_entries * 32))[0]
+
+    # FAT32 keeps the root directory in a chain of clusters
+    (fat_size, _flags, _version, cluster) = struct.unpack_from("<IHHI", bs, 36)
+    data_start = (reserved + fats * fat_size) * sector_size
+    cluster_size = cluster_sectors * sector_size
+    for _i in range(FAT32_MAX_ROOT_CLUSTERS):
+        if not 2 <= cluster < 0x0FFFFFF8:
+            break
+
+        buf = _read(fd, data_start + (cluster - 2) * cluster_size, cluster_size)
+        (label, end) = _fat_dir_label(buf)
+        if end:
+            return label
+
+        (cluster,) = struct.unpack("<I", _read(fd, reserved * sector_size + cluster * 4, 4))
+        cluster &= 0x0FFFFFFF
+
+    return None
+
+def _read_vfat(fd):
+    bs = _read(fd, 0, 512)
+    if bs[510:512] != b"\x55\xaa":
+        raise ValueError("bad boot sector signature")
+
+    (sector_size, cluster_sectors, reserved, fats, root_entries,
+     sectors) = struct.unpack_from("<HBHBHH", bs, 11)
+    (fat_size,) = struct.unpack_from("<H", bs, 22)
+    if not sectors:
+        (sectors,) = struct.unpack_from("<I", bs, 32)
+    if not sector_size or not cluster_sectors or not fats:
+        raise ValueError("bad fat geometry")
+
+    free = None
+    if not fat_size and not root_entries:
+        # FAT32, which keeps the free cluster count in the FSInfo sector
+        (serial,) = struct.unpack_from("<I", bs, 67)
+        label = bs[71:82]
+        (fsinfo_sector,) = struct.unpack_from("<H", bs, 48)
+        fsinfo = _read(fd, fsinfo_sector * sector_size, 512)
+        (free_clusters,) = struct.unpack_from("<I", fsinfo, 488)
+        if fsinfo[:4] == b"RRaA" and free_clusters != 0xFFFFFFFF:
+            free = free_clusters * cluster_sectors
+    else:
+        (serial,) = struct.unpack_from("<I", bs, 39)
+        label = bs[43:54]
+
+    # many tools only change the label entry in the root directory, so the
+    # one in the boot sector is only used if the root directory has none,
+    # like blkid does
+    label = label.rstrip(b" \0")
+    try:
+        root_label = _read_fat_root_label(fd, sector_size, cluster_sectors,
+                                          reserved, fats, fat_size,
+                                          root_entries, bs)
+    except (ValueError, struct.error) as e:
+        log.debug("failed to read fat root directory: %s", e)
+        root_label = None
+
+    if root_label and root_label != FAT_NO_LABEL:
+        label = root_label
+    elif label == FAT_NO_LABEL:
+        label = b""
+
+    return Superblock(block_size=sector_size, block_count=sectors,
+                      free_blocks=free,
+                      uuid="%04X-%04X" % (serial >> 16, serial & 0xFFFF),
+                      label=label, dirty=None, errors=None)
+
+_readers = {"ext2": _read_ext2,
+            "xfs": _read_xfs,
+            "btrfs": _read_btrfs,
+            "vfat": _read_vfat}
+
+def read_superblock(device, fstype):
+    """ Read the superblock of the filesystem on device.
+
+        :param str device: path to the device node or image file
+        :param str fstype: the superblock format: "ext2" (also for ext3 and
+                           ext4), "xfs", "btrfs" or "vfat"
+        :returns: the superblock's fields, or None if it could not be read
+        :rtype: :class:`Superblock` or NoneType
+    """
+    reader = _readers.get(fstype)
+    if reader is None:
+        return None
+
+    try:
+        fd = os.open(device, os.O_RDONLY)
+    except OSError as e:
+        log.debug("failed to open %s to read its superblock: %s", device, e)
+        return None
+
+    try:
+        return reader(fd)
+    except (OSError, ValueError, struct.error) as e:
+        log.debug("failed to read %s superblock on %s: %s", fstype, device, e)
+        return None
+    finally:
+        os.close(fd)
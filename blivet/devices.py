@@ -45,6 +45,8 @@ from . import arch
 from .flags import flags
 from .storage_log import log_method_call
 from . import udev
+from . import deviceindex
+from . import snapshot
 from .formats import get_device_format_class, getFormat, DeviceFormat
 from .size import Size
 from .i18n import P_
@@ -52,6 +54,9 @@ from .i18n import P_
 import logging
 log = logging.getLogger("blivet")
 
+# how much of a partition's start to zero out when removing it
+PARTITION_WIPE_SIZE = Size("1 MiB")
+
 def get_device_majors():
     majors = {}
     for line in open("/proc/devices").readlines():
@@ -132,6 +137,9 @@ class ParentList(object):
             x in ml
             x = ml[i]   # not ml[i] = x
     """
+    generation = 0
+    """ incremented after any :class:`~.ParentList` instance changes """
+
     def __init__(self, items=None, appendfunc=None, removefunc=None):
         """
             :keyword items: initial contents
@@ -179,6 +187,7 @@ class ParentList(object):
 
         self.appendfunc(y)
         self.items.append(y)
+        ParentList.generation += 1
 
     def remove(self, y):
         """ Remove an item from the list after running a callback. """
@@ -187,6 +196,7 @@ class ParentList(object):
 
         self.removefunc(y)
         self.items.remove(y)
+        ParentList.generation += 1
 
 class Device(util.ObjectID):
     """ A generic device.
@@ -226,6 +236,16 @@ class Device(util.ObjectID):
     _packages = []
     _services = []
 
+    # attributes that determine the keys the device tree indexes us under
+    _indexedAttrs = frozenset(("_name", "sysfsPath", "uuid", "_format"))
+
+    # attributes that can change whether the device is complete
+    _stateAttrs = frozenset(("exists", "_complete", "hasDuplicate",
+                             "_memberDevices"))
+
+    # memoized values, which snapshots need not save
+    _snapshotIgnoredAttrs = frozenset(("_ancestorMemo",))
+
     def __init__(self, name, parents=None):
         """
             :param name: the device name (generally a device node's basename)
@@ -236,6 +256,7 @@ class Device(util.ObjectID):
         util.ObjectID.__init__(self)
         self.kids = 0
         self._name = name
+        self._ancestorMemo = None   # (ParentList.generation, ancestors)
         self.parents = []
         if parents and not isinstance(parents, list):
             raise ValueError("parents must be a list of Device instances")
@@ -263,6 +284,15 @@ class Device(util.ObjectID):
 
         return new
 
+    def __setattr__(self, name, value):
+        if name not in self._snapshotIgnoredAttrs:
+            snapshot.willChange(self)
+        super(Device, self).__setattr__(name, value)
+        if name in self._indexedAttrs:
+            deviceindex.keysChanged(self)
+        elif name in self._stateAttrs:
+            deviceindex.stateChanged(self)
+
     def __repr__(self):
         s = ("%(type)s instance (%(id)s) --\n"
              "  name = %(name)s  status = %(status)s"
@@ -283,14 +313,18 @@ class Device(util.ObjectID):
 
             See :attr:`~.ParentList.appendfunc`.
         """
+        snapshot.willChange(self)
         parent.addChild()
+        deviceindex.parentsChanged(self)
 
     def _removeParent(self, parent):
         """ Called before removing a parent from this device.
 
             See :attr:`~.ParentList.removefunc`.
         """
+        snapshot.willChange(self)
         parent.removeChild()
+        deviceindex.parentsChanged(self)
 
     def _initParentList(self):
         """ Initialize this instance's parent list. """
@@ -378,15 +412,48 @@ class Device(util.ObjectID):
             :rtype: bool
         """
         # XXX does a device depend on itself?
-        if dep in self.parents:
+        ancestors = self._getAncestorSet()
+        if dep in ancestors:
             return True
 
-        for parent in self.parents:
-            if parent.dependsOn(dep):
-                return True
+        return (self._dependsOnOther(dep) or
+                any(a._dependsOnOther(dep) for a in ancestors))
+
+    def _dependsOnOther(self, dep):
+        """ Return True if this device depends on dep other than as a parent.
 
+            :param dep: the other device
+            :type dep: :class:`Device`
+            :rtype: bool
+
+            Subclasses override this for dependencies that are not expressed
+            in the parent list, eg: logical partitions on the extended one.
+        """
+        # pylint: disable=unused-argument
         return False
 
+    def _getAncestorSet(self):
+        """ Return the set of this device's ancestors, not including itself.
+
+            :rtype: frozenset of :class:`Device`
+
+            The set is memoized until the parents of any device change.
+        """
+        # a parent list changing during the walk leaves the memo stale
+        generation = ParentList.generation
+        memo = self._ancestorMemo
+        if memo is not None and memo[0] == generation:
+            return memo[1]
+
+        ancestors = set()
+        for parent in self.parents:
+            ancestors.add(parent)
+            ancestors.update(parent._getAncestorSet())
+
+        ancestors = frozenset(ancestors)
+        self._ancestorMemo = (generation, ancestors)
+        return ancestors
+
     def dracutSetupArgs(self):
         return set()
 
@@ -418,10 +485,7 @@ class Device(util.ObjectID):
     @property
     def ancestors(self):
         """ A list of all of this device's ancestors, including itself. """
-        l = set([self])
-        for p in [d for d in self.parents if d not in l]:
-            l.update(set(p.ancestors))
-        return list(l)
+        return list(self._getAncestorSet() | set([self]))
 
     @property
     def packages(self):
@@ -1419,6 +1483,9 @@ class PartitionDevice(StorageDevice):
         return spec
 
     def _getPartedPartition(self):
+        if self._partedPartition is not None and self.disk is not None:
+            # the caller may change the partition, and with it the disk
+            snapshot.willChange(self.disk.format)
         return self._partedPartition
 
     def _setPartedPartition(self, partition):
@@ -1493,13 +1560,10 @@ class PartitionDevice(StorageDevice):
             self._name = \
                 devicePathToName(self.partedPartition.getDeviceNodeName())
 
-    def dependsOn(self, dep):
-        """ Return True if this device depends on dep. """
-        if isinstance(dep, PartitionDevice) and dep.isExtended and \
-           self.isLogical and self.disk == dep.disk:
-            return True
-
-        return Device.dependsOn(self, dep)
+    def _dependsOnOther(self, dep):
+        """ Logical partitions depend on the extended partition. """
+        return (isinstance(dep, PartitionDevice) and dep.isExtended and
+                self.isLogical and self.disk == dep.disk)
 
     @property
     def isleaf(self):
@@ -1600,7 +1664,7 @@ class PartitionDevice(StorageDevice):
         device = self.partedPartition.geometry.device.path
 
         # Erase 1MiB or to end of partition
-        count = int(Size("1 MiB") / bs)
+        count = int(PARTITION_WIPE_SIZE / bs)
         count = min(count, part_len)
 
         cmd = ["dd", "if=/dev/zero", "of=%s" % device, "bs=%s" % bs,
@@ -1624,10 +1688,14 @@ class PartitionDevice(StorageDevice):
         try:
             self.disk.format.commit()
         except errors.DiskLabelCommitError:
-            part = self.disk.format.partedDisk.getPartitionByPath(self.path)
-            self.disk.format.removePartition(part)
+            self._removeNewPartition()
             raise
 
+    def _removeNewPartition(self):
+        """ Remove the partition from the current disklabel after a failed commit. """
+        part = self.disk.format.partedDisk.getPartitionByPath(self.path)
+        self.disk.format.removePartition(part)
+
     def _postCreate(self):
         if self.isExtended:
             partition = self.disk.format.extendedPartition
@@ -1659,6 +1727,42 @@ class PartitionDevice(StorageDevice):
         else:
             self._postCreate()
 
+    @staticmethod
+    def createMany(partitions):
+        """ Create partitions on a disk with a single disklabel commit.
+
+            :param partitions: the partitions to create, in the order their
+                               create actions would execute
+            :type partitions: list of :class:`PartitionDevice`
+
+            If the commit fails, the partitions are removed from the
+            disklabel again and :class:`~.errors.DiskLabelCommitError` is
+            raised, with none of the partitions created.
+        """
+        disk = partitions[0].disk
+        for partition in partitions:
+            log_method_call(partition, partition.name, status=partition.status)
+            partition._preCreate()
+
+        added = []
+        try:
+            for partition in partitions:
+                disk.format.addPartition(partition.partedPartition)
+                added.append(partition)
+                partition._wipe()
+
+            disk.format.commit()
+        except Exception as e:
+            for partition in reversed(added):
+                partition._removeNewPartition()
+
+            if isinstance(e, errors.DiskLabelCommitError):
+                raise
+            raise errors.DeviceCreateError(str(e), partition.name)
+
+        for partition in partitions:
+            partition._postCreate()
+
     def _computeResize(self, partition):
         log_method_call(self, self.name, status=self.status)
 
@@ -1715,14 +1819,60 @@ class PartitionDevice(StorageDevice):
             self.partedPartition = self.disk.originalFormat.partedDisk.getPartitionByPath(self.path)
             raise
 
-        if self.disk.format.exists and \
-           self.disk.format.partedDisk != self.disk.originalFormat.partedDisk:
+        if self._hasCurrentCopy:
             # If the new/current disklabel is the same as the original one, we
             # have to duplicate the removal on the other copy of the DiskLabel.
             part = self.disk.format.partedDisk.getPartitionByPath(self.path)
             self.disk.format.removePartition(part)
             self.disk.format.commit()
 
+    @property
+    def _hasCurrentCopy(self):
+        """ Is the partition also on a separate copy of the current disklabel? """
+        return (self.disk.format.exists and
+                self.disk.format.partedDisk != self.disk.originalFormat.partedDisk)
+
+    @staticmethod
+    def destroyMany(partitions):
+        """ Destroy partitions on a disk with a single disklabel commit.
+
+            :param partitions: the partitions to destroy, in the order their
+                               destroy actions would execute
+            :type partitions: list of :class:`PartitionDevice`
+
+            If removing the partitions from the original disklabel or
+            committing it fails, the partitions are added back to it and the
+            exception is raised again, with none of the partitions destroyed.
+        """
+        disk = partitions[0].disk
+        for partition in partitions:
+            log_method_call(partition, partition.name, status=partition.status)
+            partition._preDestroy()
+
+        removed = []
+        try:
+            for partition in partitions:
+                disk.originalFormat.removePartition(partition.partedPartition)
+                removed.append(partition)
+
+            disk.originalFormat.commit()
+        except Exception:
+            for partition in reversed(removed):
+                disk.originalFormat.addPartition(partition.partedPartition)
+                partition.partedPartition = disk.originalFormat.partedDisk.getPartitionByPath(partition.path)
+            raise
+
+        try:
+            if partitions[0]._hasCurrentCopy:
+                for partition in partitions:
+                    part = disk.format.partedDisk.getPartitionByPath(partition.path)
+                    disk.format.removePartition(part)
+                disk.format.commit()
+        finally:
+            # the partitions are gone from the disk either way
+            for partition in partitions:
+                partition._postDestroy()
+
     def deactivate(self):
         """
         This is never called. For instructional purposes only.
@@ -2471,6 +2621,7 @@ class LVMVolumeGroupDevice(ContainerDevice):
             raise errors.DeviceError("new lv is too large to fit in free space", self.name)
 
         log.debug("Adding %s/%s to %s", lv.name, lv.size, self.name)
+        snapshot.willChange(self)
         self._lvs.append(lv)
 
     def _removeLogVol(self, lv):
@@ -2478,6 +2629,7 @@ class LVMVolumeGroupDevice(ContainerDevice):
         if lv not in self.lvs:
             raise ValueError("specified lv is not part of this vg")
 
+        snapshot.willChange(self)
         self._lvs.remove(lv)
 
         if self.poolMetaData and not self.thinpools:
@@ -3043,6 +3195,7 @@ class LVMThinPoolDevice(LVMLogicalVolumeDevice):
         # TODO: add some checking to prevent overcommit for preexisting
         self.vg._addLogVol(lv)
         log.debug("Adding %s/%s to %s", lv.name, lv.size, self.name)
+        snapshot.willChange(self)
         self._lvs.append(lv)
 
     def _removeLogVol(self, lv):
@@ -3050,6 +3203,7 @@ class LVMThinPoolDevice(LVMLogicalVolumeDevice):
         if lv not in self._lvs:
             raise ValueError("specified lv is not part of this vg")
 
+        snapshot.willChange(self)
         self._lvs.remove(lv)
         self.vg._removeLogVol(lv)
 
@@ -3440,16 +3594,14 @@ class MDRaidArrayDevice(ContainerDevice):
         if not self.exists:
             return status
 
-        state_file = "/sys/%s/md/array_state" % self.sysfsPath
-        try:
-            state = open(state_file).read().strip()
+        state = util.read_file("/sys/%s/md/array_state" % self.sysfsPath)
+        if state is not None:
+            state = state.strip()
             if state in ("clean", "active", "active-idle", "readonly", "read-auto"):
                 status = True
             # mdcontainers have state inactive when started (clear if stopped)
             if self.type == "mdcontainer" and state == "inactive":
                 status = True
-        except IOError:
-            status = False
 
         return status
 
@@ -3458,11 +3610,10 @@ class MDRaidArrayDevice(ContainerDevice):
             return
 
         member_name = os.path.basename(member.sysfsPath)
-        path = "/sys/%s/md/dev-%s/state" % (self.sysfsPath, member_name)
-        try:
-            state = open(path).read().strip()
-        except IOError:
-            state = None
+        state = util.read_file("/sys/%s/md/dev-%s/state" % (self.sysfsPath,
+                                                             member_name))
+        if state is not None:
+            state = state.strip()
 
         return state
 
@@ -3470,11 +3621,9 @@ class MDRaidArrayDevice(ContainerDevice):
     def degraded(self):
         """ Return True if the array is running in degraded mode. """
         rc = False
-        degraded_file = "/sys/%s/md/degraded" % self.sysfsPath
-        if os.access(degraded_file, os.R_OK):
-            val = open(degraded_file).read().strip()
-            if val == "1":
-                rc = True
+        val = util.read_file("/sys/%s/md/degraded" % self.sysfsPath)
+        if val is not None and val.strip() == "1":
+            rc = True
 
         return rc
 
@@ -4637,6 +4786,7 @@ class BTRFSVolumeDevice(BTRFSDevice, ContainerDevice):
         if vol.name in [v.name for v in self.subvolumes]:
             raise ValueError("subvolume %s already exists" % vol.name)
 
+        snapshot.willChange(self)
         self.subvolumes.append(vol)
 
     def _removeSubVolume(self, name):
@@ -4644,6 +4794,7 @@ class BTRFSVolumeDevice(BTRFSDevice, ContainerDevice):
             raise ValueError("cannot remove non-existent subvolume %s" % name)
 
         names = [v.name for v in self.subvolumes]
+        snapshot.willChange(self)
         self.subvolumes.pop(names.index(name))
 
     def listSubVolumes(self):
@@ -26,10 +26,12 @@ import re
 import shutil
 import pprint
 import copy
+import collections
 
 from .errors import CryptoError, DeviceError, DeviceTreeError, DiskLabelCommitError, DMError, FSError, InvalidDiskLabelError, LUKSError, MDRaidError, StorageError
 from .devices import BTRFSDevice, BTRFSSubVolumeDevice, BTRFSVolumeDevice, DASDDevice, DMDevice, DMLinearDevice, DMRaidArrayDevice, DiskDevice, FcoeDiskDevice, FileDevice, LoopDevice, LUKSDevice, LVMLogicalVolumeDevice, LVMThinLogicalVolumeDevice, LVMThinPoolDevice, LVMVolumeGroupDevice, MDRaidArrayDevice, MultipathDevice, NoDevice, OpticalDevice, PartitionDevice, ZFCPDiskDevice, devicePathToName, iScsiDiskDevice
-from .deviceaction import ActionCreateDevice, ActionDestroyDevice, action_type_from_string, action_object_from_string
+from .deviceaction import DeviceAction, ActionCreateDevice, ActionDestroyDevice, action_type_from_string, action_object_from_string
+from .actionscheduler import ActionScheduler
 from . import formats
 from .formats import getFormat
 from .formats.fs import nodev_filesystems
@@ -43,6 +45,10 @@ from . import udev
 from . import util
 from .platform import platform
 from . import tsort
+from .deviceindex import DeviceIndex
+from .populatecache import PopulateCache
+from .probecache import probe_cache
+from .instrumentation import recorder
 from .flags import flags
 from .storage_log import log_exception_info, log_method_call, log_method_return
 import parted
@@ -94,15 +100,13 @@ class DeviceTree(object):
               iscsi=None, dasd=None):
         """ Reset the instance to its initial state. """
         # internal data members
-        self._devices = []
+        self._index = DeviceIndex()
         self._actions = []
         self._completed_actions = []
 
         # a list of all device names we encounter
         self.names = []
 
-        self._hidden = []
-
         # indicates whether or not the tree has been fully populated
         self.populated = False
 
@@ -126,6 +130,14 @@ class DeviceTree(object):
 
         self.unusedRaidMembers = []
 
+        # saved udev information and probe results, while populating
+        self._populateCache = None
+
+        # mdadm's information about md member devices, by sysfs path, and the
+        # member devices, by device node, that have not been examined yet
+        self._mdExamineInfo = {}
+        self._mdCandidates = {}
+
         # initialize attributes that may later hold cached lvm info
         self.dropLVMCache()
 
@@ -142,6 +154,20 @@ class DeviceTree(object):
 
         self._cleanup = False
 
+    def _getDevices(self):
+        return self._index.devices
+
+    def _setDevices(self, devices):
+        self._index.reset(devices, self._index.hidden)
+
+    _devices = property(_getDevices, _setDevices,
+                        doc="list of all visible devices, complete or not")
+
+    @property
+    def _hidden(self):
+        """ List of hidden devices. """
+        return self._index.hidden
+
     def setDiskImages(self, images):
         """ Set the disk images and reflect them in exclusiveDisks.
 
@@ -162,98 +188,233 @@ class DeviceTree(object):
         self.ignoredDisks.append(disk)
         lvm.lvm_cc_addFilterRejectRegexp(disk)
 
+    def _probe(self, sysfs_path, key, func, *args):
+        """ Return func(*args), from the populate cache if it is in use.
+
+            :param str sysfs_path: the sysfs path of the device func probes,
+                                   or None if it probes the whole system
+            :param str key: the name of the probe in the cache
+        """
+        cache = self._populateCache
+        if cache is None:
+            return func(*args)
+        elif sysfs_path is None:
+            return cache.probeSystem(key, func, *args)
+        else:
+            return cache.probe(sysfs_path, key, func, *args)
+
     @property
     def pvInfo(self):
         if self._pvInfo is None:
-            self._pvInfo = lvm.pvinfo()
+            self._pvInfo = self._probe(None, "pvinfo", lvm.pvinfo)
 
         return self._pvInfo
 
     @property
     def lvInfo(self):
         if self._lvInfo is None:
-            self._lvInfo = lvm.lvs()
+            self._lvInfo = self._probe(None, "lvs", lvm.lvs)
 
         return self._lvInfo
 
+    @property
+    def lvmReport(self):
+        """ lvm's report on PVs, VGs and LVs (:class:`~.devicelibs.lvm.LVMReport`)
+
+            It is taken once, from :attr:`pvInfo` and :attr:`lvInfo`, and
+            kept until :meth:`dropLVMCache` is called.
+        """
+        if self._lvmReport is None:
+            # pylint: disable=attribute-defined-outside-init
+            self._lvmReport = lvm.LVMReport(self.pvInfo, self.lvInfo)
+
+        return self._lvmReport
+
+    def _addMDCandidates(self, devices):
+        """ Note the md member devices among devices, to examine together.
+
+            :param devices: udev information about block devices
+            :type devices: list of dict
+        """
+        for info in devices:
+            devname = info.get("DEVNAME")
+            if devname and udev.udev_device_get_format(info) in \
+                    formats.mdraid.MDRaidMember._udevTypes:
+                self._mdCandidates[devname] = udev.udev_device_get_sysfs_path(info)
+
+    def _mdExamine(self, device):
+        """ Return mdadm's information about an md member device.
+
+            The first call examines every member device found since the last
+            call with a single mdadm process, and later calls use the results.
+            Devices that process did not report on are examined on their own.
+        """
+        if device.sysfsPath not in self._mdExamineInfo and self._mdCandidates:
+            examined = mdraid.mdexamine_devices(sorted(self._mdCandidates))
+            for (path, sysfs_path) in self._mdCandidates.items():
+                if path in examined:
+                    self._mdExamineInfo[sysfs_path] = examined[path]
+
+            self._mdCandidates = {}
+
+        if device.sysfsPath in self._mdExamineInfo:
+            return dict(self._mdExamineInfo[device.sysfsPath])
+
+        return probe_cache.probe(device.path, "mdexamine",
+                                 mdraid.mdexamine, device.path)
+
     def dropLVMCache(self):
         """ Drop cached lvm information. """
         self._pvInfo = None # pylint: disable=attribute-defined-outside-init
         self._lvInfo = None # pylint: disable=attribute-defined-outside-init
+        self._lvmReport = None # pylint: disable=attribute-defined-outside-init
 
     def pruneActions(self):
-        """ Remove redundant/obsolete actions from the action list. """
-        for action in reversed(self._actions[:]):
-            if action not in self._actions:
+        """ Remove redundant/obsolete actions from the action list.
+
+            An action can only obsolete actions on the same device or, if
+            its device is a container, actions adding or removing members of
+            that container, so each action is only compared with those.
+        """
+        position = dict((a, i) for (i, a) in enumerate(self._actions))
+        by_device = {}
+        by_container = {}
+        for action in self._actions:
+            by_device.setdefault(action.device.id, []).append(action)
+            if action.isContainer:
+                by_container.setdefault(action.container.id, []).append(action)
+
+        pruned = set()
+        for action in reversed(self._actions):
+            if action in pruned:
                 log.debug("action %d already pruned", action.id)
                 continue
 
-            for obsolete in self._actions[:]:
+            candidates = (by_device[action.device.id] +
+                          by_container.get(action.device.id, []))
+            for obsolete in sorted(candidates, key=position.get):
+                if obsolete in pruned:
+                    continue
+
                 if action.obsoletes(obsolete):
                     log.info("removing obsolete action %d (%d)",
                              obsolete.id, action.id)
-                    self._actions.remove(obsolete)
+                    pruned.add(obsolete)
 
-                    if obsolete.obsoletes(action) and action in self._actions:
+                    if obsolete.obsoletes(action) and action not in pruned:
                         log.info("removing mutually-obsolete action %d (%d)",
                                  action.id, obsolete.id)
-                        self._actions.remove(action)
+                        pruned.add(action)
+
+        self._actions[:] = [a for a in self._actions if a not in pruned]
 
     def sortActions(self):
         """ Sort actions based on dependencies. """
         if not self._actions:
             return
 
+        actions = self._actions
+
+        # create a graph reflecting the ordering information we have
+        graph = self._getActionGraph(actions)
+
+        # perform a topological sort based on the graph's contents
+        order = tsort.tsort(graph)
+
+        # now replace self._actions with a sorted version of the same list
+        self._actions = [actions[idx] for idx in order]
+
+    def _getActionGraph(self, actions):
+        """ Return a graph of the ordering requirements between actions.
+
+            :param actions: the actions
+            :type actions: list of :class:`~.deviceaction.DeviceAction`
+            :returns: a graph whose items are the indices of the actions
+            :rtype: dict (see :func:`~.tsort.create_graph`)
+
+            Actions are only checked against the actions they share a
+            relation key with (see :meth:`~.deviceaction.DeviceAction.relationKeys`).
+            The ordering by action type that applies to all other pairs of
+            actions is expressed as ranks rather than as edges.
+        """
+        own = {}    # relation key -> indices of actions owning it
+        reach = {}  # relation key -> indices of actions reaching it
+        keys = []
+        for (idx, action) in enumerate(actions):
+            (own_keys, reach_keys) = action.relationKeys()
+            keys.append((own_keys, reach_keys))
+            for key in own_keys:
+                own.setdefault(key, []).append(idx)
+            for key in reach_keys:
+                reach.setdefault(key, []).append(idx)
+
         edges = []
 
         # collect all ordering requirements for the actions
-        for action in self._actions:
-            action_idx = self._actions.index(action)
-            children = []
-            for _action in self._actions:
-                if _action == action:
+        for (action_idx, action) in enumerate(actions):
+            (own_keys, reach_keys) = keys[action_idx]
+            related = set()
+            for key in reach_keys:
+                related.update(own.get(key, []))
+            for key in own_keys:
+                related.update(reach.get(key, []))
+
+            related.discard(action_idx)
+            for child_idx in sorted(related):
+                child = actions[child_idx]
+
+                # ordering by action type is expressed by the ranks below
+                if DeviceAction.requires(child, action):
                     continue
 
                 # create edges based on both action type and dependencies.
-                if _action.requires(action):
-                    children.append(_action)
+                if child.requires(action):
+                    edges.append((action_idx, child_idx))
 
-            for child in children:
-                child_idx = self._actions.index(child)
-                edges.append((action_idx, child_idx))
+        # container actions are not ordered by type
+        ranks = dict((idx, a.type) for (idx, a) in enumerate(actions)
+                        if not a.isContainer)
 
-        # create a graph reflecting the ordering information we have
-        graph = tsort.create_graph(range(len(self._actions)), edges)
+        return tsort.create_graph(range(len(actions)), edges, ranks=ranks)
 
-        # perform a topological sort based on the graph's contents
-        order = tsort.tsort(graph)
+    @recorder.timed("processActions")
+    def processActions(self, dryRun=None, jobs=None):
+        """ Execute all registered actions.
 
-        # now replace self._actions with a sorted version of the same list
-        actions = []
-        for idx in order:
-            actions.append(self._actions[idx])
-        self._actions = actions
-
-    def processActions(self, dryRun=None):
-        """ Execute all registered actions. """
-        log.info("resetting parted disks...")
-        for device in self.devices:
-            if device.partitioned:
-                device.format.resetPartedDisk()
-                if device.originalFormat.type == "disklabel" and \
-                   device.originalFormat != device.format:
-                    device.originalFormat.resetPartedDisk()
-
-        # Call preCommitFixup on all devices
-        mpoints = [getattr(d.format, 'mountpoint', "") for d in self.devices]
-        for device in self.devices:
-            device.preCommitFixup(mountpoints=mpoints)
-
-        # Also call preCommitFixup on any devices we're going to
-        # destroy (these are already removed from the tree)
-        for action in self._actions:
-            if isinstance(action, ActionDestroyDevice):
-                action.device.preCommitFixup(mountpoints=mpoints)
+            :keyword bool dryRun: only log the actions, do not execute them
+            :keyword int jobs: the maximum number of actions to execute at
+                               once (default: :attr:`~.flags.Flags.action_jobs`)
+
+            When more than one job is allowed, actions that do not depend on
+            one another and do not touch the same disks are executed
+            concurrently. See :class:`~.actionscheduler.ActionScheduler`.
+
+            Otherwise, if :attr:`~.flags.Flags.batch_partition_commits` is
+            set, consecutive partition create or destroy actions on a disk
+            share a single disklabel commit.
+        """
+        if jobs is None:
+            jobs = flags.action_jobs
+
+        with recorder.span("processActions.prepare"):
+            log.info("resetting parted disks...")
+            for device in self.devices:
+                if device.partitioned:
+                    device.format.resetPartedDisk()
+                    if device.originalFormat.type == "disklabel" and \
+                       device.originalFormat != device.format:
+                        device.originalFormat.resetPartedDisk()
+
+            # Call preCommitFixup on all devices
+            mpoints = [getattr(d.format, 'mountpoint', "") for d in self.devices]
+            for device in self.devices:
+                device.preCommitFixup(mountpoints=mpoints)
+
+            # Also call preCommitFixup on any devices we're going to
+            # destroy (these are already removed from the tree)
+            for action in self._actions:
+                if isinstance(action, ActionDestroyDevice):
+                    action.device.preCommitFixup(mountpoints=mpoints)
 
         # setup actions to create any extended partitions we added
         #
@@ -275,20 +436,135 @@ class DeviceTree(object):
             log.debug("action: %s", action)
 
         log.info("pruning action queue...")
-        self.pruneActions()
+        with recorder.span("processActions.prune"):
+            self.pruneActions()
 
         log.info("sorting actions...")
-        self.sortActions()
+        with recorder.span("processActions.sort"):
+            self.sortActions()
         for action in self._actions:
             log.debug("action: %s", action)
 
             # Remove lvm filters for devices we are operating on
-            for device in (d for d in self._devices if d.dependsOn(action.device)):
+            for device in self.getDependentDevices(action.device):
                 lvm.lvm_cc_removeFilterRejectRegexp(device.name)
 
-        for action in self._actions[:]:
-            log.info("executing action: %s", action)
-            if not dryRun:
+        if jobs > 1:
+            scheduler = ActionScheduler(self._actions[:],
+                                        self._getActionGraph(self._actions),
+                                        jobs=jobs)
+            if dryRun:
+                for (step, actions) in enumerate(scheduler.plan(), 1):
+                    for action in actions:
+                        log.info("step %d: executing action: %s", step, action)
+            else:
+                stats = udev.udev_wait_stats()
+                scheduler.run(self._executeAction,
+                              lambda action: self._completeActions([action]))
+                self._logUdevWaitStats(stats)
+        elif dryRun:
+            for action in self._actions:
+                log.info("executing action: %s", action)
+        else:
+            # a single watch lets actions skip waiting for udev to finish
+            # with earlier actions on unrelated devices
+            stats = udev.udev_wait_stats()
+            watch = udev.UdevEventWatch()
+            if flags.batch_partition_commits:
+                batches = self._getActionBatches(self._actions)
+            else:
+                batches = [[action] for action in self._actions]
+
+            try:
+                names = set()
+                for actions in batches:
+                    for action in actions:
+                        names.update(self._getUdevNames(action))
+
+                    if len(actions) > 1:
+                        self._executeBatch(actions, watch)
+                    else:
+                        self._executeAction(actions[0], watch=watch)
+                        self._completeActions(actions)
+
+                with recorder.span("processActions.settle"):
+                    watch.wait(names)
+            finally:
+                watch.close()
+
+            self._logUdevWaitStats(stats)
+
+        with recorder.span("processActions.update"):
+            # removal of partitions makes use of originalFormat, so it has to
+            # stay up to date in case of multiple passes through this method
+            for disk in (d for d in self.devices if d.partitioned):
+                disk.format.updateOrigPartedDisk()
+                disk.originalFormat = copy.deepcopy(disk.format)
+
+            # now we have to update the parted partitions of all devices so
+            # they match the parted disks we just updated
+            for partition in self.getDevicesByInstance(PartitionDevice):
+                pdisk = partition.disk.format.partedDisk
+                partition.partedPartition = pdisk.getPartitionByPath(partition.path)
+
+    @staticmethod
+    def _getTouchedDevices(action):
+        """ Return the devices an action may touch. """
+        devices = set(action.device.ancestors)
+        container = getattr(action, "container", None)
+        if container is not None:
+            devices.update(container.ancestors)
+
+        return devices
+
+    @classmethod
+    def _getUdevNames(cls, action):
+        """ Return the kernel names of the devices an action may touch.
+
+            Devices built on these devices are covered by waiting for
+            their names too, see :meth:`~.udev.UdevEventWatch.wait`.
+        """
+        return set(os.path.basename(d.sysfsPath) if d.sysfsPath else d.name
+                   for d in cls._getTouchedDevices(action))
+
+    @classmethod
+    def _getProbePaths(cls, actions):
+        """ Return the paths of the devices actions may touch, for
+            :meth:`~.probecache.ProbeCache.invalidating`.
+        """
+        paths = set()
+        for action in actions:
+            paths.update(d.path for d in cls._getTouchedDevices(action))
+
+        return paths
+
+    def _executeAction(self, action, watch=None):
+        """ Execute an action, retrying once after a disk label commit error.
+
+            :param action: the action to execute
+            :type action: :class:`~.deviceaction.DeviceAction`
+            :keyword watch: a watch created before any earlier actions were
+                            executed (default: wait for this action's
+                            events before returning)
+            :type watch: :class:`~.udev.UdevEventWatch`
+
+            While the action executes, settling udev only waits for events
+            on the devices it touches.
+        """
+        names = self._getUdevNames(action)
+        own_watch = None
+        if watch is None:
+            watch = own_watch = udev.UdevEventWatch()
+
+        try:
+            # let udev finish with earlier actions on these devices
+            with recorder.span("processActions.settle"):
+                watch.wait(names)
+
+            with udev.udev_settle_scope(watch, names), \
+                 probe_cache.invalidating(self._getProbePaths([action])), \
+                 recorder.span("processActions.execute", detail=str(action)):
+                log.info("executing action: %s", action)
                 try:
                     action.execute()
                 except DiskLabelCommitError:
@@ -301,26 +577,140 @@ class DeviceTree(object):
                         dep.teardown(recursive=True)
                     action.execute()
 
-                udev.udev_settle()
-                for device in self._devices:
-                    # make sure we catch any renumbering parted does
-                    if device.exists and isinstance(device, PartitionDevice):
-                        device.updateName()
-                        device.format.device = device.path
+            if own_watch:
+                with recorder.span("processActions.settle"):
+                    own_watch.wait(names)
+        finally:
+            if own_watch:
+                own_watch.close()
+
+    @staticmethod
+    def _getActionBatches(actions):
+        """ Group partition create and destroy actions by disk.
+
+            :param actions: sorted actions
+            :type actions: list of :class:`~.deviceaction.DeviceAction`
+            :returns: lists of actions to execute together, in order
+            :rtype: list of lists of :class:`~.deviceaction.DeviceAction`
+
+            Each run of consecutive partition create actions, or of
+            consecutive partition destroy actions, is split into one list
+            per disk. Partition actions on different disks do not depend on
+            one another, so only the order of the actions on each disk
+            needs to be kept. Every other action is in a list of its own.
+        """
+        batches = []
+        run = collections.OrderedDict()
+        run_type = None
+        for action in actions:
+            if not (action.isDevice and (action.isCreate or action.isDestroy) and
+                    isinstance(action.device, PartitionDevice)):
+                batches.extend(run.values())
+                batches.append([action])
+                run.clear()
+                run_type = None
+                continue
 
-                self._completed_actions.append(self._actions.pop(0))
+            if action.type != run_type:
+                batches.extend(run.values())
+                run.clear()
+                run_type = action.type
 
-        # removal of partitions makes use of originalFormat, so it has to stay
-        # up to date in case of multiple passes through this method
-        for disk in (d for d in self.devices if d.partitioned):
-            disk.format.updateOrigPartedDisk()
-            disk.originalFormat = copy.deepcopy(disk.format)
+            run.setdefault(action.device.disk.id, []).append(action)
 
-        # now we have to update the parted partitions of all devices so they
-        # match the parted disks we just updated
-        for partition in self.getDevicesByInstance(PartitionDevice):
-            pdisk = partition.disk.format.partedDisk
-            partition.partedPartition = pdisk.getPartitionByPath(partition.path)
+        batches.extend(run.values())
+        return batches
+
+    def _executeBatch(self, actions, watch):
+        """ Execute partition actions on a disk with one disklabel commit.
+
+            :param actions: partition create or destroy actions on one disk
+            :type actions: list of :class:`~.deviceaction.DeviceAction`
+            :param watch: a watch created before any earlier actions were
+                          executed
+            :type watch: :class:`~.udev.UdevEventWatch`
+
+            If the commit fails without any of the actions taking effect,
+            the actions are executed one at a time instead.
+        """
+        names = set()
+        for action in actions:
+            names.update(self._getUdevNames(action))
+
+        with recorder.span("processActions.settle"):
+            watch.wait(names)
+
+        detail = "%d partition actions on %s" % (len(actions),
+                                                  actions[0].device.disk.name)
+        try:
+            with udev.udev_settle_scope(watch, names), \
+                 probe_cache.invalidating(self._getProbePaths(actions)), \
+                 recorder.span("processActions.execute", detail=detail):
+                for action in actions:
+                    log.info("executing action: %s", action)
+
+                actions[0].executePartitions(actions)
+        except DiskLabelCommitError:
+            if any(a.device.exists == a.isCreate for a in actions):
+                raise
+
+            log.info("disklabel commit for %d actions failed, executing "
+                     "them one at a time", len(actions))
+            for action in actions:
+                self._executeAction(action, watch=watch)
+                self._completeActions([action])
+        else:
+            # the partitions are renumbered once for the whole batch
+            self._completeActions(actions)
+
+    @staticmethod
+    def _logUdevWaitStats(before):
+        """ Log how much waiting for udev the targeted waits saved.
+
+            :param dict before: :func:`~.udev.udev_wait_stats` from before
+                                the actions were executed
+        """
+        after = udev.udev_wait_stats()
+        waits = after["waits"] - before["waits"]
+        if not waits:
+            return
+
+        blocked = after["blocked"] - before["blocked"]
+        wait_time = after["wait_time"] - before["wait_time"]
+        log.info("udev: %d targeted waits instead of settles, %d of them "
+                 "waited for events (%.3f s)", waits, blocked, wait_time)
+        settles = after["settles"] - before["settles"]
+        if settles:
+            log.info("udev: %d settles were still run", settles)
+
+        if after["settles"]:
+            # estimated from the settles run by this process so far
+            settle_time = after["settle_time"] / after["settles"]
+            log.info("udev: estimated settle time saved: %.3f s",
+                     max(0, waits * settle_time - wait_time))
+
+    def _completeActions(self, actions):
+        """ Update the tree after actions have been executed.
+
+            Only the partitions on the disks the actions touched are
+            updated. Actions on other disks may still be executing in worker
+            threads, see :meth:`processActions`, and their disks must not be
+            read until they complete.
+        """
+        disks = set()
+        for action in actions:
+            disks.update(action.device.disks)
+
+        for disk in disks:
+            # make sure we catch any renumbering parted does
+            for device in self.getChildren(disk):
+                if device.exists and isinstance(device, PartitionDevice):
+                    device.updateName()
+                    device.format.device = device.path
+
+        for action in actions:
+            self._actions.remove(action)
+            self._completed_actions.append(action)
 
     def _addDevice(self, newdev):
         """ Add a device to the tree.
@@ -331,16 +721,17 @@ class DeviceTree(object):
             Raise ValueError if the device's identifier is already
             in the list.
         """
-        if newdev.uuid and newdev.uuid in [d.uuid for d in self._devices] and \
-           not isinstance(newdev, NoDevice):
+        if newdev.uuid and not isinstance(newdev, NoDevice) and \
+           any(d.uuid == newdev.uuid
+               for d in self._index.lookup("uuid", newdev.uuid)):
             raise ValueError("device is already in tree")
 
         # make sure this device's parent devices are in the tree already
         for parent in newdev.parents:
-            if parent not in self._devices:
+            if not self._index.isVisible(parent):
                 raise DeviceTreeError("parent device not in tree")
 
-        self._devices.append(newdev)
+        self._index.add(newdev)
 
         # don't include "req%d" partition names
         if ((newdev.type != "partition" or
@@ -366,7 +757,7 @@ class DeviceTree(object):
 
                 Only leaves may be removed.
         """
-        if dev not in self._devices:
+        if not self._index.isVisible(dev):
             raise ValueError("Device '%s' not in tree" % dev.name)
 
         if not dev.isleaf and not force:
@@ -388,9 +779,8 @@ class DeviceTree(object):
                 # adjust all other PartitionDevice instances belonging to the
                 # same disk so the device name matches the potentially altered
                 # name of the parted.Partition
-                for device in self._devices:
-                    if isinstance(device, PartitionDevice) and \
-                       device.disk == dev.disk:
+                for device in self.getChildren(dev.disk):
+                    if isinstance(device, PartitionDevice):
                         device.updateName()
             elif hasattr(dev, "pool"):
                 dev.pool._removeLogVol(dev)
@@ -399,7 +789,7 @@ class DeviceTree(object):
             elif hasattr(dev, "volume"):
                 dev.volume._removeSubVolume(dev.name)
 
-        self._devices.remove(dev)
+        self._index.remove(dev)
         if dev.name in self.names and getattr(dev, "complete", True):
             self.names.remove(dev.name)
         log.info("removed %s %s (id %d) from device tree", dev.type,
@@ -432,10 +822,10 @@ class DeviceTree(object):
             get here.
         """
         if not (action.isCreate and action.isDevice) and \
-           action.device not in self._devices:
+           not self._index.isVisible(action.device):
             raise DeviceTreeError("device is not in the tree")
         elif (action.isCreate and action.isDevice):
-            if action.device in self._devices:
+            if self._index.isVisible(action.device):
                 raise DeviceTreeError("device is already in the tree")
 
         if action.isCreate and action.isDevice:
@@ -532,20 +922,21 @@ class DeviceTree(object):
 
             :param dep: the device whose dependents we are looking for
             :type dep: :class:`~.devices.StorageDevice`
-        """
-        dependents = []
 
-        # don't bother looping looking for dependents if this is a leaf device
+            Complete devices are listed before incomplete ones.
+        """
+        # don't bother looking for dependents if this is a leaf device
         if dep.isleaf:
-            return dependents
+            return []
 
-        incomplete = [d for d in self._devices
-                            if not getattr(d, "complete", True)]
-        for device in self.devices + incomplete:
-            if device.dependsOn(dep):
-                dependents.append(device)
-
-        return dependents
+        # devices can depend on a sibling, eg: logical partitions on the
+        # extended partition, in which case so does everything built on them
+        others = [d for p in dep.parents for d in self._index.getChildren(p)
+                        if d is not dep and d.dependsOn(dep)]
+        dependents = self._index.getDescendants([dep] + others)
+        dependents = self._index.sort(set(dependents + others))
+        return ([d for d in dependents if getattr(d, "complete", True)] +
+                [d for d in dependents if not getattr(d, "complete", True)])
 
     def isIgnored(self, info):
         """ Return True if info is a device we should ignore.
@@ -654,9 +1045,7 @@ class DeviceTree(object):
         if not device:
             # initiate detection of all PVs and hope that it leads to us having
             # the VG and LVs in the tree
-            for pv_name in os.listdir("/sys" + sysfs_path + "/slaves"):
-                link = os.readlink("/sys" + sysfs_path + "/slaves/" + pv_name)
-                pv_sysfs_path = os.path.normpath(sysfs_path + '/slaves/' + link)
+            for (_pv_name, pv_sysfs_path) in udev.udev_get_slaves(sysfs_path):
                 pv_info = udev.udev_get_block_device(pv_sysfs_path)
                 self.addUdevDevice(pv_info)
 
@@ -700,17 +1089,14 @@ class DeviceTree(object):
         if device is None:
             # we couldn't find it, so create it
             # first, get a list of the slave devs and look them up
-            slave_dir = os.path.normpath("/sys/%s/slaves" % sysfs_path)
-            slave_names = os.listdir(slave_dir)
-            for slave_name in slave_names:
+            for (slave_name, slave_path) in udev.udev_get_slaves(sysfs_path):
                 # if it's a dm-X name, resolve it to a map name first
                 if slave_name.startswith("dm-"):
                     dev_name = dm.name_from_dm_node(slave_name)
                 else:
                     dev_name = slave_name.replace("!", "/") # handles cciss
                 slave_dev = self.getDeviceByName(dev_name)
-                path = os.path.normpath("%s/%s" % (slave_dir, slave_name))
-                new_info = udev.udev_get_block_device(os.path.realpath(path)[4:])
+                new_info = udev.udev_get_block_device(slave_path)
                 if not slave_dev:
                     # we haven't scanned the slave yet, so do it now
                     if new_info:
@@ -771,17 +1157,14 @@ class DeviceTree(object):
         # TODO: look for this device by dm-uuid?
 
         # first, get a list of the slave devs and look them up
-        slave_dir = os.path.normpath("/sys/%s/slaves" % sysfs_path)
-        slave_names = os.listdir(slave_dir)
-        for slave_name in slave_names:
+        for (slave_name, slave_path) in udev.udev_get_slaves(sysfs_path):
             # if it's a dm-X name, resolve it to a map name first
             if slave_name.startswith("dm-"):
                 dev_name = dm.name_from_dm_node(slave_name)
             else:
                 dev_name = slave_name.replace("!", "/") # handles cciss
             slave_dev = self.getDeviceByName(dev_name)
-            path = os.path.normpath("%s/%s" % (slave_dir, slave_name))
-            new_info = udev.udev_get_block_device(os.path.realpath(path)[4:])
+            new_info = udev.udev_get_block_device(slave_path)
             if not slave_dev:
                 # we haven't scanned the slave yet, so do it now
                 if new_info:
@@ -815,9 +1198,7 @@ class DeviceTree(object):
         device = None
 
         slaves = []
-        slave_dir = os.path.normpath("/sys/%s/slaves" % sysfs_path)
-        slave_names = os.listdir(slave_dir)
-        for slave_name in slave_names:
+        for (slave_name, slave_path) in udev.udev_get_slaves(sysfs_path):
             # if it's a dm-X name, resolve it to a map name
             if slave_name.startswith("dm-"):
                 dev_name = dm.name_from_dm_node(slave_name)
@@ -828,8 +1209,7 @@ class DeviceTree(object):
                 slaves.append(slave_dev)
             else:
                 # we haven't scanned the slave yet, so do it now
-                path = os.path.normpath("%s/%s" % (slave_dir, slave_name))
-                new_info = udev.udev_get_block_device(os.path.realpath(path)[4:])
+                new_info = udev.udev_get_block_device(slave_path)
                 if new_info:
                     self.addUdevDevice(new_info)
                     if self.getDeviceByName(dev_name) is None:
@@ -1052,7 +1432,12 @@ class DeviceTree(object):
         log_method_call(self, name=name)
         sysfs_path = udev.udev_device_get_sysfs_path(info)
         sys_file = "/sys/%s/loop/backing_file" % sysfs_path
-        backing_file = open(sys_file).read().strip()
+        backing_file = util.read_file(sys_file)
+        if backing_file is None:
+            log.error("failed to read the backing file of %s", name)
+            return None
+
+        backing_file = backing_file.strip()
         file_device = self.getDeviceByName(backing_file)
         if not file_device:
             file_device = FileDevice(backing_file, exists=True)
@@ -1194,7 +1579,7 @@ class DeviceTree(object):
         # if we didn't end up with a device somehow.
         if not device or not device.mediaPresent:
             log.debug("no device or no media present")
-            return
+            return device
 
         # now handle the device's formatting
         self.handleUdevDeviceFormat(info, device)
@@ -1203,6 +1588,7 @@ class DeviceTree(object):
             log.info("got format: %r", device.format)
         device.originalFormat = copy.copy(device.format)
         device.deviceLinks = udev.udev_device_get_symlinks(info)
+        return device
 
     def handleUdevDiskLabelFormat(self, info, device):
         disklabel_type = info.get("ID_PART_TABLE_TYPE")
@@ -1252,9 +1638,17 @@ class DeviceTree(object):
     def handleUdevLUKSFormat(self, info, device):
         # pylint: disable=unused-argument
         log_method_call(self, name=device.name, type=device.format.type)
+        udev_uuid = device.format.uuid
+        try:
+            device.format.probe()
+        except LUKSError as e:
+            log.warning("failed to probe luks device %s: %s", device.path, e)
+
         if not device.format.uuid:
             log.info("luks device %s has no uuid", device.path)
             return
+        elif not udev_uuid:
+            device.format.mapName = "luks-%s" % device.format.uuid
 
         # look up or create the mapped device
         if not self.getDeviceByName(device.format.mapName):
@@ -1304,8 +1698,7 @@ class DeviceTree(object):
     def handleVgLvs(self, vg_device):
         """ Handle setup of the LV's in the vg_device. """
         vg_name = vg_device.name
-        lv_info = dict((k, v) for (k, v) in self.lvInfo.iteritems()
-                                if udev.udev_device_get_vg_name(v) == vg_name)
+        lv_info = self.lvmReport.vgLVs(vg_name)
 
         self.names.extend(n for n in lv_info.keys() if n not in self.names)
 
@@ -1359,7 +1752,7 @@ class DeviceTree(object):
 
             if lv_attr[0] in 'Ss':
                 log.info("found lvm snapshot volume '%s'", name)
-                origin_name = lvm.lvorigin(vg_name, lv_name)
+                origin_name = self.lvmReport.lvorigin(vg_name, lv_name)
                 if not origin_name:
                     log.error("lvm snapshot '%s-%s' has unknown origin",
                                 vg_name, lv_name)
@@ -1410,7 +1803,7 @@ class DeviceTree(object):
                 lv_class = LVMThinPoolDevice
             elif lv_attr[0] == 'V':
                 # thin volume
-                pool_name = lvm.thinlvpoolname(vg_name, lv_name)
+                pool_name = self.lvmReport.thinlvpoolname(vg_name, lv_name)
                 pool_device_name = "%s-%s" % (vg_name, pool_name)
                 addRequiredLV(pool_device_name, "failed to look up thin pool")
                 lv_class = LVMThinLogicalVolumeDevice
@@ -1460,6 +1853,7 @@ class DeviceTree(object):
                         lv_dev.name, lv_dev.copies, lv_dev.metaDataSize,
                         lv_dev.logSize, lv_dev.vgSpaceUsed)
 
+    @recorder.timed("populate.lvm")
     def handleUdevLVMPVFormat(self, info, device):
         log_method_call(self, name=device.name, type=device.format.type)
         # lookup/create the VG and LVs
@@ -1503,6 +1897,7 @@ class DeviceTree(object):
 
         self.handleVgLvs(vg_device)
 
+    @recorder.timed("populate.md")
     def handleUdevMDMemberFormat(self, info, device):
         log_method_call(self, name=device.name, type=device.format.type)
         # either look up or create the array device
@@ -1736,7 +2131,8 @@ class DeviceTree(object):
             # luks/dmcrypt
             kwargs["name"] = "luks-%s" % uuid
         elif format_type in formats.mdraid.MDRaidMember._udevTypes:
-            info.update(mdraid.mdexamine(device.path))
+            info.update(self._probe(device.sysfsPath, "mdexamine",
+                                    self._mdExamine, device))
 
             # mdraid
             try:
@@ -1869,7 +2265,7 @@ class DeviceTree(object):
             Therefore, _removeDevice() is invoked with the force parameter
             set to True, to skip the isleaf check.
         """
-        if device in self._hidden:
+        if self._index.isHidden(device):
             return
 
         for d in self.getChildren(device):
@@ -1887,7 +2283,7 @@ class DeviceTree(object):
 
         self._removeDevice(device, force=True, moddisk=False)
 
-        self._hidden.append(device)
+        self._index.add(device, hidden=True)
         lvm.lvm_cc_addFilterRejectRegexp(device.name)
 
         if isinstance(device, DASDDevice):
@@ -1915,8 +2311,8 @@ class DeviceTree(object):
                 log.info("unhiding device %s %s (id %d)", hidden.type,
                                                           hidden.name,
                                                           hidden.id)
-                self._hidden.remove(hidden)
-                self._devices.append(hidden)
+                self._index.remove(hidden)
+                self._index.add(hidden)
                 lvm.lvm_cc_removeFilterRejectRegexp(hidden.name)
                 for parent in hidden.parents:
                     parent.addChild()
@@ -2012,26 +2408,48 @@ class DeviceTree(object):
             Devices excluded via disk filtering (or because of disk images) are
             scanned just the rest, but then they are hidden at the end of this
             process.
+
+            If :attr:`~.flags.Flags.devicetree_cache` names a file, udev
+            information, lvm and md information and the output of the
+            programs that probe formats, for devices that have not changed
+            since the last populate, are read from it instead of gathered
+            again (see :class:`~.populatecache.PopulateCache`).
         """
         self.backupConfigs()
         if cleanupOnly:
             self._cleanup = True
 
+        if flags.devicetree_cache:
+            self._populateCache = PopulateCache(flags.devicetree_cache)
+            probe_cache.store = self._populateCache
+
         try:
             self._populate()
-        except Exception:
-            raise
+            if self._populateCache is not None:
+                log.info("device tree cache: %d hits, %d misses",
+                         self._populateCache.hits, self._populateCache.misses)
+                self._populateCache.save()
         finally:
+            self._populateCache = None
+            probe_cache.store = None
             self.restoreConfigs()
 
+    @recorder.timed("populate")
     def _populate(self):
         log.info("DeviceTree.populate: ignoredDisks is %s ; exclusiveDisks is %s",
                     self.ignoredDisks, self.exclusiveDisks)
 
         # this has proven useful when populating after opening a LUKS device
-        udev.udev_settle()
+        with recorder.span("populate.settle"):
+            udev.udev_settle()
 
         self.dropLVMCache()
+        self._mdExamineInfo = {}
+        self._mdCandidates = {}
+
+        # devices may have changed behind our back since the last populate
+        probe_cache.clear()
+        probe_cache.resetStats()
 
         if flags.installer_mode and not flags.image_install:
             mpath.set_friendly_names(enabled=flags.multipath_friendly_names)
@@ -2069,7 +2487,8 @@ class DeviceTree(object):
         # blocks or since previous iterations.
         while True:
             devices = []
-            new_devices = udev.udev_get_block_devices()
+            with recorder.span("populate.udev"):
+                new_devices = udev.udev_get_block_devices(cache=self._populateCache)
 
             for new_device in new_devices:
                 if not old_devices.has_key(new_device['name']):
@@ -2081,25 +2500,37 @@ class DeviceTree(object):
                 break
 
             log.info("devices to scan: %s", [d['name'] for d in devices])
+            self._addMDCandidates(devices)
             for dev in devices:
-                self.addUdevDevice(dev)
+                with recorder.span("populate.addUdevDevice") as span:
+                    device = self.addUdevDevice(dev)
+                    # time each kind of device separately
+                    span.name += "." + getattr(device, "type", "none")
 
         self.populated = True
 
         # After having the complete tree we make sure that the system
         # inconsistencies are ignored or resolved.
-        self._handleInconsistencies()
+        with recorder.span("populate.inconsistencies"):
+            self._handleInconsistencies()
 
         if flags.installer_mode:
-            self.teardownAll()
+            with recorder.span("populate.teardown"):
+                self.teardownAll()
+
+        with recorder.span("populate.hide"):
+            self._hideIgnoredDisks([d for d in self._devices if d.isDisk])
+
+        probe_cache.logStats()
 
+    def _hideIgnoredDisks(self, disks):
+        """ Hide any subtrees that begin with an ignored disk. """
         def _is_ignored(disk):
             return ((self.ignoredDisks and disk.name in self.ignoredDisks) or
                     (self.exclusiveDisks and
                      disk.name not in self.exclusiveDisks))
 
-        # hide any subtrees that begin with an ignored disk
-        for disk in [d for d in self._devices if d.isDisk]:
+        for disk in disks:
             if _is_ignored(disk):
                 ignored = True
                 # If the filter allows all members of a fwraid or mpath, the
@@ -2112,6 +2543,151 @@ class DeviceTree(object):
                 if ignored:
                     self.hide(disk)
 
+    def updateDevices(self, added=None, changed=None, removed=None):
+        """ Update the tree for block devices that were added, changed or removed.
+
+            :keyword added: sysfs paths of new devices
+            :type added: iterable of str
+            :keyword changed: sysfs paths of devices whose contents changed
+            :type changed: iterable of str
+            :keyword removed: sysfs paths of devices that are gone
+            :type removed: iterable of str
+
+            Unlike :meth:`populate`, this only rescans the given devices and
+            the devices that depend on them, so the cost of adding a disk
+            depends on what is on that disk and not on the rest of the
+            system. Devices built on a changed or removed device are removed
+            from the tree and rescanned if they still exist. Adding or
+            removing a partition rescans its disk.
+
+            udev must already have processed the events for the devices.
+
+            Raises :class:`~.errors.DeviceTreeError` if any of the devices
+            to remove from the tree have actions registered.
+        """
+        added = set(added or [])
+        changed = set(changed or [])
+        removed = set(removed or [])
+
+        # new or removed partitions change their disk's partition table
+        for path in added | removed:
+            if udev.udev_sysfs_path_is_partition(path):
+                changed.add(os.path.dirname(path))
+
+        devices = [self.getDeviceBySysfsPath(path, incomplete=True, hidden=True)
+                   for path in added | changed | removed]
+        devices = [d for d in devices if d]
+        stale = self._getStaleDevices([d for d in devices
+                                        if not self._index.isHidden(d)])
+        for action in self._actions:
+            if action.device in stale:
+                raise DeviceTreeError("cannot update %s while it has actions "
+                                      "registered" % action.device.name)
+
+        # hidden devices are rescanned and hidden again along with
+        # everything built on them, which is hidden too
+        hidden = [d for d in devices if self._index.isHidden(d)]
+        hidden = self._index.sort(set(hidden +
+                                      self._index.getDescendants(hidden, hidden=True)))
+        for device in reversed(hidden):
+            log.info("removing hidden %s (%s) from the tree for rescanning",
+                     device.name, device.sysfsPath)
+            self._index.remove(device)
+            lvm.lvm_cc_removeFilterRejectRegexp(device.name)
+            if device.name in self.names:
+                self.names.remove(device.name)
+
+        stale = self._index.sort(stale)
+        for device in reversed(stale):
+            log.info("removing %s (%s) from the tree for rescanning",
+                     device.name, device.sysfsPath)
+            # the disk's partition table is rescanned along with the disk
+            moddisk = not isinstance(device, PartitionDevice)
+            self._removeDevice(device, force=True, moddisk=moddisk)
+
+        # rescan the devices and everything built on them, each device after
+        # the ones it is built on
+        paths = []
+        seen = set(removed)
+        for path in (sorted(added) + sorted(changed) +
+                     [d.sysfsPath for d in stale + hidden]):
+            if not path or path in seen:
+                continue
+
+            for dep_path in [path] + udev.udev_get_dependent_paths(path):
+                if dep_path not in seen:
+                    seen.add(dep_path)
+                    paths.append(dep_path)
+
+        if not paths:
+            return
+
+        self.dropLVMCache()
+        log.info("devices to rescan: %s", paths)
+        for path in paths:
+            info = udev.udev_get_block_device(path)
+            if info:
+                self.addUdevDevice(info)
+
+        disks = [self.getDeviceBySysfsPath(path, hidden=True) for path in paths]
+        self._hideIgnoredDisks([d for d in disks if d and d.isDisk])
+
+    def _getStaleDevices(self, devices):
+        """ Return the devices to rescan along with some changed devices.
+
+            :param devices: the changed devices
+            :type devices: list of :class:`~.devices.StorageDevice`
+            :rtype: set of :class:`~.devices.StorageDevice`
+
+            Devices are only found by scanning the devices they are built
+            on, so the devices a changed device is built on are rescanned as
+            well, except for partitions' disks. This includes every member
+            of a changed volume group or md array, for example. Everything
+            built on a rescanned device is rescanned too.
+        """
+        stale = set()
+        todo = list(devices)
+        while todo:
+            device = todo.pop()
+            if device in stale:
+                continue
+
+            group = [device] + self.getDependentDevices(device)
+            stale.update(group)
+            for dev in group:
+                if not isinstance(dev, PartitionDevice):
+                    todo.extend(p for p in dev.parents if p not in stale)
+
+        return stale
+
+    def updateDevicesFromEvents(self, events):
+        """ Update the tree for a series of uevents.
+
+            :param events: (action, sysfs path) pairs for block devices, eg:
+                           as received by a :class:`~.pyudev.UdevMonitor`
+            :type events: iterable of (str, str)
+
+            See :meth:`updateDevices`.
+        """
+        added = set()
+        changed = set()
+        removed = set()
+        for (action, path) in events:
+            if path.startswith("/sys/"):
+                path = path[4:]
+
+            if action == "add":
+                removed.discard(path)
+                added.add(path)
+            elif action == "remove":
+                added.discard(path)
+                changed.discard(path)
+                removed.add(path)
+            elif path not in added:
+                changed.add(path)
+
+        self.updateDevices(added=added, changed=changed, removed=removed)
+
     def teardownAll(self):
         """ Run teardown methods on all devices. """
         for device in self.leaves:
@@ -2131,6 +2707,36 @@ class DeviceTree(object):
             except DeviceError as e:
                 log.error("setup of %s failed: %s", device.name, e)
 
+    @staticmethod
+    def _firstDevice(devices, incomplete=False):
+        """ Return the first device in a list, optionally skipping incomplete ones. """
+        for device in devices:
+            if incomplete or getattr(device, "complete", True):
+                return device
+
+        return None
+
+    def _lookupLVMAware(self, index, key, hidden=False):
+        """ Look up devices by name or path, allowing for lvm's name mangling.
+
+            :param str index: "name" or "path"
+            :param str key: the name or path to look up
+            :keyword bool hidden: include hidden devices
+            :returns: matching devices in tree order
+            :rtype: list of :class:`~.devices.StorageDevice`
+
+            Logical volumes and volume groups also match if their name/path
+            equals key with each "--" replaced by "-".
+        """
+        devices = self._index.lookup(index, key, hidden=hidden)
+        unmangled = key.replace("--", "-")
+        if unmangled != key:
+            devices += [d for d in self._index.lookup(index, unmangled, hidden=hidden)
+                            if d.type in ("lvmlv", "lvmvg") and d not in devices]
+            devices = self._index.sort(devices)
+
+        return devices
+
     def getDeviceBySysfsPath(self, path, incomplete=False, hidden=False):
         """ Return a list of devices with a matching sysfs path.
 
@@ -2144,19 +2750,8 @@ class DeviceTree(object):
         if not path:
             return None
 
-        found = None
-        devices = self._devices[:]
-        if hidden:
-            devices += self._hidden
-
-        for device in devices:
-            if not incomplete and not getattr(device, "complete", True):
-                continue
-
-            if device.sysfsPath == path:
-                found = device
-                break
-
+        devices = self._index.lookup("sysfsPath", path, hidden=hidden)
+        found = self._firstDevice(devices, incomplete=incomplete)
         log_method_return(self, found)
         return found
 
@@ -2173,22 +2768,9 @@ class DeviceTree(object):
         if not uuid:
             return None
 
-        found = None
-        devices = self._devices[:]
-        if hidden:
-            devices += self._hidden
-
-        for device in devices:
-            if not incomplete and not getattr(device, "complete", True):
-                continue
-
-            if device.uuid == uuid:
-                found = device
-                break
-            elif device.format.uuid == uuid:
-                found = device
-                break
-
+        # the uuid index holds both device and format uuids
+        devices = self._index.lookup("uuid", uuid, hidden=hidden)
+        found = self._firstDevice(devices, incomplete=incomplete)
         log_method_return(self, found)
         return found
 
@@ -2233,23 +2815,8 @@ class DeviceTree(object):
         if not label:
             return None
 
-        found = None
-        devices = self._devices[:]
-        if hidden:
-            devices += self._hidden
-
-        for device in devices:
-            if not incomplete and not getattr(device, "complete", True):
-                continue
-
-            _label = getattr(device.format, "label", None)
-            if not _label:
-                continue
-
-            if _label == label:
-                found = device
-                break
-
+        devices = self._index.lookup("label", label, hidden=hidden)
+        found = self._firstDevice(devices, incomplete=incomplete)
         log_method_return(self, found)
         return found
 
@@ -2268,23 +2835,8 @@ class DeviceTree(object):
             log_method_return(self, None)
             return None
 
-        found = None
-        devices = self._devices[:]
-        if hidden:
-            devices += self._hidden
-
-        for device in devices:
-            if not incomplete and not getattr(device, "complete", True):
-                continue
-
-            if device.name == name:
-                found = device
-                break
-            elif (device.type == "lvmlv" or device.type == "lvmvg") and \
-                    device.name == name.replace("--","-"):
-                found = device
-                break
-
+        devices = self._lookupLVMAware("name", name, hidden=hidden)
+        found = self._firstDevice(devices, incomplete=incomplete)
         log_method_return(self, str(found))
         return found
 
@@ -2307,21 +2859,14 @@ class DeviceTree(object):
         leaf = None
         other = None
 
-        devices = self._devices[:]
-        if hidden:
-            devices += self._hidden
-
-        for device in devices:
+        for device in self._lookupLVMAware("path", path, hidden=hidden):
             if not incomplete and not getattr(device, "complete", True):
                 continue
 
-            if (device.path == path or
-                ((device.type == "lvmlv" or device.type == "lvmvg") and
-                 device.path == path.replace("--","-"))):
-                if device.isleaf and not leaf:
-                    leaf = device
-                elif not other:
-                    other = device
+            if device.isleaf and not leaf:
+                leaf = device
+            elif not other:
+                other = device
 
         if preferLeaves:
             all_devs = [leaf, other]
@@ -2357,29 +2902,22 @@ class DeviceTree(object):
             :param int id_num: the id to look for
             :param bool hidden: if True return hidden devices 
         """
-        devices = self._devices[:]
-        if hidden:
-            devices += self._hidden
+        return self._firstDevice(self._index.lookup("id", id_num, hidden=hidden),
+                                 incomplete=True)
 
-        for device in devices:
-            if device.id == id_num:
-                return device
+    @property
+    def _completeDevices(self):
+        """ Tuple of complete devices currently in the tree.
+
+            The same tuple is returned until the tree or one of its devices
+            changes.
+        """
+        return self._index.getCompleteDevices(exempt=(NoDevice,))
 
     @property
     def devices(self):
         """ List of devices currently in the tree """
-        devices = []
-        for device in self._devices:
-            if not getattr(device, "complete", True):
-                continue
-
-            if device.uuid and device.uuid in [d.uuid for d in devices] and \
-               not isinstance(device, NoDevice):
-                raise DeviceTreeError("duplicate uuids in device tree")
-
-            devices.append(device)
-
-        return devices
+        return list(self._completeDevices)
 
     @property
     def filesystems(self):
@@ -2438,7 +2976,7 @@ class DeviceTree(object):
 
     def getChildren(self, device):
         """ Return a list of a device's children. """
-        return [c for c in self._devices if device in c.parents]
+        return self._index.getChildren(device)
 
     def resolveDevice(self, devspec, blkidTab=None, cryptTab=None, options=None):
         """ Return the device matching the provided device specification.
@@ -134,6 +134,9 @@ class DMError(StorageError):
 class LVMError(StorageError):
     pass
 
+class LVMShellError(LVMError):
+    pass
+
 class CryptoError(StorageError):
     pass
 
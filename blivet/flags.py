@@ -60,6 +60,41 @@ class Flags(object):
         # meaningful when flags.installer_mode is False)
         self.include_nodev = False
 
+        # maximum number of actions to execute at once; 1 disables parallel
+        # execution of actions
+        self.action_jobs = 1
+
+        # commit the disklabel once for each run of partition create or
+        # destroy actions on a disk instead of once per action
+        self.batch_partition_commits = False
+
+        # number of threads collecting udev and sysfs information about block
+        # devices; 1 collects it in the calling thread
+        self.udev_jobs = 8
+
+        # file to keep udev information, lvm and md information and the
+        # output of the programs that probe formats in between runs; populate
+        # only runs these for devices that changed since the file was saved.
+        # Sizes and disklabels are still read with parted every time.
+        self.devicetree_cache = None
+
+        # run lvm commands in one long-lived lvm shell instead of starting
+        # lvm for each of them
+        self.lvm_shell = False
+
+        # maximum number of external programs util.run_many runs at once
+        self.command_jobs = 8
+
+        # reuse the results of read-only probes of a device, like its
+        # filesystem's info, until the device changes
+        self.probe_cache = True
+
+        # time the phases of populate and processActions and the external
+        # programs run, see blivet.instrumentation; the times are also
+        # written to this file as JSON if it is set
+        self.instrumentation = True
+        self.instrumentation_file = None
+
         self.boot_cmdline = {}
 
         self.update_from_boot_cmdline()
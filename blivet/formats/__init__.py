@@ -27,6 +27,8 @@ from ..util import notify_kernel
 from ..util import get_sysfs_path_by_name
 from ..util import run_program
 from ..util import ObjectID
+from ..deviceindex import keysChanged
+from ..snapshot import willChange
 from ..storage_log import log_method_call
 from ..errors import DeviceFormatError, DMError, FormatCreateError, FormatDestroyError, FormatSetupError, MDRaidError, StorageError
 from ..devicelibs.dm import dm_node_from_name
@@ -162,6 +164,7 @@ class DeviceFormat(ObjectID):
     _check = False
     _hidden = False                     # hide devices with this formatting?
     _ksMountpoint = None
+    _indexedAttrs = frozenset(("uuid", "_label")) # device tree lookup keys
 
     def __init__(self, *args, **kwargs):
         """
@@ -191,6 +194,12 @@ class DeviceFormat(ObjectID):
         #if self.__class__ is DeviceFormat:
         #    self.exists = True
 
+    def __setattr__(self, name, value):
+        willChange(self)
+        super(DeviceFormat, self).__setattr__(name, value)
+        if name in self._indexedAttrs:
+            keysChanged(self)
+
     def __repr__(self):
         s = ("%(classname)s instance (%(id)s) object id %(object_id)d--\n"
              "  type = %(type)s  name = %(name)s  status = %(status)s\n"
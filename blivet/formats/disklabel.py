@@ -33,6 +33,7 @@ from ..udev import udev_settle
 from ..i18n import _, N_
 from . import DeviceFormat, register_device_format
 from ..size import Size
+from ..snapshot import willChange
 
 import logging
 log = logging.getLogger("blivet")
@@ -45,6 +46,9 @@ class DiskLabel(DeviceFormat):
     _formattable = True                # can be formatted
     _supported = False                 # is supported
 
+    # parted disks a snapshot duplicates instead of saving a reference to
+    _snapshotDuplicateAttrs = ('_partedDisk', '_origPartedDisk')
+
     def __init__(self, *args, **kwargs):
         """
             :keyword device: full path to the block device node
@@ -144,6 +148,8 @@ class DiskLabel(DeviceFormat):
 
     @property
     def partedDisk(self):
+        # the caller may change the parted disk in place
+        willChange(self)
         if not self._partedDisk:
             if self.exists:
                 try:
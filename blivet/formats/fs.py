@@ -31,10 +31,12 @@ from ..errors import FormatCreateError, FSError, FSResizeError
 from . import DeviceFormat, register_device_format
 from .. import util
 from .. import platform
+from .. import probecache
 from ..flags import flags
 from parted import fileSystemType
 from ..storage_log import log_exception_info, log_method_call
 from .. import arch
+from ..devicelibs import superblock
 from ..size import Size
 from ..i18n import _, N_
 from ..udev import udev_settle
@@ -68,6 +70,7 @@ class FS(DeviceFormat):
     _fsck = ""                           # fs check utility
     _fsckErrors = {}                     # fs check command error codes & msgs
     _infofs = ""                         # fs info utility
+    _superblockType = None               # native superblock reader
     _defaultFormatOptions = []           # default options passed to mkfs
     _defaultMountOptions = ["defaults"]  # default options passed to mount
     _defaultCheckOptions = []
@@ -215,20 +218,38 @@ class FS(DeviceFormat):
         if not self.exists:
             return
 
-        info = self._getFSInfo()
+        info = None
+        if self._getSuperblock() is None:
+            info = self._getFSInfo()
+
         self._size = self._getExistingSize(info=info)
         self._getMinSize(info=info)   # force calculation of minimum size
 
     def _getMinSize(self, info=None):
         pass
 
+    def _getSuperblock(self):
+        """ Read this filesystem's superblock without running any programs.
+
+            :returns: the superblock's fields, or None if there is no reader
+                      for this filesystem or the superblock can not be read
+            :rtype: :class:`~.devicelibs.superblock.Superblock` or NoneType
+        """
+        if not self._superblockType or not self.exists or not self.device:
+            return None
+
+        return probecache.probe_cache.probe(self.device, "superblock",
+                                            superblock.read_superblock,
+                                            self.device, self._superblockType)
+
     def _getFSInfo(self):
         buf = ""
         if self.infofsProg and self.exists and \
            util.find_program_in_path(self.infofsProg):
             argv = self._defaultInfoOptions + [ self.device ]
             try:
-                buf = util.capture_output([self.infofsProg] + argv)
+                buf = probecache.capture_output(self.device,
+                                                [self.infofsProg] + argv)
             except OSError as e:
                 log.error("failed to gather fs info: %s", e)
 
@@ -237,7 +258,9 @@ class FS(DeviceFormat):
     def _getExistingSize(self, info=None):
         """ Determine the size of this filesystem.
 
-            Filesystem must exist.  Each filesystem varies, but the general
+            Filesystem must exist.  If the superblock can be read natively
+            (see :meth:`_getSuperblock`) the size is taken from it.
+            Otherwise, each filesystem varies, but the general
             procedure is to run the filesystem dump or info utility and read
             the block size and number of blocks for the filesystem
             and compute megabytes from that.
@@ -276,6 +299,10 @@ class FS(DeviceFormat):
         size = self._size
 
         if self.exists and not size:
+            sb = self._getSuperblock()
+            if sb is not None and sb.block_count is not None:
+                return Size(sb.block_size * sb.block_count)
+
             if info is None:
                 info = self._getFSInfo()
 
@@ -634,6 +661,13 @@ class FS(DeviceFormat):
         if not os.path.exists(self.device):
             raise FSError("device does not exist")
 
+        # not cached, since the label may just have been written
+        sb = None
+        if self._superblockType:
+            sb = superblock.read_superblock(self.device, self._superblockType)
+        if sb is not None:
+            return sb.label
+
         if not self._labelfs or not self._labelfs.label_app or not self._labelfs.label_app.reads:
             raise FSError("no application to read label for filesystem %s" % self.type)
 
@@ -885,6 +919,7 @@ class Ext2FS(FS):
     _dump = True
     _check = True
     _infofs = "dumpe2fs"
+    _superblockType = "ext2"
     _defaultInfoOptions = ["-h"]
     _existingSizeFields = ["Block count:", "Block size:"]
     _fsProfileSpecifier = "-T"
@@ -921,25 +956,32 @@ class Ext2FS(FS):
         blockSize = None
 
         if self.exists and os.path.exists(self.device):
-            if info is None:
-                # get block size
-                info = self._getFSInfo()
+            sb = self._getSuperblock()
+            if sb is not None:
+                blockSize = sb.block_size
+                self.dirty = sb.dirty
+                self.errors = sb.errors
+            else:
+                if info is None:
+                    # get block size
+                    info = self._getFSInfo()
 
-            for line in info.splitlines():
-                if line.startswith("Block size:"):
-                    blockSize = int(line.split(" ")[-1])
+                for line in info.splitlines():
+                    if line.startswith("Block size:"):
+                        blockSize = int(line.split(" ")[-1])
 
-                if line.startswith("Filesystem state:"):
-                    self.dirty = "not clean" in line
-                    self.errors = "with errors" in line
+                    if line.startswith("Filesystem state:"):
+                        self.dirty = "not clean" in line
+                        self.errors = "with errors" in line
 
             if blockSize is None:
                 raise FSError("failed to get block size for %s filesystem "
                               "on %s" % (self.mountType, self.device))
 
             # get minimum size according to resize2fs
-            buf = util.capture_output([self.resizefsProg,
-                                       "-P", self.device])
+            buf = probecache.capture_output(self.device,
+                                            [self.resizefsProg,
+                                             "-P", self.device])
             for line in buf.splitlines():
                 # line will look like:
                 # Estimated minimum size of the filesystem: 1148649
@@ -1026,6 +1068,7 @@ class FATFS(FS):
     _formattable = True
     _maxSize = Size("1 TiB")
     _packages = [ "dosfstools" ]
+    _superblockType = "vfat"
     _defaultMountOptions = ["umask=0077", "shortname=winnt"]
     # FIXME this should be fat32 in some cases
     partedSystem = fileSystemType["fat16"]
@@ -1066,6 +1109,7 @@ class BTRFS(FS):
     _maxLabelChars = 256
     _supported = True
     _packages = ["btrfs-progs"]
+    _superblockType = "btrfs"
     _minSize = Size("256 MiB")
     _maxSize = Size("16 TiB")
     # FIXME parted needs to be taught about btrfs so that we can set the
@@ -1230,6 +1274,7 @@ class XFS(FS):
     _supported = True
     _packages = ["xfsprogs"]
     _infofs = "xfs_db"
+    _superblockType = "xfs"
     _defaultInfoOptions = ["-c", "\"sb 0\"", "-c", "\"p dblocks\"",
                            "-c", "\"p blocksize\""]
     _existingSizeFields = ["dblocks =", "blocksize ="]
@@ -1348,7 +1393,8 @@ class NTFS(FS):
         if self.exists and os.path.exists(self.device) and \
            util.find_program_in_path(self.resizefsProg):
             minSize = None
-            buf = util.capture_output([self.resizefsProg, "-m", self.device])
+            buf = probecache.capture_output(self.device,
+                                            [self.resizefsProg, "-m", self.device])
             for l in buf.split("\n"):
                 if not l.startswith("Minsize"):
                     continue
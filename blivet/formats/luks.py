@@ -32,6 +32,7 @@ except ImportError:
 from ..storage_log import log_method_call
 from ..errors import LUKSError
 from ..devicelibs import crypto
+from ..probecache import probe_cache
 from . import DeviceFormat, register_device_format
 from ..flags import flags
 from ..i18n import _, N_
@@ -164,7 +165,25 @@ class LUKS(DeviceFormat):
 
             cipher mode, key size
         """
-        raise NotImplementedError("probe method not defined for LUKS")
+        log_method_call(self, device=self.device,
+                        type=self.type, status=self.status)
+        if not self.exists:
+            raise LUKSError("format has not been created")
+
+        try:
+            header = probe_cache.probe(self.device, "luksheader",
+                                       crypto.luks_header, self.device)
+        except IOError as e:
+            raise LUKSError("failed to read LUKS header on %s: %s"
+                            % (self.device, e))
+
+        if header is None:
+            raise LUKSError("no LUKS header on %s" % self.device)
+
+        if self.uuid is None:
+            self.uuid = header.uuid
+        self.cipher = header.cipher
+        self.key_size = header.key_size
 
     def setup(self, *args, **kwargs):
         """ Open the encrypted block device.
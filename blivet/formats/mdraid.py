@@ -26,6 +26,7 @@ from ..storage_log import log_method_call
 from parted import PARTITION_RAID
 from ..errors import MDMemberError
 from ..devicelibs import mdraid
+from ..probecache import probe_cache
 from . import DeviceFormat, register_device_format
 from ..flags import flags
 from ..i18n import N_
@@ -85,7 +86,8 @@ class MDRaidMember(DeviceFormat):
         if not self.exists:
             raise MDMemberError("format does not exist")
 
-        info = mdraid.mdexamine(self.device)
+        info = probe_cache.probe(self.device, "mdexamine",
+                                 mdraid.mdexamine, self.device)
         if self.uuid is None:
             self.uuid = info['uuid']
         if self.raidMinor is None:
@@ -0,0 +1,235 @@
+# instrumentation.py
+# Timing of the phases of populate and processActions, and of the external
+# programs they run.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+from .flags import flags
+
+import logging
+log = logging.getLogger("blivet")
+
+class Span(object):
+    """ A timed phase, as yielded by :meth:`Recorder.span`.
+
+        The name and detail can still be changed inside the span, e.g. once
+        the kind of device being added is known.
+    """
+    def __init__(self, name, detail=None):
+        self.name = name
+        self.detail = detail
+        self.start = time.time()
+
+class Recorder(object):
+    """ Time spent in named phases and in external programs.
+
+        Phases are timed with :meth:`span` or :meth:`timed`. Their names are
+        dotted paths, like "populate.udev", and phases may nest, so the time
+        of an inner phase is also part of the time of the phase around it.
+        Every program run by :func:`~.util.run_program` and friends is
+        counted by the name of the program.
+
+        Only the last :attr:`maxEvents` runs of phases with a detail are
+        kept individually, so a long running process does not keep an ever
+        growing list of them.
+
+        Nothing is recorded unless :attr:`~.flags.Flags.instrumentation` is
+        set.
+    """
+    maxEvents = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """ Drop everything recorded so far. """
+        with self._lock:
+            self._started = time.time()
+            self._spans = {}
+            self._commands = {}
+            self._events = collections.deque(maxlen=self.maxEvents)
+            self._dropped = 0
+
+    @contextlib.contextmanager
+    def span(self, name, detail=None):
+        """ A context in which the phase name runs.
+
+            :param str name: the name of the phase
+            :keyword str detail: what this run of the phase is about, like
+                                 the action being executed; runs with a
+                                 detail are also kept individually
+        """
+        if not flags.instrumentation:
+            yield Span(name, detail)
+            return
+
+        span = Span(name, detail)
+        try:
+            yield span
+        finally:
+            self.record(span.name, time.time() - span.start,
+                        detail=span.detail, start=span.start)
+
+    def timed(self, name):
+        """ Return a decorator that runs a function as the phase name. """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not flags.instrumentation:
+                    return func(*args, **kwargs)
+
+                with self.span(name):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def record(self, name, seconds, detail=None, start=None):
+        """ Add a run of the phase name that took seconds. """
+        with self._lock:
+            stats = self._spans.setdefault(name, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            if detail is not None:
+                if len(self._events) == self._events.maxlen:
+                    self._dropped += 1
+
+                self._events.append((name, detail,
+                                     (start or time.time()) - self._started,
+                                     seconds))
+
+    def command(self, argv, seconds, returncode):
+        """ Add a run of an external program.
+
+            :param argv: the program's command line
+            :type argv: list of str
+            :param float seconds: the program's wall clock time
+            :param returncode: its exit code, or None if it could not be run
+            :type returncode: int or NoneType
+        """
+        if not flags.instrumentation:
+            return
+
+        program = os.path.basename(argv[0]) if argv else ""
+        with self._lock:
+            stats = self._commands.setdefault(program, [0, 0.0, {}])
+            stats[0] += 1
+            stats[1] += seconds
+            codes = stats[2]
+            codes[returncode] = codes.get(returncode, 0) + 1
+
+    def toDict(self):
+        """ Return everything recorded so far.
+
+            :rtype: dict
+
+            The result has the keys "spans", with the count, total and
+            maximum seconds of each phase, "events", with the individual runs
+            of phases that had a detail, "dropped", the number of those runs
+            that were dropped to keep only the last :attr:`maxEvents`, and
+            "commands", with the count, total seconds and exit codes of each
+            program.
+        """
+        with self._lock:
+            spans = dict((name, {"count": c, "seconds": s, "max": m})
+                         for (name, (c, s, m)) in self._spans.items())
+            events = [{"name": name, "detail": detail, "start": start,
+                       "seconds": seconds}
+                      for (name, detail, start, seconds) in self._events]
+            dropped = self._dropped
+            commands = dict((program,
+                             {"count": c, "seconds": s,
+                              "returncodes": dict((str(code), n)
+                                                  for (code, n) in codes.items())})
+                            for (program, (c, s, codes)) in self._commands.items())
+
+        return {"spans": spans, "events": events, "dropped": dropped,
+                "commands": commands}
+
+    def toJSON(self):
+        """ Return :meth:`toDict` as a JSON string. """
+        return json.dumps(self.toDict(), indent=2, sort_keys=True)
+
+    def save(self, path):
+        """ Write :meth:`toJSON` to the file at path. """
+        with open(path, "w") as f:
+            f.write(self.toJSON())
+
+    def summary(self, events=True):
+        """ Return everything recorded so far as lines of text.
+
+            :keyword bool events: whether to include a line for each run of
+                                  a phase with a detail
+            :rtype: list of str
+        """
+        data = self.toDict()
+        lines = []
+        for (name, stats) in sorted(data["spans"].items()):
+            lines.append("%-40s %6d x %9.3f s (max %.3f s)"
+                         % (name, stats["count"], stats["seconds"],
+                            stats["max"]))
+
+        for event in (data["events"] if events else []):
+            lines.append("  %s: %s: %.3f s" % (event["name"], event["detail"],
+                                              event["seconds"]))
+
+        commands = sorted(data["commands"].items(),
+                          key=lambda item: item[1]["seconds"], reverse=True)
+        for (program, stats) in commands:
+            failures = sum(n for (code, n) in stats["returncodes"].items()
+                           if code != "0")
+            lines.append("command %-32s %6d x %9.3f s, %d failed"
+                         % (program, stats["count"], stats["seconds"],
+                            failures))
+
+        return lines
+
+    def logSummary(self):
+        """ Log the totals, and at debug level each run with a detail. """
+        for line in self.summary(events=False):
+            log.info("instrumentation: %s", line)
+
+        if log.isEnabledFor(logging.DEBUG):
+            data = self.toDict()
+            if data["dropped"]:
+                log.debug("instrumentation: %d earlier runs dropped",
+                          data["dropped"])
+
+            for event in data["events"]:
+                log.debug("instrumentation:   %s: %s: %.3f s", event["name"],
+                          event["detail"], event["seconds"])
+
+        if flags.instrumentation_file:
+            try:
+                self.save(flags.instrumentation_file)
+            except IOError as e:
+                log.error("failed to write %s: %s",
+                          flags.instrumentation_file, e)
+
+recorder = Recorder()
@@ -36,6 +36,9 @@ from .i18n import _
 import logging
 log = logging.getLogger("blivet")
 
+# bootable partitions must end below this, regardless of disklabel
+MAX_BOOT_PART_END = Size("2 TiB")
+
 def _getCandidateDisks(storage):
     """ Return a list of disks to be used for autopart.
 
@@ -594,7 +597,7 @@ def getBestFreeSpaceRegion(disk, part_type, req_size, start=None,
             continue
 
         if boot:
-            max_boot = Size("2 TiB")
+            max_boot = MAX_BOOT_PART_END
             free_start = Size(free_geom.start * disk.device.sectorSize)
             req_end = free_start + req_size
             if req_end > max_boot:
@@ -1622,7 +1625,7 @@ class DiskChunk(Chunk):
 
         # 2TB limit on bootable partitions, regardless of disklabel
         if req.device.req_bootable:
-            max_boot = sizeToSectors(Size("2 TiB"), self.sectorSize)
+            max_boot = sizeToSectors(MAX_BOOT_PART_END, self.sectorSize)
             limits.append(max_boot - req_end)
 
         # request-specific maximum (see Request.__init__, above, for details)
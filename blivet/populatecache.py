@@ -0,0 +1,301 @@
+# populatecache.py
+# Persistent cache of the information gathered to populate a device tree.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+import copy
+import hashlib
+import json
+import os
+import stat
+import threading
+
+import logging
+log = logging.getLogger("blivet")
+
+# bump this when the format of the cache file changes
+CACHE_VERSION = 3
+
+# how much of the start and the end of a device goes into its fingerprint;
+# this covers the superblocks and labels of the formats blivet probes,
+# including md metadata at the end of a device and lvm's metadata header
+HEAD_SIZE = 68 * 1024
+TAIL_SIZE = 128 * 1024
+
+def _str(value):
+    """ Convert the unicode strings json returns back to str. """
+    if isinstance(value, unicode):
+        return value.encode("utf-8")
+    elif isinstance(value, list):
+        return [_str(v) for v in value]
+    elif isinstance(value, dict):
+        return dict((_str(k), _str(v)) for (k, v) in value.items())
+    return value
+
+def _jsonable(value):
+    """ Return True if value comes back unchanged from json, bar unicode. """
+    if value is None or isinstance(value, (str, unicode, bool, int, long, float)):
+        return True
+    elif type(value) is list:
+        return all(_jsonable(v) for v in value)
+    elif type(value) is dict:
+        return all(isinstance(k, (str, unicode)) and _jsonable(v)
+                   for (k, v) in value.items())
+    return False
+
+def sysfs_path_of(path):
+    """ Return the sysfs path, without /sys, of the block device at path.
+
+        :param str path: the device node
+        :returns: the sysfs path, or None if path is not a block device
+        :rtype: str or None
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    if not stat.S_ISBLK(st.st_mode):
+        return None
+
+    link = "/sys/dev/block/%d:%d" % (os.major(st.st_rdev), os.minor(st.st_rdev))
+    if not os.path.exists(link):
+        return None
+
+    return os.path.realpath(link)[len("/sys"):]
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except IOError:
+        return None
+
+def _pread(fd, size, offset):
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
+
+def device_fingerprint(sysfs_path):
+    """ Return a string that changes whenever a block device changes.
+
+        :param str sysfs_path: the device's sysfs path, without /sys
+        :returns: the fingerprint, or None if the device cannot be read
+        :rtype: str or None
+
+        The fingerprint combines the device's major:minor, its size, the
+        time udev initialized it and a checksum of the start and the end of
+        its contents, where formats keep their superblocks.
+    """
+    devnum = _read("/sys%s/dev" % sysfs_path)
+    size = _read("/sys%s/size" % sysfs_path)
+    if not devnum or size is None:
+        return None
+
+    devnum = devnum.strip()
+    size = size.strip()
+    initialized = None
+    for line in (_read("/run/udev/data/b%s" % devnum) or "").splitlines():
+        if line.startswith("I:"):
+            initialized = line[2:]
+            break
+
+    checksum = hashlib.sha1()
+    try:
+        fd = os.open("/dev/block/%s" % devnum, os.O_RDONLY)
+    except OSError:
+        return None
+
+    try:
+        end = os.lseek(fd, 0, os.SEEK_END)
+        checksum.update(_pread(fd, HEAD_SIZE, 0))
+        if end > HEAD_SIZE:
+            tail = max(HEAD_SIZE, end - TAIL_SIZE)
+            checksum.update(_pread(fd, end - tail, tail))
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+    return "%s:%s:%s:%s" % (devnum, size, initialized, checksum.hexdigest())
+
+class PopulateCache(object):
+    """ Information gathered while populating a device tree, saved to disk.
+
+        Each device's udev information and probe results are stored with
+        the device's fingerprint (see :func:`device_fingerprint`). When the
+        next process populates its tree, the information for a device is
+        reused as long as its fingerprint has not changed, and only devices
+        that changed are queried and probed again. Information about the
+        system as a whole, like lvm's reports, is reused only if none of
+        the devices changed.
+
+        The probes of formats made through
+        :data:`~.probecache.probe_cache`, like the output of filesystem info
+        programs and md metadata, are stored too, see :meth:`probeDevice`.
+        Only results that json can represent are stored. The superblocks
+        and LUKS headers blivet reads itself are not, since reading them
+        costs less than the fingerprint does. Neither are device sizes and
+        disklabels, which come from parted objects that are needed for
+        partitioning anyway and cannot be saved.
+
+        Fingerprints are computed at most once per device and instance, so
+        an instance should only be used for a single populate.
+    """
+    def __init__(self, path):
+        """
+            :param str path: the file the cache is stored in
+        """
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._saved = {"devices": {}, "system": {}}
+        self._devices = {}
+        self._system = {}
+        self._fingerprints = {}
+
+        try:
+            with open(path) as f:
+                saved = _str(json.load(f))
+        except (IOError, ValueError) as e:
+            log.debug("not using device tree cache %s: %s", path, e)
+        else:
+            if saved.get("version") == CACHE_VERSION:
+                self._saved = saved
+
+    def fingerprint(self, sysfs_path):
+        """ Return a device's fingerprint, computing it the first time. """
+        with self._lock:
+            if sysfs_path in self._fingerprints:
+                return self._fingerprints[sysfs_path]
+
+        fingerprint = device_fingerprint(sysfs_path)
+        with self._lock:
+            self._fingerprints[sysfs_path] = fingerprint
+
+        return fingerprint
+
+    def _getEntry(self, sysfs_path):
+        """ Return the current entry for a device, or None if it cannot be cached. """
+        fingerprint = self.fingerprint(sysfs_path)
+        if fingerprint is None:
+            return None
+
+        with self._lock:
+            entry = self._devices.get(sysfs_path)
+            if entry is None:
+                entry = self._saved["devices"].get(sysfs_path)
+                if not entry or entry.get("fingerprint") != fingerprint:
+                    entry = {"fingerprint": fingerprint}
+
+                self._devices[sysfs_path] = entry
+
+        return entry
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def probe(self, sysfs_path, key, func, *args):
+        """ Return the result of a probe of a device, cached.
+
+            :param str sysfs_path: the device's sysfs path
+            :param str key: the name of the probe
+            :param func: the probe
+            :type func: callable
+            :param args: arguments to call func with
+
+            The result is a copy, which the caller is free to modify.
+            Results that json cannot represent, like tuples, are not cached.
+        """
+        entry = self._getEntry(sysfs_path)
+        if entry is None:
+            return func(*args)
+
+        hit = key in entry
+        self._count(hit)
+        if hit:
+            return copy.deepcopy(entry[key])
+
+        result = func(*args)
+        if _jsonable(result):
+            entry[key] = copy.deepcopy(result)
+
+        return result
+
+    def probeDevice(self, path, key, func, *args):
+        """ Return the result of a probe of the device node path, cached.
+
+            This is :meth:`probe` for callers that only know the device's
+            node, like :class:`~.probecache.ProbeCache`.
+        """
+        sysfs_path = sysfs_path_of(path)
+        if sysfs_path is None:
+            return func(*args)
+
+        return self.probe(sysfs_path, key, func, *args)
+
+    def probeSystem(self, key, func, *args):
+        """ Return the result of a probe of all the devices, cached.
+
+            :param str key: the name of the probe
+            :param func: the probe; its result must be serializable as json
+            :type func: callable
+            :param args: arguments to call func with
+
+            The result is reused only if the same devices were fingerprinted
+            as when it was stored, and none of their fingerprints changed.
+        """
+        with self._lock:
+            fingerprints = sorted(self._fingerprints.items())
+
+        if not fingerprints or None in (f for (_p, f) in fingerprints):
+            return func(*args)
+
+        state = hashlib.sha1(repr(fingerprints)).hexdigest()
+        entry = self._system.get(key)
+        if entry is None:
+            entry = self._saved["system"].get(key)
+
+        hit = entry is not None and entry["state"] == state
+        self._count(hit)
+        if not hit:
+            entry = {"state": state, "value": func(*args)}
+
+        self._system[key] = entry
+        return copy.deepcopy(entry["value"])
+
+    def save(self):
+        """ Write the entries used since the cache was loaded to disk.
+
+            Devices that were not looked up are dropped from the cache.
+        """
+        data = {"version": CACHE_VERSION,
+                "devices": self._devices,
+                "system": self._system}
+        tmp = "%s.%d" % (self.path, os.getpid())
+        try:
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+            os.rename(tmp, self.path)
+        except (IOError, OSError) as e:
+            log.warning("failed to save device tree cache %s: %s", self.path, e)
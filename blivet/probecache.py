@@ -0,0 +1,203 @@
+# probecache.py
+# Memoization of read-only probes of block devices.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+import contextlib
+import copy
+import os
+import stat
+import threading
+
+from . import util
+from .flags import flags
+
+import logging
+log = logging.getLogger("blivet")
+
+def change_token(path):
+    """ Return a value that changes whenever the device at path changes.
+
+        :param str path: a device node or image file
+        :returns: the token, or None if path does not exist
+        :rtype: tuple or None
+
+        For block devices this is the device's major:minor, its size and the
+        time udev last wrote its database entry, which happens whenever udev
+        processes an event for the device. For files it is the inode, size
+        and modification time.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    if not stat.S_ISBLK(st.st_mode):
+        return (st.st_ino, st.st_size, st.st_mtime)
+
+    devnum = "%d:%d" % (os.major(st.st_rdev), os.minor(st.st_rdev))
+    try:
+        with open("/sys/dev/block/%s/size" % devnum) as f:
+            size = f.read().strip()
+    except IOError:
+        size = None
+
+    try:
+        updated = os.stat("/run/udev/data/b%s" % devnum).st_mtime
+    except OSError:
+        updated = None
+
+    return (devnum, size, updated)
+
+class ProbeCache(object):
+    """ Results of read-only probes of devices, like a filesystem's info.
+
+        A result is reused until the device's change token (see
+        :func:`change_token`) changes or the device is invalidated. While
+        an action executes, the devices it touches are not cached at all,
+        see :meth:`invalidating`.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._busy = {}
+        self._stats = {}
+
+        self.store = None
+        """ a :class:`~.populatecache.PopulateCache` results are read from
+            and saved to when they are not in memory """
+
+    def _count(self, key, hit):
+        stats = self._stats.setdefault(key, [0, 0])
+        stats[0 if hit else 1] += 1
+
+    def probe(self, device, key, func, *args):
+        """ Return func(*args), cached for device.
+
+            :param str device: the path of the device func probes
+            :param str key: the name of the probe
+            :param func: the probe
+            :type func: callable
+            :param args: arguments to call func with
+
+            Results are copies, which the caller is free to modify.
+            Exceptions raised by func are not cached.
+        """
+        if not flags.probe_cache:
+            return func(*args)
+
+        with self._lock:
+            busy = device in self._busy
+
+        token = None if busy else change_token(device)
+        if token is None:
+            return func(*args)
+
+        with self._lock:
+            entry = self._entries.get(device)
+            if entry is None or entry[0] != token:
+                entry = (token, {})
+                self._entries[device] = entry
+
+            results = entry[1]
+            hit = key in results
+            self._count(key, hit)
+            if hit:
+                return copy.deepcopy(results[key])
+
+        store = self.store
+        if store is not None:
+            result = store.probeDevice(device, key, func, *args)
+        else:
+            result = func(*args)
+
+        with self._lock:
+            # skip the result if the device was invalidated meanwhile
+            if self._entries.get(device) is entry:
+                results[key] = copy.deepcopy(result)
+
+        return result
+
+    def invalidate(self, devices):
+        """ Drop the cached results for devices.
+
+            :param devices: paths of devices
+            :type devices: list of str
+        """
+        with self._lock:
+            for device in devices:
+                self._entries.pop(device, None)
+
+    def clear(self):
+        """ Drop all of the cached results. """
+        with self._lock:
+            self._entries.clear()
+
+    @contextlib.contextmanager
+    def invalidating(self, devices):
+        """ A context in which devices change.
+
+            :param devices: paths of devices
+            :type devices: list of str
+
+            The devices are invalidated on entry and exit, and probes of
+            them in between are run without the cache.
+        """
+        devices = list(devices)
+        with self._lock:
+            for device in devices:
+                self._entries.pop(device, None)
+                self._busy[device] = self._busy.get(device, 0) + 1
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                for device in devices:
+                    self._entries.pop(device, None)
+                    self._busy[device] -= 1
+                    if not self._busy[device]:
+                        del self._busy[device]
+
+    @property
+    def stats(self):
+        """ Hits and misses for each kind of probe.
+
+            :returns: (hits, misses) tuples by probe name
+            :rtype: dict
+        """
+        with self._lock:
+            return dict((key, tuple(s)) for (key, s) in self._stats.items())
+
+    def resetStats(self):
+        with self._lock:
+            self._stats.clear()
+
+    def logStats(self):
+        for (key, (hits, misses)) in sorted(self.stats.items()):
+            log.debug("probe cache: %s: %d hits, %d misses", key, hits, misses)
+
+probe_cache = ProbeCache()
+
+def capture_output(device, argv):
+    """ Return :func:`~.util.capture_output` for argv, a probe of device.
+
+        The command line, without the device, is the probe's name.
+    """
+    key = " ".join(arg for arg in argv if arg != device)
+    return probe_cache.probe(device, key, util.capture_output, argv)
@@ -3,7 +3,7 @@ from __future__ import print_function
 import sys
 import os
 import fnmatch
-from ctypes import CDLL, c_char_p, c_int, c_void_p
+from ctypes import CDLL, c_char_p, c_int, c_ulonglong, c_void_p
 
 
 # XXX this one may need some tweaking...
@@ -105,6 +105,32 @@ libudev_udev_device_get_devlinks_list_entry = libudev.udev_device_get_devlinks_l
 libudev_udev_device_get_devlinks_list_entry.restype = c_void_p
 libudev_udev_device_get_devlinks_list_entry.argtypes = [ c_void_p ]
 
+libudev_udev_device_get_action = libudev.udev_device_get_action
+libudev_udev_device_get_action.restype = c_char_p
+libudev_udev_device_get_action.argtypes = [ c_void_p ]
+libudev_udev_device_get_seqnum = libudev.udev_device_get_seqnum
+libudev_udev_device_get_seqnum.restype = c_ulonglong
+libudev_udev_device_get_seqnum.argtypes = [ c_void_p ]
+
+libudev_udev_monitor_new_from_netlink = libudev.udev_monitor_new_from_netlink
+libudev_udev_monitor_new_from_netlink.restype = c_void_p
+libudev_udev_monitor_new_from_netlink.argtypes = [ c_void_p, c_char_p ]
+libudev_udev_monitor_unref = libudev.udev_monitor_unref
+libudev_udev_monitor_unref.argtypes = [ c_void_p ]
+
+libudev_udev_monitor_filter_add_match_subsystem_devtype = libudev.udev_monitor_filter_add_match_subsystem_devtype
+libudev_udev_monitor_filter_add_match_subsystem_devtype.restype = c_int
+libudev_udev_monitor_filter_add_match_subsystem_devtype.argtypes = [ c_void_p, c_char_p, c_char_p ]
+libudev_udev_monitor_enable_receiving = libudev.udev_monitor_enable_receiving
+libudev_udev_monitor_enable_receiving.restype = c_int
+libudev_udev_monitor_enable_receiving.argtypes = [ c_void_p ]
+libudev_udev_monitor_get_fd = libudev.udev_monitor_get_fd
+libudev_udev_monitor_get_fd.restype = c_int
+libudev_udev_monitor_get_fd.argtypes = [ c_void_p ]
+libudev_udev_monitor_receive_device = libudev.udev_monitor_receive_device
+libudev_udev_monitor_receive_device.restype = c_void_p
+libudev_udev_monitor_receive_device.argtypes = [ c_void_p ]
+
 
 class UdevDevice(dict):
 
@@ -167,6 +193,56 @@ class UdevDevice(dict):
         libudev_udev_device_unref(udev_device)
 
 
+class UdevMonitor(object):
+    """ A netlink socket receiving uevents.
+
+        Monitors named "kernel" receive events as the kernel sends them,
+        monitors named "udev" receive them once udev has processed them.
+        The socket does not block; :meth:`receive_device` returns None when
+        there are no more events to read.
+    """
+
+    def __init__(self, udev, name="udev", subsystem=None):
+        self.monitor = libudev_udev_monitor_new_from_netlink(udev, name)
+        if not self.monitor:
+            raise OSError("unable to create the %s monitor" % name)
+
+        if subsystem is not None:
+            rc = libudev_udev_monitor_filter_add_match_subsystem_devtype(self.monitor,
+                                                                         subsystem,
+                                                                         None)
+            if not rc == 0:
+                self.unref()
+                raise OSError("unable to add the match subsystem")
+
+        rc = libudev_udev_monitor_enable_receiving(self.monitor)
+        if not rc == 0:
+            self.unref()
+            raise OSError("unable to enable receiving on the %s monitor" % name)
+
+    def fileno(self):
+        return libudev_udev_monitor_get_fd(self.monitor)
+
+    def receive_device(self):
+        """ Return (action, seqnum, syspath) of the next event, or None. """
+        udev_device = libudev_udev_monitor_receive_device(self.monitor)
+        if not udev_device:
+            return None
+
+        event = (libudev_udev_device_get_action(udev_device),
+                 libudev_udev_device_get_seqnum(udev_device),
+                 libudev_udev_device_get_syspath(udev_device))
+
+        # cleanup
+        libudev_udev_device_unref(udev_device)
+
+        return event
+
+    def unref(self):
+        libudev_udev_monitor_unref(self.monitor)
+        self.monitor = None
+
+
 class Udev(object):
 
     def __init__(self):
@@ -175,6 +251,9 @@ class Udev(object):
     def create_device(self, sysfs_path):
         return UdevDevice(self.udev, sysfs_path)
 
+    def create_monitor(self, name="udev", subsystem=None):
+        return UdevMonitor(self.udev, name=name, subsystem=subsystem)
+
     def enumerate_devices(self, subsystem=None):
         context = libudev_udev_enumerate_new(self.udev)
 
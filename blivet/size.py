@@ -19,14 +19,15 @@
 #
 # Red Hat Author(s): David Cantrell <dcantrell@redhat.com>
 
+import os
 import re
 import string
 import locale
-from collections import namedtuple
+import threading
+from collections import namedtuple, OrderedDict
 
 from decimal import Decimal
 from decimal import InvalidOperation
-from decimal import ROUND_DOWN
 
 from .errors import SizePlacesError
 from .i18n import _, P_, N_
@@ -60,23 +61,81 @@ _binaryPrefixes = [_Prefix(1024, N_("kibi"), N_("Ki")),
 _bytes = [N_('B'), N_('b'), N_('byte'), N_('bytes')]
 _prefixes = _binaryPrefixes + _decimalPrefixes
 
-# Translated versions of the byte and prefix arrays
-# All strings are decoded as utf-8 so that locale-specific upper/lower functions work
-def _xlated_bytes():
-    """Return a translated version of the bytes list as a list of unicode strings"""
-    return [_(b).decode("utf-8") for b in _bytes]
+# How many parsed specs and human readable strings to remember
+SPEC_CACHE_SIZE = 1024
+HUMAN_READABLE_CACHE_SIZE = 4096
+
+class _LRUCache(object):
+    """ A bounded mapping that forgets its least recently used entries. """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the value for key, or None if there is none. """
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                return None
+
+            self._entries[key] = value
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_specCache = _LRUCache(SPEC_CACHE_SIZE)
+_humanReadableCache = _LRUCache(HUMAN_READABLE_CACHE_SIZE)
+
+def _localeKey():
+    """ Return a value identifying the current locale.
+
+        This covers everything parsing and formatting sizes depends on: the
+        radix character and the environment variables gettext consults.
+    """
+    return (locale.nl_langinfo(locale.RADIXCHAR),
+            os.environ.get("LANGUAGE"), os.environ.get("LC_ALL"),
+            os.environ.get("LC_MESSAGES"), os.environ.get("LANG"))
+
+# Translated versions of the byte and prefix arrays, by locale
+_xlatedTables = {}
 
-def _xlated_binary_prefixes():
-    return (_Prefix(p.factor, _(p.prefix).decode("utf-8"), _(p.abbr).decode("utf-8")) \
-            for p in _binaryPrefixes)
+def _xlatedTable(key):
+    """ Return the translated bytes, prefixes and specs for a locale.
 
-def _xlated_prefixes():
-    """Return translated prefixes as unicode strings"""
-    xlated_binary = list(_xlated_binary_prefixes())
-    xlated_decimal = [_Prefix(p.factor, _(p.prefix).decode("utf-8"), _(p.abbr).decode("utf-8")) \
-                      for p in _decimalPrefixes]
+        :param key: the locale, as returned by :func:`_localeKey`
+        :returns: the translated bytes list, the translated prefixes and a
+                  dict of translated specifiers to their factors
+        :rtype: tuple
 
-    return xlated_binary + xlated_decimal
+        All strings are decoded as utf-8 so that locale-specific upper/lower
+        functions work.
+    """
+    table = _xlatedTables.get(key)
+    if table is None:
+        xlated_bytes = [_(b).decode("utf-8") for b in _bytes]
+        xlated_prefixes = [_Prefix(p.factor, _(p.prefix).decode("utf-8"),
+                                   _(p.abbr).decode("utf-8"))
+                           for p in _binaryPrefixes + _decimalPrefixes]
+        # earlier entries win, as when checking the lists in order
+        specs = {}
+        for (factor, prefix, abbr) in reversed(xlated_prefixes):
+            specs.update((spec, factor) for spec in _makeSpecs(prefix, abbr, True))
+        specs.update((b, 1) for b in xlated_bytes)
+
+        table = (xlated_bytes, xlated_prefixes, specs)
+        _xlatedTables[key] = table
+
+    return table
 
 _ASCIIlower_table = string.maketrans(string.ascii_uppercase, string.ascii_lowercase)
 def _lowerASCII(s):
@@ -105,6 +164,17 @@ def _makeSpecs(prefix, abbr, xlate):
 
     return specs
 
+def _asciiSpecTable():
+    """ Return a dict of English specifiers to their factors. """
+    # earlier entries win, as when checking the lists in order
+    specs = {}
+    for (factor, prefix, abbr) in reversed(_prefixes):
+        specs.update((spec, factor) for spec in _makeSpecs(prefix, abbr, False))
+    specs.update((b, 1) for b in _bytes + [""])
+    return specs
+
+_asciiSpecs = _asciiSpecTable()
+
 def _parseSpec(spec):
     """ Parse string representation of size. """
     if not spec:
@@ -146,14 +216,9 @@ def _parseSpec(spec):
         if spec_ascii and not spec_ascii.endswith("b"):
             spec_ascii += "ib"
 
-        if spec_ascii in _bytes or not spec_ascii:
-            return size
-
-        for factor, prefix, abbr in _prefixes:
-            check = _makeSpecs(prefix, abbr, False)
-
-            if spec_ascii in check:
-                return size * factor
+        factor = _asciiSpecs.get(spec_ascii)
+        if factor is not None:
+            return size * factor
 
     # No English match found, try localized size specs. Accept any utf-8
     # character and leave the result as a unicode object.
@@ -162,26 +227,41 @@ def _parseSpec(spec):
     # Use the locale-specific lowercasing
     spec_local = spec_local.lower()
 
-    if spec_local in _xlated_bytes():
-        return size
-
-    for factor, prefix, abbr in _xlated_prefixes():
-        check  = _makeSpecs(prefix, abbr, True)
-
-        if spec_local in check:
-            return size * factor
+    factor = _xlatedTable(_localeKey())[2].get(spec_local)
+    if factor is not None:
+        return size * factor
 
     raise ValueError("invalid size specification", spec)
 
-class Size(Decimal):
+def _truncate(value):
+    """ Return value as a whole number of bytes, dropping any partial byte. """
+    if isinstance(value, float):
+        value = Decimal(value)
+    # long() rounds toward zero, like Decimal's ROUND_DOWN
+    return long(value)
+
+def _divide(a, b):
+    """ Divide whole numbers, rounding toward zero like Decimal does. """
+    (q, r) = divmod(a, b)
+    if q < 0 and r:
+        q += 1
+    return q
+
+class Size(object):
     """ Common class to represent storage device and filesystem sizes.
         Can handle parsing strings such as 45MB or 6.7GB to initialize
         itself, or can be initialized with a numerical size in bytes.
         Also generates human readable strings to a specified number of
         decimal places.
+
+        A Size holds a whole number of bytes. Adding, subtracting,
+        multiplying, dividing or taking the modulus of a Size yields a new
+        Size, dropping any partial byte. Other operations, like negation or
+        dividing a plain number by a Size, yield a :class:`~decimal.Decimal`.
     """
+    __slots__ = ("_bytes",)
 
-    def __new__(cls, value=0, context=None):
+    def __new__(cls, value=0):
         """ Initialize a new Size object.  Must pass a bytes or a spec value
             for size. The bytes value is a numerical value for the size
             this object represents, in bytes.  The spec value is a string
@@ -199,50 +279,160 @@ class Size(Decimal):
             If you want to use a spec value to represent a bytes value,
             you can use the letter 'b' or 'B' or omit the size specifier.
         """
-        if isinstance(value, (unicode, str)):
-            size = _parseSpec(value)
-        elif isinstance(value, (int, long, float, Decimal)):
-            size = Decimal(value)
+        if isinstance(value, (int, long)):
+            value = long(value)
         elif isinstance(value, Size):
-            size = Decimal(value.convertTo("b"))
+            return value
+        elif isinstance(value, (float, Decimal)):
+            value = _truncate(value)
+        elif isinstance(value, (unicode, str)):
+            key = (value, _localeKey())
+            spec = value
+            value = _specCache.get(key)
+            if value is None:
+                value = _truncate(_parseSpec(spec))
+                _specCache.set(key, value)
         else:
             raise ValueError("invalid value %s for size" % value)
 
-        # drop any partial byte
-        size = size.to_integral_value(rounding=ROUND_DOWN)
-        self = Decimal.__new__(cls, value=size)
+        self = object.__new__(cls)
+        self._bytes = value
         return self
 
-    def __str__(self, eng=False, context=None):
+    def __str__(self):
         # Convert the result of humanReadable from unicode to str
         return self.humanReadable()
 
     def __repr__(self):
         return "Size('%s')" % self
 
+    def __reduce__(self):
+        return (Size, (self._bytes,))
+
+    # sizes are immutable
+    def __copy__(self):
+        return self
+
     def __deepcopy__(self, memo):
-        return Size(self.convertTo(spec="b"))
+        return self
 
-    def __add__(self, other, context=None):
-        return Size(Decimal.__add__(self, other, context=context))
+    def __int__(self):
+        return int(self._bytes)
 
-    # needed to make sum() work with Size arguments
-    def __radd__(self, other, context=None):
-        return Size(Decimal.__radd__(self, other, context=context))
+    def __long__(self):
+        return self._bytes
+
+    def __float__(self):
+        return float(self._bytes)
+
+    def __nonzero__(self):
+        return self._bytes != 0
+
+    def __hash__(self):
+        return hash(self._bytes)
 
-    def __sub__(self, other, context=None):
-        # subtraction is implemented using __add__ and negation, so we'll
-        # be getting passed a Size
-        return Decimal.__sub__(self, other, context=context)
+    def __eq__(self, other):
+        if isinstance(other, Size):
+            return self._bytes == other._bytes
+        return self._bytes == other
 
-    def __mul__(self, other, context=None):
-        return Size(Decimal.__mul__(self, other, context=context))
+    def __ne__(self, other):
+        if isinstance(other, Size):
+            return self._bytes != other._bytes
+        return self._bytes != other
 
-    def __div__(self, other, context=None):
-        return Size(Decimal.__div__(self, other, context=context))
+    def __lt__(self, other):
+        if isinstance(other, Size):
+            return self._bytes < other._bytes
+        return self._bytes < other
 
-    def __mod__(self, other, context=None):
-        return Size(Decimal.__mod__(self, other, context=context))
+    def __le__(self, other):
+        if isinstance(other, Size):
+            return self._bytes <= other._bytes
+        return self._bytes <= other
+
+    def __gt__(self, other):
+        if isinstance(other, Size):
+            return self._bytes > other._bytes
+        return self._bytes > other
+
+    def __ge__(self, other):
+        if isinstance(other, Size):
+            return self._bytes >= other._bytes
+        return self._bytes >= other
+
+    def __add__(self, other):
+        if isinstance(other, Size):
+            return Size(self._bytes + other._bytes)
+        elif isinstance(other, (int, long)):
+            return Size(self._bytes + other)
+        elif isinstance(other, (float, Decimal)):
+            return Size(Decimal(self._bytes) + Decimal(other))
+        return NotImplemented
+
+    # needed to make sum() work with Size arguments
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, Size):
+            return Size(self._bytes - other._bytes)
+        elif isinstance(other, (int, long)):
+            return Size(self._bytes - other)
+        elif isinstance(other, (float, Decimal)):
+            return Size(Decimal(self._bytes) - Decimal(other))
+        return NotImplemented
+
+    def __mul__(self, other):
+        if isinstance(other, Size):
+            return Size(self._bytes * other._bytes)
+        elif isinstance(other, (int, long)):
+            return Size(self._bytes * other)
+        elif isinstance(other, (float, Decimal)):
+            return Size(Decimal(self._bytes) * Decimal(other))
+        return NotImplemented
+
+    def __div__(self, other):
+        if isinstance(other, Size):
+            return Size(_divide(self._bytes, other._bytes))
+        elif isinstance(other, (int, long)):
+            return Size(_divide(self._bytes, other))
+        elif isinstance(other, (float, Decimal)):
+            return Size(Decimal(self._bytes) / Decimal(other))
+        return NotImplemented
+
+    __truediv__ = __div__
+
+    def __mod__(self, other):
+        if isinstance(other, Size):
+            other = other._bytes
+        if isinstance(other, (int, long)):
+            if self._bytes >= 0 and other > 0:
+                return Size(self._bytes % other)
+            return Size(self._bytes - other * _divide(self._bytes, other))
+        elif isinstance(other, (float, Decimal)):
+            return Size(Decimal(self._bytes) % Decimal(other))
+        return NotImplemented
+
+    # The remaining operations do not yield sizes.
+    def _decimalOp(name): # pylint: disable=no-self-argument
+        op = getattr(Decimal, name)
+        def _op(self, *args):
+            args = [a._bytes if isinstance(a, Size) else a for a in args]
+            return op(Decimal(self._bytes), *args)
+        _op.__name__ = name
+        return _op
+
+    __rsub__ = _decimalOp("__rsub__")
+    __rmul__ = _decimalOp("__rmul__")
+    __rdiv__ = _decimalOp("__rdiv__")
+    __rtruediv__ = _decimalOp("__rtruediv__")
+    __rmod__ = _decimalOp("__rmod__")
+    __floordiv__ = _decimalOp("__floordiv__")
+    __rfloordiv__ = _decimalOp("__rfloordiv__")
+    __neg__ = _decimalOp("__neg__")
+    __pos__ = _decimalOp("__pos__")
+    __abs__ = _decimalOp("__abs__")
+    del _decimalOp
 
     def convertTo(self, spec="b"):
         """ Return the size in the units indicated by the specifier.  The
@@ -254,13 +444,13 @@ class Size(Decimal):
         spec = spec.lower()
 
         if spec in _bytes:
-            return Decimal(self)
+            return Decimal(self._bytes)
 
         for factor, prefix, abbr in _prefixes:
             check = _makeSpecs(prefix, abbr, False)
 
             if spec in check:
-                return Decimal(self / Decimal(factor))
+                return Decimal(_divide(self._bytes, factor))
 
         return None
 
@@ -276,14 +466,23 @@ class Size(Decimal):
         if max_places is not None and max_places < 0:
             raise SizePlacesError("max_places= must be >=0 or None")
 
-        in_bytes = int(Decimal(self))
+        key = (self._bytes, places, max_places, _localeKey())
+        retval = _humanReadableCache.get(key)
+        if retval is None:
+            retval = self._humanReadable(places, max_places, key[-1])
+            _humanReadableCache.set(key, retval)
+
+        return retval
+
+    def _humanReadable(self, places, max_places, localeKey):
+        in_bytes = self._bytes
         if abs(in_bytes) < 1000:
             return "%d %s" % (in_bytes, _("B"))
 
         prev_prefix = None
-        for prefix_item in _xlated_prefixes():
+        for prefix_item in _xlatedTable(localeKey)[1]:
             factor, prefix, abbr = prefix_item
-            newcheck = super(Size, self).__div__(Decimal(factor))
+            newcheck = Decimal(in_bytes) / factor
 
             if abs(newcheck) < 1000:
                 # nice value, use this factor, prefix and abbr
@@ -296,7 +495,7 @@ class Size(Decimal):
         if abs(newcheck) < 10:
             if prev_prefix is not None:
                 factor, prefix, abbr = prev_prefix # pylint: disable=unpacking-non-sequence
-                newcheck = super(Size, self).__div__(Decimal(factor))
+                newcheck = Decimal(in_bytes) / factor
             else:
                 # less than 10 KiB
                 return "%s %s" % (in_bytes, _("B"))
@@ -0,0 +1,243 @@
+# snapshot.py
+# Snapshots of a device tree that save only the state that changes.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+import copy
+import weakref
+
+import logging
+log = logging.getLogger("blivet")
+
+# snapshots that are saving the state of their members
+_snapshots = weakref.WeakSet()
+
+def willChange(obj):
+    """ Notify the active snapshots that obj is about to change.
+
+        :param obj: the device, format or action about to change
+        :type obj: :class:`~.devices.Device`, :class:`~.formats.DeviceFormat`
+                   or :class:`~.deviceaction.DeviceAction`
+
+        This is called by devices, formats and actions before an attribute is
+        set and before a list of parents, logical volumes or subvolumes is
+        modified. Disklabels call it before handing out their parted disk and
+        partitions before handing out their parted partition, since the parted
+        objects are modified in place.
+    """
+    if not _snapshots:
+        return
+
+    for snapshot in list(_snapshots):
+        snapshot.save(obj)
+
+def _copyContents(value):
+    """ Return a copy of container value, and of the containers in it.
+
+        Anything other than lists, dicts and sets is shared with value.
+    """
+    if isinstance(value, list):
+        new = copy.copy(value)
+        new[:] = [_copyContents(item) for item in value]
+    elif isinstance(value, dict):
+        new = copy.copy(value)
+        for (key, item) in value.items():
+            new[key] = _copyContents(item)
+    elif isinstance(value, set):
+        new = copy.copy(value)
+    else:
+        new = value
+
+    return new
+
+def _contents(value):
+    """ Yield the items in container value, and in the containers in it. """
+    if isinstance(value, dict):
+        value = value.values()
+
+    for item in value:
+        yield item
+        if isinstance(item, (list, dict, set)):
+            for nested in _contents(item):
+                yield nested
+
+class Snapshot(object):
+    """ The state of a :class:`~.Blivet` instance's device tree at some point.
+
+        A snapshot is for undoing changes to the instance it was taken of,
+        like :class:`~.devicefactory.DeviceFactory` does when configuring a
+        device fails. It is not a copy: the devices, formats and actions are
+        shared with the tree, and :meth:`~.Blivet.copy` is still the way to
+        get an instance that can be changed independently.
+
+        Taking a snapshot collects the devices, formats and actions in the
+        tree, its actions and its roots, and those they refer to, and copies
+        the contents of their lists, dicts and sets, since those are changed
+        in place. The first time one of them is about to change otherwise,
+        the snapshot saves its attributes. :meth:`restore` puts the saved
+        state back into the very same objects, so
+        :meth:`~.devicetree.DeviceTree.getDeviceByID` and any other
+        references to them remain valid.
+
+        A snapshot saves state until it is released or garbage collected.
+    """
+    def __init__(self, storage):
+        """
+            :param storage: the instance whose device tree to snapshot
+            :type storage: :class:`~.Blivet`
+        """
+        self.storage = storage
+        tree = storage.devicetree
+        self._devices = tree._devices[:]
+        self._hidden = tree._hidden[:]
+        self._actions = tree._actions[:]
+        self._names = tree.names[:]
+        self._roots = [(root, dict(root.mounts), list(root.swaps))
+                       for root in storage.roots]
+
+        self._members = {}      # id -> device, format or action
+        self._contents = {}     # id -> {attribute: (container, its contents)}
+        self._addMembers(self._devices + self._hidden + self._actions +
+                         [obj for root in storage.roots
+                              for obj in root.mounts.values() + root.swaps])
+
+        self._saved = {}        # id -> attributes
+        self._duplicates = {}   # id -> (parted disk, its duplicate)
+        _snapshots.add(self)
+
+    def _addMembers(self, objs):
+        """ Add objs, and the members they refer to, to the members. """
+        from .deviceaction import DeviceAction
+        from .devices import Device, ParentList
+        from .formats import DeviceFormat
+
+        member_types = (Device, DeviceFormat, DeviceAction)
+        objs = list(objs)
+        while objs:
+            obj = objs.pop()
+            if id(obj) in self._members:
+                continue
+
+            self._members[id(obj)] = obj
+            contents = {}
+            for (attr, value) in obj.__dict__.items():
+                if isinstance(value, ParentList):
+                    contents[attr] = (value, list(value.items))
+                    value = value.items
+                elif isinstance(value, (list, dict, set)):
+                    contents[attr] = (value, _copyContents(value))
+                elif isinstance(value, member_types):
+                    objs.append(value)
+                    continue
+                else:
+                    continue
+
+                objs.extend(item for item in _contents(value)
+                            if isinstance(item, member_types))
+
+            if contents:
+                self._contents[id(obj)] = contents
+
+    @property
+    def active(self):
+        """ Whether this snapshot is saving the state of its members. """
+        return self in _snapshots
+
+    def save(self, obj):
+        """ Save obj's state, unless it is not a member or already saved. """
+        key = id(obj)
+        if key in self._saved or key not in self._members:
+            return
+
+        self._saved[key] = self._getState(obj)
+
+    def _getState(self, obj):
+        attrs = dict(obj.__dict__)
+
+        # parted disks are changed in place, so they are duplicated like
+        # copy.deepcopy does for DeviceFormat instances; a disk shared by two
+        # attributes is duplicated once, keeping them shared
+        for attr in getattr(obj, "_snapshotDuplicateAttrs", ()):
+            value = attrs.get(attr)
+            if value is None:
+                continue
+
+            if id(value) not in self._duplicates:
+                self._duplicates[id(value)] = (value, value.duplicate())
+
+            attrs[attr] = self._duplicates[id(value)][1]
+
+        return attrs
+
+    def restore(self):
+        """ Return the device tree to its state when the snapshot was taken.
+
+            The snapshot stays active and can be restored again later.
+        """
+        from .devices import ParentList
+
+        log.debug("restoring snapshot of %d devices, %d of %d objects changed",
+                  len(self._devices), len(self._saved), len(self._members))
+        # the saved contents are copied again, so that the snapshot can be
+        # restored more than once
+        for contents in self._contents.values():
+            for (container, items) in contents.values():
+                if isinstance(container, ParentList):
+                    container.items[:] = items
+                elif isinstance(container, list):
+                    container[:] = _copyContents(items)
+                else:
+                    container.clear()
+                    container.update(_copyContents(items))
+
+        for (key, attrs) in self._saved.items():
+            # bypass __setattr__ so that nothing is saved or indexed while
+            # the state is only partly restored
+            obj = self._members[key]
+            obj.__dict__.clear()
+            obj.__dict__.update(attrs)
+
+        # re-get partedPartitions from the duplicated disks, like Blivet.copy
+        for device in self._devices + self._hidden:
+            partition = device.__dict__.get("_partedPartition")
+            if partition is None or id(partition.disk) not in self._duplicates:
+                continue
+
+            disk = self._duplicates[id(partition.disk)][1]
+            device.__dict__["_partedPartition"] = disk.getPartitionByPath(device.path)
+
+        ParentList.generation += 1
+
+        tree = self.storage.devicetree
+        tree._index.reset(self._devices, self._hidden)
+        tree._actions = self._actions[:]
+        tree.names = self._names[:]
+        for (root, mounts, swaps) in self._roots:
+            root.mounts = dict(mounts)
+            root.swaps = list(swaps)
+
+        self.storage.roots = [root for (root, _mounts, _swaps) in self._roots]
+
+        self._saved.clear()
+        self._duplicates.clear()
+
+    def release(self):
+        """ Stop saving state and drop what was saved. """
+        _snapshots.discard(self)
+        self._saved.clear()
+        self._duplicates.clear()
@@ -1,27 +1,143 @@
-import inspect
 import logging
 import sys
+import threading
+import time
 import traceback
 
 log = logging.getLogger("blivet")
 log.addHandler(logging.NullHandler())
 
-def function_name_and_depth():
-    IGNORED_FUNCS = ["function_name_and_depth",
-                     "log_method_call",
-                     "log_method_return"]
-    stack = inspect.stack()
+IGNORED_FUNCS = frozenset(["function_name_and_depth",
+                           "log_method_call",
+                           "log_method_return"])
 
-    for i, frame in enumerate(stack):
-        methodname = frame[3]
-        if methodname not in IGNORED_FUNCS:
-            return (methodname, len(stack) - i)
+def function_name_and_depth(frame=None):
+    """ Return the name and stack depth of the function that is logging.
 
-    return ("unknown function?", 0)
+        :keyword frame: the frame to start from, by default the caller's
+        :returns: the name of the innermost function that is not one of the
+                  logging functions, and how many frames deep it is
+        :rtype: tuple of (str, int)
+    """
+    if frame is None:
+        frame = sys._getframe(1)
+
+    while frame is not None and frame.f_code.co_name in IGNORED_FUNCS:
+        frame = frame.f_back
+
+    if frame is None:
+        return ("unknown function?", 0)
+
+    methodname = frame.f_code.co_name
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+
+    return (methodname, depth)
+
+class MethodTimer(object):
+    """ Durations of the methods that call :func:`log_method_call`.
+
+        While the timer runs, each call to :func:`log_method_call` starts
+        timing the calling method, which stops when that method returns.
+        This is done with a profile function, so it slows everything down
+        and is meant for profiling, not for production use.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {}
+        self.running = False
+
+    def _pending(self):
+        pending = getattr(self._local, "pending", None)
+        if pending is None:
+            pending = self._local.pending = {}
+        return pending
+
+    def _profile(self, frame, event, _arg):
+        if event != "return":
+            return
+
+        if not self.running:
+            sys.setprofile(None)
+            return
+
+        pending = self._pending()
+        if frame not in pending:
+            return
+
+        (key, start) = pending.pop(frame)
+        elapsed = time.time() - start
+        with self._lock:
+            stats = self._stats.setdefault(key, [0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+
+        if not pending:
+            sys.setprofile(None)
+
+    def called(self, classname, frame):
+        """ Start timing frame, the frame of a method of class classname. """
+        pending = self._pending()
+        if frame in pending:
+            return
+
+        pending[frame] = ((classname, frame.f_code.co_name), time.time())
+        if sys.getprofile() is None:
+            sys.setprofile(self._profile)
+
+    def start(self):
+        """ Start timing methods. """
+        self.running = True
+
+    def stop(self):
+        """ Stop timing methods.
+
+            Methods that are still running are not counted.
+        """
+        self.running = False
+        self._pending().clear()
+        if sys.getprofile() == self._profile:
+            sys.setprofile(None)
+
+    @property
+    def stats(self):
+        """ Calls and total duration of each method.
+
+            :returns: (calls, seconds) tuples by (class name, method name)
+            :rtype: dict
+        """
+        with self._lock:
+            return dict((key, tuple(s)) for (key, s) in self._stats.items())
+
+    def resetStats(self):
+        with self._lock:
+            self._stats.clear()
+
+    def logStats(self):
+        stats = sorted(self.stats.items(), key=lambda item: item[1][1],
+                       reverse=True)
+        for ((classname, methodname), (calls, seconds)) in stats:
+            log.debug("method timer: %s.%s: %d calls, %.6f s",
+                      classname, methodname, calls, seconds)
+
+method_timer = MethodTimer()
 
 def log_method_call(d, *args, **kwargs):
+    timing = method_timer.running
+    if not timing and not log.isEnabledFor(logging.DEBUG):
+        return
+
     classname = d.__class__.__name__
-    (methodname, depth) = function_name_and_depth()
+    frame = sys._getframe(1)
+    if timing:
+        method_timer.called(classname, frame)
+        if not log.isEnabledFor(logging.DEBUG):
+            return
+
+    (methodname, depth) = function_name_and_depth(frame)
     spaces = depth * ' '
     fmt = "%s%s.%s:"
     fmt_args = [spaces, classname, methodname]
@@ -39,8 +155,11 @@ def log_method_call(d, *args, **kwargs):
     log.debug(fmt, *fmt_args)
 
 def log_method_return(d, retval):
+    if not log.isEnabledFor(logging.DEBUG):
+        return
+
     classname = d.__class__.__name__
-    (methodname, depth) = function_name_and_depth()
+    (methodname, depth) = function_name_and_depth(sys._getframe(1))
     spaces = depth * ' '
     fmt = "%s%s.%s returned %s"
     fmt_args = (spaces, classname, methodname, retval)
@@ -20,74 +20,136 @@
 # Red Hat Author(s): Dave Lehman <dlehman@redhat.com>
 #
 
+import collections
+
 class CyclicGraphError(Exception):
     pass
 
 def tsort(graph):
+    """ Return the items of a graph in topological order.
+
+        :param graph: a graph as returned by :func:`create_graph`
+        :type graph: dict
+        :returns: the sorted items
+        :rtype: list
+        :raises: :class:`CyclicGraphError` if the graph contains cycles
+
+        This is Kahn's algorithm. Items with no remaining incoming edges are
+        kept on a stack, so the most recently freed item is always the next
+        one in the order. Items are freed in edge order or, if the graph has
+        ranks, in item order.
+
+        The graph is not modified.
+    """
     order = []  # sorted list of items
 
     if not graph or not graph['items']:
         return order
 
+    items = graph['items']
+    ranks = graph.get('ranks') or {}
+    incoming = dict(graph['incoming'])
+    children = dict((item, []) for item in items)
+    for (parent, child) in graph['edges']:
+        children[parent].append(child)
+
+    # ranked items only become roots once every item of a higher rank has
+    # been sorted, so track how many of those remain for each rank
+    ranked = collections.defaultdict(list)
+    for item in items:
+        if ranks.get(item) is not None:
+            ranked[ranks[item]].append(item)
+
+    above = {}
+    remaining = 0
+    for rank in sorted(ranked, reverse=True):
+        above[rank] = remaining
+        remaining += len(ranked[rank])
+
+    position = dict((item, i) for (i, item) in enumerate(items))
+
+    def is_root(item):
+        rank = ranks.get(item)
+        return incoming[item] == 0 and (rank is None or above[rank] == 0)
+
     # determine which nodes have no incoming edges
-    roots = [n for n in graph['items'] if graph['incoming'][n] == 0]
+    roots = collections.deque(n for n in items if is_root(n))
     if not roots:
         raise CyclicGraphError("no root nodes")
 
-    visited = []    # list of nodes visited, for cycle detection
+    visited = set()     # set of nodes visited, for cycle detection
     while roots:
         # remove a root, add it to the order
         root = roots.pop()
         if root in visited:
             raise CyclicGraphError("graph contains cycles")
 
-        visited.append(root)
+        visited.add(root)
         order.append(root)
-        # remove each edge from the root to another node
-        for (parent, child) in [e for e in graph['edges'] if e[0] == root]:
-            graph['incoming'][child] -= 1
-            graph['edges'].remove((parent, child))
-            # if destination node is now a root, add it to roots
-            if graph['incoming'][child] == 0:
-                roots.append(child)
-
-    if len(graph['items']) != len(visited):
-        raise CyclicGraphError("graph contains cycles")
 
+        # remove each edge from the root to another node and collect the
+        # nodes that are now roots
+        freed = []
+        for child in children[root]:
+            incoming[child] -= 1
+            if is_root(child):
+                freed.append(child)
+
+        rank = ranks.get(root)
+        if rank is not None:
+            for lower in (r for r in above if r < rank):
+                above[lower] -= 1
+                if above[lower] == 0:
+                    freed.extend(n for n in ranked[lower] if incoming[n] == 0)
+
+        if ranks:
+            freed.sort(key=position.get)
+
+        roots.extend(freed)
+
+    if len(items) != len(visited):
+        raise CyclicGraphError("graph contains cycles")
 
     return order
 
-def create_graph(items, edges):
+def create_graph(items, edges, ranks=None):
     """ Create a graph based on a list of items and a list of edges.
 
         Arguments:
 
             items   -   an iterable containing (hashable) items to sort
             edges   -   an iterable containing (parent, child) edge pair tuples
+            ranks   -   an optional dict of item ranks; each item with a rank
+                        precedes every item with a lower rank, as if the two
+                        were joined by an edge
 
         Return Value:
 
             The return value is a dictionary representing the directed graph.
-            It has three keys:
+            It has four keys:
 
                 items is the same as the input argument of the same name
                 edges is the same as the input argument of the same name
-                incoming is a dict of incoming edge count hashed by item
+                ranks is the same as the input argument of the same name
+                incoming is a dict of incoming edge count hashed by item,
+                         not including the edges implied by ranks
 
     """
     graph = {'items': [],       # the items to sort
              'edges': [],       # partial order info: (parent, child) pairs
+             'ranks': {},       # rank for each ranked item
              'incoming': {}}    # incoming edge count for each item
 
     graph['items'] = items
     graph['edges'] = edges
+    graph['ranks'] = ranks or {}
     for item in items:
         graph['incoming'][item] = 0
 
     for (_parent, child) in edges:
         graph['incoming'][child] += 1
 
-    return graph 
+    return graph
 
 def main():
     items = [5, 2, 3, 4, 1]
@@ -21,30 +21,47 @@
 #                    Chris Lumens <clumens@redhat.com>
 #
 
+import collections
 import os
 import re
+import select
+import sys
+import threading
+import time
+from contextlib import contextmanager
 
 from . import util
+from .backend import get_backend
+from .flags import flags
 from .size import Size
 
 from . import pyudev
 global_udev = pyudev.Udev()
 
+# libudev contexts must not be shared between threads, so the threads that
+# collect device information each use their own
+_thread_udev = threading.local()
+
 import logging
 log = logging.getLogger("blivet")
 
-def udev_enumerate_devices(deviceClass="block"):
+def _udev_enumerate_devices(deviceClass):
     devices = global_udev.enumerate_devices(subsystem=deviceClass)
     return [path[4:] for path in devices]
 
-def udev_get_device(sysfs_path):
+def udev_enumerate_devices(deviceClass="block"):
+    return get_backend().query("udev-enumerate", deviceClass,
+                               _udev_enumerate_devices, deviceClass)
+
+def _udev_get_device(sysfs_path):
     if not os.path.exists("/sys%s" % sysfs_path):
         log.debug("%s does not exist", sysfs_path)
         return None
 
     # XXX we remove the /sys part when enumerating devices,
     # so we have to prepend it when creating the device
-    dev = global_udev.create_device("/sys" + sysfs_path)
+    context = getattr(_thread_udev, "udev", global_udev)
+    dev = context.create_device("/sys" + sysfs_path)
 
     if dev:
         dev["name"] = dev.sysname
@@ -55,6 +72,35 @@ def udev_get_device(sysfs_path):
 
     return dev
 
+def udev_get_device(sysfs_path):
+    """ Return the udev database entry of a device, or None.
+
+        The entry is looked up through the backend, see :mod:`~.backend`.
+    """
+    try:
+        return get_backend().query("udev-device", sysfs_path,
+                                   _udev_get_device, sysfs_path)
+    except EnvironmentError as e:
+        log.debug("failed to get udev information for %s: %s", sysfs_path, e)
+        return None
+
+def _udev_get_slaves(sysfs_path):
+    slave_dir = "/sys%s/slaves" % sysfs_path
+    return [(name, os.path.realpath("%s/%s" % (slave_dir, name))[4:])
+            for name in os.listdir(slave_dir)]
+
+def udev_get_slaves(sysfs_path):
+    """ Return the devices a device-mapper or md device is built on.
+
+        :param str sysfs_path: the device's sysfs path
+        :returns: the kernel name and sysfs path of each of the devices
+        :rtype: list of (str, str)
+        :raises: OSError if the device has no slaves directory
+    """
+    return [tuple(slave) for slave in
+            get_backend().query("slaves", sysfs_path, _udev_get_slaves,
+                                sysfs_path)]
+
 def udev_get_devices(deviceClass="block"):
     udev_settle()
     entries = []
@@ -79,11 +125,250 @@ def udev_parse_uevent_file(dev):
 
     return dev
 
-def udev_settle():
+# counters for udev_wait_stats
+_wait_stats = {"settles": 0, "settle_time": 0.0,
+               "waits": 0, "blocked": 0, "wait_time": 0.0}
+_wait_stats_lock = threading.Lock()
+
+# the watch and device names udev_settle waits for, per thread
+_settle_scope = threading.local()
+
+def _count_wait_stats(**kwargs):
+    with _wait_stats_lock:
+        for (key, value) in kwargs.items():
+            _wait_stats[key] += value
+
+def udev_wait_stats():
+    """ Return counters for the time spent waiting for udev.
+
+        :returns: the number of global settles run ("settles") and the time
+                  they took ("settle_time"), and the number of targeted
+                  waits done by :class:`UdevEventWatch` ("waits"), how many
+                  of them had to wait for events ("blocked") and the time
+                  they took ("wait_time")
+        :rtype: dict
+    """
+    with _wait_stats_lock:
+        return dict(_wait_stats)
+
+def _udev_settle_all():
     # wait maximal 300 seconds for udev to be done running blkid, lvm,
     # mdadm etc. This large timeout is needed when running on machines with
     # lots of disks, or with slow disks
-    util.run_program(["udevadm", "settle", "--timeout=300"])
+    start = time.time()
+    try:
+        util.run_program(["udevadm", "settle", "--timeout=300"])
+    finally:
+        _count_wait_stats(settles=1, settle_time=time.time() - start)
+
+def _udev_ping():
+    # udevd turns the closing of a device node written to into a change
+    # uevent through its inotify watch, some time after the writer is done;
+    # a ping returns once udevd has handled everything queued before it,
+    # including those inotify events, so the uevents they lead to have
+    # been sent by the time it returns
+    return util.run_program(["udevadm", "control", "--ping", "--timeout=300"]) == 0
+
+def udev_settle():
+    """ Wait for udev to finish processing events.
+
+        Within :func:`udev_settle_scope` this only waits for the events on
+        the devices given to the scope. Otherwise it waits for the whole
+        udev event queue to be empty.
+    """
+    scope = getattr(_settle_scope, "current", None)
+    if scope is not None:
+        (watch, names) = scope
+        watch.wait(names)
+    else:
+        _udev_settle_all()
+
+@contextmanager
+def udev_settle_scope(watch, names):
+    """ Make :func:`udev_settle` wait only for events on some devices.
+
+        :param watch: the watch to wait with
+        :type watch: :class:`UdevEventWatch`
+        :param names: kernel names of the devices (eg: sda, sda1, dm-0)
+        :type names: iterable of str
+
+        This applies to the calling thread only.
+    """
+    saved = getattr(_settle_scope, "current", None)
+    _settle_scope.current = (watch, set(names))
+    try:
+        yield
+    finally:
+        _settle_scope.current = saved
+
+def udev_event_device_names(syspath):
+    """ Return the kernel names of a block device and the devices under it.
+
+        :param str syspath: the device's sysfs path, including /sys
+        :returns: the kernel names of the device, of the disk a partition
+                  is on and, for devices like dm and md, of every device
+                  under them
+        :rtype: set of str
+
+        This works for devices that have already been removed, but only
+        returns the device's own name and, for partitions, its disk's name
+        for them.
+    """
+    names = set()
+    paths = [syspath]
+    while paths:
+        path = paths.pop()
+        name = os.path.basename(path)
+        if name in names:
+            continue
+
+        names.add(name)
+
+        # a partition's directory is inside its disk's directory
+        parent = os.path.basename(os.path.dirname(path))
+        if parent != name and name.startswith(parent):
+            names.add(parent)
+
+        slaves = os.path.join(path, "slaves")
+        if os.path.isdir(slaves):
+            paths.extend(os.path.realpath(os.path.join(slaves, slave))
+                         for slave in os.listdir(slaves))
+
+    return names
+
+class UdevEventWatch(object):
+    """ Wait for udev to process the events on some devices.
+
+        The watch sees the block device uevents sent from the time it is
+        created, so create it before making the changes to wait for.
+        :meth:`wait` then waits until udev has processed the events that
+        were sent for the devices it is given, instead of waiting for the
+        whole udev event queue to be empty like :func:`udev_settle` does.
+
+        Writing to a device node makes udevd send a change uevent for it
+        later, when it sees the node closed, so :meth:`wait` pings udevd
+        first to make sure those events have been sent.
+
+        If uevents cannot be monitored, :meth:`wait` runs a global settle.
+    """
+
+    # how long to wait with no uevents at all before falling back to a
+    # global settle
+    stall_timeout = 10
+
+    def __init__(self):
+        self._monitors = None
+
+        # names of the devices for events udev has not processed yet, by
+        # sequence number
+        self._events = {}
+
+        # sequence numbers of processed events we have not seen from the
+        # kernel yet
+        self._processed = set()
+
+        try:
+            self._monitors = (global_udev.create_monitor("kernel", subsystem="block"),
+                              global_udev.create_monitor("udev", subsystem="block"))
+        except OSError as e:
+            log.info("cannot monitor uevents, using udev settle: %s", e)
+
+    def close(self):
+        """ Stop receiving uevents. """
+        if self._monitors:
+            for monitor in self._monitors:
+                monitor.unref()
+
+        self._monitors = None
+        self._events.clear()
+        self._processed.clear()
+
+    def _receive(self):
+        """ Read all of the pending uevents. """
+        (kernel, processed) = self._monitors
+        event = kernel.receive_device()
+        while event is not None:
+            (_action, seqnum, syspath) = event
+            if seqnum in self._processed:
+                self._processed.remove(seqnum)
+            else:
+                self._events[seqnum] = udev_event_device_names(syspath)
+
+            event = kernel.receive_device()
+
+        event = processed.receive_device()
+        while event is not None:
+            seqnum = event[1]
+            if self._events.pop(seqnum, None) is None:
+                self._processed.add(seqnum)
+
+            event = processed.receive_device()
+
+        # events sent before the watch was created never get matched
+        if len(self._processed) > 1024:
+            self._processed = set(sorted(self._processed)[512:])
+
+    def _getPending(self, names):
+        return [seqnum for (seqnum, event_names) in self._events.items()
+                if not event_names.isdisjoint(names)]
+
+    def wait(self, names, timeout=300):
+        """ Wait for udev to process the events on some devices.
+
+            :param names: kernel names of the devices (eg: sda, sda1, dm-0)
+            :type names: iterable of str
+            :keyword int timeout: the longest time to wait, in seconds
+
+            Events on partitions and on devices built on top of the named
+            devices (like dm and md devices) are waited for as well.
+        """
+        if not self._monitors:
+            _udev_settle_all()
+            return
+
+        start = time.time()
+        names = set(names)
+        if not _udev_ping():
+            log.info("udevadm control --ping failed, using udev settle")
+            _udev_settle_all()
+            self._receive()
+            for seqnum in self._getPending(names):
+                del self._events[seqnum]
+            return
+
+        self._receive()
+        pending = self._getPending(names)
+        if pending:
+            self._waitForEvents(names, start + timeout)
+
+        _count_wait_stats(waits=1, blocked=int(bool(pending)),
+                          wait_time=time.time() - start)
+
+    def _waitForEvents(self, names, deadline):
+        activity = time.time()
+        while True:
+            now = time.time()
+            if now >= deadline:
+                log.warning("timed out waiting for uevents on %s",
+                            ", ".join(sorted(names)))
+                return
+
+            if now - activity >= self.stall_timeout:
+                log.warning("no uevents while waiting on %s, using udev settle",
+                            ", ".join(sorted(names)))
+                _udev_settle_all()
+                for seqnum in self._getPending(names):
+                    del self._events[seqnum]
+                return
+
+            timeout = min(deadline, activity + self.stall_timeout) - now
+            (readable, _w, _x) = select.select(self._monitors, [], [], timeout)
+            if readable:
+                activity = time.time()
+
+            self._receive()
+            if not self._getPending(names):
+                return
 
 def udev_trigger(subsystem=None, action="add", name=None):
     argv = ["trigger", "--action=%s" % action]
@@ -146,32 +431,98 @@ def udev_resolve_glob(glob):
 
     return ret
 
-def udev_get_block_devices():
+def udev_get_block_devices(jobs=None, cache=None):
+    """ Return udev information for all usable block devices.
+
+        :keyword int jobs: the number of threads collecting the information
+                           (default: :attr:`~.flags.Flags.udev_jobs`)
+        :keyword cache: reuse information about devices that did not change
+        :type cache: :class:`~.populatecache.PopulateCache`
+        :returns: udev information for each device, in enumeration order
+        :rtype: list of dict
+    """
     udev_settle()
-    entries = []
-    for path in udev_enumerate_block_devices():
-        entry = udev_get_block_device(path)
-        if entry:
-            if entry["name"].startswith("md"):
-                # mdraid is really braindead, when a device is stopped
-                # it is no longer usefull in anyway (and we should not
-                # probe it) yet it still sticks around, see bug rh523387
-                state = None
-                state_file = "/sys/%s/md/array_state" % entry["sysfs_path"]
-                if os.access(state_file, os.R_OK):
-                    state = open(state_file).read().strip()
-                if state == "clear":
-                    continue
-            entries.append(entry)
-    return entries
+    paths = udev_enumerate_devices(deviceClass="block")
+    if jobs is None:
+        jobs = flags.udev_jobs
+
+    func = _udev_collect_block_device
+    if cache is not None:
+        func = lambda path: cache.probe(path, "udev",
+                                        _udev_collect_block_device, path)
+
+    entries = _udev_map(func, paths, jobs)
+    return [entry for entry in entries if entry]
+
+def _udev_collect_block_device(sysfs_path):
+    """ Return udev information for a block device, or None to skip it. """
+    if __is_blacklisted_blockdev(os.path.basename(sysfs_path)):
+        return None
+
+    entry = udev_get_block_device(sysfs_path)
+    if entry and entry["name"].startswith("md"):
+        # mdraid is really braindead, when a device is stopped
+        # it is no longer usefull in anyway (and we should not
+        # probe it) yet it still sticks around, see bug rh523387
+        state = util.read_file("/sys/%s/md/array_state" % entry["sysfs_path"])
+        if state is not None and state.strip() == "clear":
+            return None
+
+    return entry
+
+def _udev_map(func, items, jobs):
+    """ Apply func to each item, using up to jobs threads.
+
+        :returns: the results, in the order of the items
+        :rtype: list
+
+        Each thread gets its own udev context for :func:`udev_get_device`.
+    """
+    jobs = min(jobs, len(items))
+    if jobs <= 1:
+        return [func(item) for item in items]
+
+    results = [None] * len(items)
+    errors = []
+    todo = iter(range(len(items)))
+    lock = threading.Lock()
+
+    def worker():
+        _thread_udev.udev = pyudev.Udev()
+        try:
+            while not errors:
+                with lock:
+                    idx = next(todo, None)
+                if idx is None:
+                    return
+
+                results[idx] = func(items[idx])
+        except Exception: # pylint: disable=broad-except
+            errors.append(sys.exc_info())
+        finally:
+            _thread_udev.udev.unref()
+
+    threads = [threading.Thread(target=worker) for _i in range(jobs)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        (exc_type, exc_value, tb) = errors[0]
+        raise exc_type, exc_value, tb
+
+    return results
 
 def __is_blacklisted_blockdev(dev_name):
     """Is this a blockdev we never want for an install?"""
     if dev_name.startswith("ram") or dev_name.startswith("fd"):
         return True
 
-    if os.path.exists("/sys/class/block/%s/device/model" %(dev_name,)):
-        model = open("/sys/class/block/%s/device/model" %(dev_name,)).read()
+    model = util.read_file("/sys/class/block/%s/device/model" % (dev_name,))
+    if model is not None:
         for bad in ("IBM *STMF KERNEL", "SCEI Flash-5", "DGC LUNZ"):
             if model.find(bad) != -1:
                 log.info("ignoring %s with model %s", dev_name, model)
@@ -183,6 +534,50 @@ def udev_enumerate_block_devices():
     return filter(lambda d: not __is_blacklisted_blockdev(os.path.basename(d)),
                   udev_enumerate_devices(deviceClass="block"))
 
+def udev_sysfs_path_is_partition(sysfs_path):
+    """ Return True if a sysfs path is, or was, a partition's.
+
+        Partitions' directories are inside their disks' directories, so
+        this also works for partitions that have been removed.
+    """
+    disk = os.path.basename(os.path.dirname(sysfs_path))
+    return (os.path.exists("/sys%s/partition" % sysfs_path) or
+            (not os.path.exists("/sys" + sysfs_path) and
+             os.path.basename(sysfs_path).startswith(disk)))
+
+def udev_get_dependent_paths(sysfs_path):
+    """ Return the sysfs paths of the block devices that depend on a device.
+
+        :param str sysfs_path: the device's sysfs path
+        :returns: the paths of the partitions on the device and of the
+                  devices holding it, like dm and md devices, and of the
+                  devices depending on those, each after the one it
+                  depends on
+        :rtype: list of str
+    """
+    found = []
+    paths = collections.deque([sysfs_path])
+    while paths:
+        path = paths.popleft()
+        devdir = "/sys" + path
+        if not os.path.isdir(devdir):
+            continue
+
+        kids = ["%s/%s" % (path, entry) for entry in sorted(os.listdir(devdir))
+                if os.path.exists("%s/%s/partition" % (devdir, entry))]
+
+        holders = devdir + "/holders"
+        if os.path.isdir(holders):
+            kids.extend(os.path.realpath("%s/%s" % (holders, holder))[4:]
+                        for holder in sorted(os.listdir(holders)))
+
+        for kid in kids:
+            if kid != sysfs_path and kid not in found:
+                found.append(kid)
+                paths.append(kid)
+
+    return found
+
 def udev_get_block_device(sysfs_path):
     dev = udev_get_device(sysfs_path)
     if not dev or not dev.has_key("name"):
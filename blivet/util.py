@@ -4,55 +4,76 @@ import shutil
 import selinux
 import subprocess
 import re
+import time
 from decimal import Decimal
 
 from .size import Size
+from .flags import flags
+from .instrumentation import recorder
+from .backend import get_backend
 
 import logging
 log = logging.getLogger("blivet")
 program_log = logging.getLogger("program")
 
-from threading import Lock
+from threading import Lock, Thread
 # this will get set to anaconda's program_log_lock in enable_installer_mode
 program_log_lock = Lock()
 
-def _run_program(argv, root='/', stdin=None, env_prune=None):
-    if env_prune is None:
-        env_prune = []
-
+def _execute(argv, root, stdin, env):
     def chroot():
         if root and root != '/':
             os.chroot(root)
 
-    with program_log_lock:
-        program_log.info("Running... %s", " ".join(argv))
+    proc = subprocess.Popen(argv,
+                            stdin=stdin,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT,
+                            close_fds=True,
+                            preexec_fn=chroot, cwd=root, env=env)
 
-        env = os.environ.copy()
-        env.update({"LC_ALL": "C",
-                    "INSTALL_PATH": root})
-        for var in env_prune:
-            env.pop(var, None)
+    out = proc.communicate()[0]
+    return (proc.returncode, out)
 
-        try:
-            proc = subprocess.Popen(argv,
-                                    stdin=stdin,
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.STDOUT,
-                                    close_fds=True,
-                                    preexec_fn=chroot, cwd=root, env=env)
-
-            out = proc.communicate()[0]
-            if out:
-                for line in out.splitlines():
-                    program_log.info("%s", line)
-
-        except OSError as e:
+def _run_program(argv, root='/', stdin=None, env_prune=None):
+    if env_prune is None:
+        env_prune = []
+
+    env = os.environ.copy()
+    env.update({"LC_ALL": "C",
+                "INSTALL_PATH": root})
+    for var in env_prune:
+        env.pop(var, None)
+
+    key = " ".join(argv)
+    if root and root != '/':
+        key = "chroot %s %s" % (root, key)
+
+    # the program runs without the log lock held, so that programs run from
+    # different threads can overlap; its output is logged in one piece once
+    # it has finished
+    start = time.time()
+    try:
+        (returncode, out) = get_backend().query("run", key, _execute,
+                                                argv, root, stdin, env)
+    except OSError as e:
+        recorder.command(argv, time.time() - start, None)
+        with program_log_lock:
+            program_log.info("Running... %s", " ".join(argv))
             program_log.error("Error running %s: %s", argv[0], e.strerror)
-            raise
+        raise
 
-        program_log.debug("Return code: %d", proc.returncode)
+    recorder.command(argv, time.time() - start, returncode)
 
-    return (proc.returncode, out)
+    with program_log_lock:
+        program_log.info("Running... %s", " ".join(argv))
+        if out:
+            for line in out.splitlines():
+                program_log.info("%s", line)
+
+        program_log.debug("Return code: %d", returncode)
+
+    return (returncode, out)
 
 def run_program(*args, **kwargs):
     return _run_program(*args, **kwargs)[0]
@@ -63,6 +84,61 @@ def capture_output(*args, **kwargs):
 def run_program_and_capture_output(*args, **kwargs):
     return _run_program(*args, **kwargs)
 
+def run_many(argvs, jobs=None, **kwargs):
+    """ Run several programs at once.
+
+        :param argvs: the argument vectors of the programs to run
+        :type argvs: list of list of str
+        :keyword int jobs: the most programs to run at the same time
+                           (default: :attr:`~.flags.Flags.command_jobs`)
+        :returns: the return code and output of each program, in the order
+                  of argvs
+        :rtype: list of (int, str)
+
+        Other keyword arguments are passed to each
+        :func:`run_program_and_capture_output` call. If running any of the
+        programs raises an exception, the others are still run, and the
+        exception raised for the first of them in argvs is raised again once
+        they have all finished.
+    """
+    if jobs is None:
+        jobs = flags.command_jobs
+
+    argvs = list(argvs)
+    jobs = min(jobs, len(argvs))
+    if jobs <= 1:
+        return [_run_program(argv, **kwargs) for argv in argvs]
+
+    results = [None] * len(argvs)
+    errors = []
+    todo = iter(range(len(argvs)))
+    lock = Lock()
+
+    def worker():
+        while True:
+            with lock:
+                idx = next(todo, None)
+            if idx is None:
+                return
+
+            try:
+                results[idx] = _run_program(argvs[idx], **kwargs)
+            except Exception as e: # pylint: disable=broad-except
+                errors.append((idx, e))
+
+    threads = [Thread(target=worker) for _i in range(jobs)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise min(errors)[1]
+
+    return results
+
 def mount(device, mountpoint, fstype, options=None):
     if options is None:
         options = "defaults"
@@ -165,19 +241,35 @@ def notify_kernel(path, action="change"):
     f.write("%s\n" % action)
     f.close()
 
+def _read_file(path):
+    with open(path) as f:
+        return f.read()
+
+def read_file(path):
+    """ Return the contents of a file, like a sysfs attribute.
+
+        :param str path: the path of the file
+        :returns: the contents, or None if the file can not be read
+        :rtype: str or NoneType
+
+        The file is read through the backend, see :mod:`~.backend`.
+    """
+    try:
+        return get_backend().query("file", path, _read_file, path)
+    except EnvironmentError:
+        return None
+
 def get_sysfs_attr(path, attr):
     if not attr:
         log.debug("get_sysfs_attr() called with attr=None")
         return None
 
-    attribute = "/sys%s/%s" % (path, attr)
-    attribute = os.path.realpath(attribute)
-
-    if not os.path.isfile(attribute) and not os.path.islink(attribute):
+    value = read_file("/sys%s/%s" % (path, attr))
+    if value is None:
         log.warning("%s is not a valid attribute", attr)
         return None
 
-    return open(attribute, "r").read().strip()
+    return value.strip()
 
 def get_sysfs_path_by_name(dev_node, class_name="block"):
     """ Return sysfs path for a given device.
@@ -24,6 +24,22 @@ from blivet.deviceaction import ActionDestroyFormat
 from blivet.deviceaction import ActionAddMember
 from blivet.deviceaction import ActionRemoveMember
 
+def pruneExhaustively(actions):
+    """ Return a pruned copy of actions, comparing every pair of actions. """
+    actions = actions[:]
+    for action in reversed(actions[:]):
+        if action not in actions:
+            continue
+
+        for obsolete in actions[:]:
+            if action.obsoletes(obsolete):
+                actions.remove(obsolete)
+
+                if obsolete.obsoletes(action) and action in actions:
+                    actions.remove(action)
+
+    return actions
+
 class DeviceActionTestCase(StorageTestCase):
     """ DeviceActionTestSuite """
 
@@ -551,6 +567,73 @@ class DeviceActionTestCase(StorageTestCase):
         sda3_actions = self.storage.devicetree.findActions(sda3.id)
         self.assertEqual(len(sda3_actions), 0)
 
+    def _checkPruning(self):
+        devicetree = self.storage.devicetree
+        expected = pruneExhaustively(devicetree._actions)
+        devicetree.pruneActions()
+        self.assertEqual(devicetree._actions, expected)
+
+    def testActionPruningMatchesExhaustive(self):
+        """ Verify that pruning gives the same result as comparing every pair
+            of actions.
+        """
+        devicetree = self.storage.devicetree
+
+        # new devices that are created and destroyed again
+        self.destroyAllDevices(disks=["sdc", "sdd"])
+        sdc = devicetree.getDeviceByName("sdc")
+        sdd = devicetree.getDeviceByName("sdd")
+        sdc1 = self.newDevice(device_class=PartitionDevice,
+                              name="sdc1", parents=[sdc], size=Size("40 GiB"))
+        self.scheduleCreateDevice(device=sdc1)
+        fmt = self.newFormat("mdmember", device=sdc1.path)
+        self.scheduleCreateFormat(device=sdc1, fmt=fmt)
+        sdd1 = self.newDevice(device_class=PartitionDevice,
+                              name="sdd1", parents=[sdd], size=Size("40 GiB"))
+        self.scheduleCreateDevice(device=sdd1)
+        fmt = self.newFormat("mdmember", device=sdd1.path)
+        self.scheduleCreateFormat(device=sdd1, fmt=fmt)
+        md0 = self.newDevice(device_class=MDRaidArrayDevice,
+                             name="md0", level="raid1", minor=0,
+                             memberDevices=2, totalDevices=2,
+                             parents=[sdc1, sdd1])
+        self.scheduleCreateDevice(device=md0)
+        fmt = self.newFormat("ext4", device=md0.path, mountpoint="/home")
+        self.scheduleCreateFormat(device=md0, fmt=fmt)
+        self.scheduleDestroyFormat(device=md0)
+        self.scheduleDestroyDevice(device=md0)
+        self.scheduleDestroyDevice(device=sdd1)
+        self._checkPruning()
+
+        # several formats for a new device, of which the last one stays
+        for mountpoint in ("/srv", "/opt", "/var"):
+            fmt = self.newFormat("ext4", device=sdc1.path, mountpoint=mountpoint)
+            self.scheduleCreateFormat(device=sdc1, fmt=fmt)
+        self._checkPruning()
+
+        # several formats for an existing device, then none
+        sda1 = devicetree.getDeviceByName("sda1")
+        for fstype in ("ext3", "xfs"):
+            fmt = self.newFormat(fstype, device=sda1.path, mountpoint="/boot")
+            self.scheduleCreateFormat(device=sda1, fmt=fmt)
+        self.scheduleDestroyFormat(device=sda1)
+        self._checkPruning()
+
+        # resizes of an existing device that is then destroyed
+        lv_root = devicetree.getDeviceByName("VolGroup-lv_root")
+        lv_root.format._minInstanceSize = Size("10 MiB")
+        lv_root.format._targetSize = lv_root.format._minInstanceSize
+        for delta in (Size("5 GiB"), Size("10 GiB")):
+            devicetree.registerAction(ActionResizeFormat(lv_root,
+                                                         lv_root.size - delta))
+            devicetree.registerAction(ActionResizeDevice(lv_root,
+                                                         lv_root.size - delta))
+        self._checkPruning()
+
+        self.scheduleDestroyFormat(device=lv_root)
+        self.scheduleDestroyDevice(device=lv_root)
+        self._checkPruning()
+
     def testActionDependencies(self):
         """ Verify correct functioning of action dependencies. """
         # ActionResizeDevice
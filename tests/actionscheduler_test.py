@@ -0,0 +1,105 @@
+#!/usr/bin/python
+
+import sys
+import threading
+import traceback
+import unittest
+
+from mock import Mock
+
+from blivet.actionscheduler import ActionScheduler
+from blivet.tsort import create_graph
+
+class ActionSchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.disks = [Mock(id=i) for i in range(3)]
+        for disk in self.disks:
+            disk.disks = [disk]
+
+    def _action(self, name, disks):
+        action = Mock(device=Mock(id=name, disks=disks), container=None)
+        action.name = name
+        return action
+
+    def _names(self, steps):
+        return [[a.name for a in step] for step in steps]
+
+    def testPlan(self):
+        (sda, sdb, sdc) = self.disks
+        actions = [self._action("a", [sda]),
+                   self._action("b", [sda]),
+                   self._action("c", [sdb]),
+                   self._action("d", [sdc]),
+                   self._action("e", [sdb, sdc])]
+
+        # actions on different disks run together, actions on the same disk
+        # run in list order
+        graph = create_graph(range(len(actions)), [])
+        steps = ActionScheduler(actions, graph, jobs=4).plan()
+        self.assertEqual(self._names(steps), [["a", "c", "d"], ["b", "e"]])
+
+        # the number of jobs limits the size of each step
+        graph = create_graph(range(len(actions)), [])
+        steps = ActionScheduler(actions, graph, jobs=2).plan()
+        self.assertEqual(self._names(steps), [["a", "c"], ["b", "d"], ["e"]])
+
+        # edges and ranks are respected
+        graph = create_graph(range(len(actions)), [(0, 2)],
+                             ranks={0: 1000, 3: 1000, 1: 100})
+        steps = ActionScheduler(actions, graph, jobs=4).plan()
+        self.assertEqual(self._names(steps), [["a", "d"], ["b", "c"], ["e"]])
+
+    def testRun(self):
+        (sda, sdb, sdc) = self.disks
+        actions = [self._action(str(i), [self.disks[i % 3]]) for i in range(9)]
+        graph = create_graph(range(len(actions)), [(0, 4)])
+        main_thread = threading.current_thread()
+        executed = []
+        completed = []
+
+        def execute(action):
+            executed.append(action)
+
+        def complete(action):
+            self.assertEqual(threading.current_thread(), main_thread)
+            self.assertTrue(action in executed)
+            completed.append(action)
+
+        ActionScheduler(actions, graph, jobs=3).run(execute, complete)
+        self.assertEqual(sorted(completed), sorted(actions))
+        self.assertTrue(completed.index(actions[0]) < completed.index(actions[4]))
+        for disk in (sda, sdb, sdc):
+            on_disk = [a for a in completed if a.device.disks == [disk]]
+            self.assertEqual(on_disk, [a for a in actions if a in on_disk])
+
+    def testError(self):
+        (sda, sdb, _sdc) = self.disks
+        actions = [self._action("a", [sda]),
+                   self._action("b", [sdb]),
+                   self._action("c", [sda])]
+        graph = create_graph(range(len(actions)), [])
+        completed = []
+
+        def fail():
+            raise RuntimeError("failed")
+
+        def execute(action):
+            if action.name == "a":
+                fail()
+
+        # the error is raised once running actions finish and no actions are
+        # started after it
+        scheduler = ActionScheduler(actions, graph, jobs=2)
+        with self.assertRaises(RuntimeError):
+            try:
+                scheduler.run(execute, completed.append)
+            except RuntimeError:
+                # the traceback leads to where the action failed
+                tb = traceback.extract_tb(sys.exc_info()[2])
+                self.assertEqual(tb[-1][2], "fail")
+                raise
+
+        self.assertEqual([a.name for a in completed], ["b"])
+
+if __name__ == "__main__":
+    unittest.main()
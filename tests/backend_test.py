@@ -0,0 +1,85 @@
+#!/usr/bin/python
+
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+
+from blivet import util
+from blivet.backend import RecordingBackend, ReplayBackend, SystemBackend, get_backend, set_backend
+
+class BackendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="backend-test-")
+        self.path = os.path.join(self.tmpdir, "attr")
+        self.saved = get_backend()
+
+    def tearDown(self):
+        set_backend(self.saved)
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, data):
+        with open(self.path, "w") as f:
+            f.write(data)
+
+    def testRecordReplay(self):
+        recording = RecordingBackend()
+        self.assertIs(set_backend(recording), self.saved)
+
+        self._write("1\n")
+        self.assertEqual(util.read_file(self.path), "1\n")
+        self._write("2\n")
+        self.assertEqual(util.read_file(self.path), "2\n")
+        missing = os.path.join(self.tmpdir, "missing")
+        self.assertIsNone(util.read_file(missing))
+        self.assertEqual(util.run_program_and_capture_output(["sh", "-c", "printf '\\377'; exit 3"]),
+                         (3, "\xff"))
+        self.assertRaises(OSError, util.run_program, ["/nonexistent/program"])
+
+        records = os.path.join(self.tmpdir, "records.json")
+        recording.save(records)
+        replay = ReplayBackend(records)
+        set_backend(replay)
+        os.unlink(self.path)
+
+        # results are returned in order, then the last one again
+        self.assertEqual(util.read_file(self.path), "1\n")
+        self.assertEqual(util.read_file(self.path), "2\n")
+        self.assertEqual(util.read_file(self.path), "2\n")
+        self.assertIsNone(util.read_file(missing))
+        self.assertEqual(util.run_program_and_capture_output(["sh", "-c", "printf '\\377'; exit 3"]),
+                         (3, "\xff"))
+        self.assertRaises(OSError, util.run_program, ["/nonexistent/program"])
+        self.assertEqual(replay.misses, 0)
+
+        # anything that was not recorded does not exist
+        try:
+            util.run_program(["true"])
+        except OSError as e:
+            self.assertEqual(e.errno, errno.ENOENT)
+        else:
+            self.fail("unrecorded program was run")
+        self.assertIsNone(util.get_sysfs_attr("/devices/virtual/block/sda", "ro"))
+        self.assertEqual(replay.misses, 2)
+
+    def testResultsAreCopies(self):
+        replay = ReplayBackend({"udev-device": {"/block/sda": [{"result": {"name": "sda"}}]}})
+        info = replay.query("udev-device", "/block/sda", None)
+        info["ID_FS_TYPE"] = "multipath_member"
+        self.assertEqual(replay.query("udev-device", "/block/sda", None),
+                         {"name": "sda"})
+
+        recording = RecordingBackend()
+        info = recording.query("udev-device", "/block/sda", lambda: {"name": "sda"})
+        info["ID_FS_TYPE"] = "multipath_member"
+        self.assertEqual(recording.records["udev-device"]["/block/sda"],
+                         [{"result": {"name": "sda"}}])
+
+    def testSystem(self):
+        self._write("system")
+        self.assertEqual(SystemBackend().query("file", self.path, util.read_file, self.path),
+                         "system")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+#
+# clearpart_benchmark.py
+# Measure how Blivet.clearPartitions scales with the number of disks.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# Usage: PYTHONPATH=.:tests/ python tests/benchmarks/clearpart_benchmark.py
+#
+
+from mock import Mock
+
+from pykickstart.constants import CLEARPART_TYPE_ALL
+from parted import PARTITION_NORMAL
+
+import blivet
+from blivet.devices import DiskDevice
+from blivet.devices import LVMLogicalVolumeDevice
+from blivet.devices import LVMVolumeGroupDevice
+from blivet.devices import MDRaidArrayDevice
+from blivet.devices import PartitionDevice
+from blivet.flags import flags
+from blivet.formats import getFormat
+from blivet.size import Size
+
+from benchmarks.common import best_time, get_parser, parse_args, print_table
+
+def stacked_storage(count):
+    """ Return a Blivet instance with lvm on md raid1 on pairs of disks.
+
+        Each disk has a single partition. Each pair of partitions is a raid1
+        array holding a volume group with one logical volume.
+    """
+    b = blivet.Blivet()
+    b.config.clearPartType = CLEARPART_TYPE_ALL
+    tree = b.devicetree
+    parts = []
+    for i in range(count):
+        disk = DiskDevice("sd%d" % i, size=Size("10 GiB"), exists=True)
+        disk.format = getFormat("disklabel", device=disk.path, exists=True)
+        disk.format._partedDisk = Mock(**{"partitions": [],
+                                          "getExtendedPartition.return_value": None,
+                                          "getLogicalPartitions.return_value": []})
+        disk.format._partedDevice = Mock()
+        tree._addDevice(disk)
+
+        part = PartitionDevice("sd%dp1" % i, size=Size("9 GiB"), exists=True,
+                               parents=[disk])
+        part._partedPartition = Mock(**{"type": PARTITION_NORMAL,
+                                        "number": 1,
+                                        "path": part.path,
+                                        "getDeviceNodeName.return_value": part.path,
+                                        "getLength.return_value": 9 * 1024**3,
+                                        "getFlag.return_value": 0,
+                                        "disk.partitions": []})
+        part.format = getFormat("mdmember", device=part.path, exists=True)
+        tree._addDevice(part)
+        parts.append(part)
+
+    for i in range(0, len(parts) - 1, 2):
+        md = MDRaidArrayDevice("md%d" % (i // 2), level="raid1",
+                               memberDevices=2, totalDevices=2,
+                               parents=parts[i:i + 2])
+        md.exists = True
+        md.format = getFormat("lvmpv", device=md.path, exists=True)
+        tree._addDevice(md)
+
+        vg = LVMVolumeGroupDevice("vg%d" % (i // 2), parents=[md], exists=True)
+        tree._addDevice(vg)
+
+        lv = LVMLogicalVolumeDevice("lv", parents=[vg], size=Size("1 GiB"),
+                                    exists=True)
+        lv.format = getFormat("ext4", device=lv.path, exists=True)
+        tree._addDevice(lv)
+
+    return b
+
+def main():
+    parser = get_parser("Time Blivet.clearPartitions against the number of "
+                        "disks holding lvm on md on partitions.",
+                        [250, 500, 1000])
+    args = parse_args(parser)
+    flags.testing = True
+
+    rows = []
+    for size in args.sizes:
+        elapsed = best_time(lambda b: b.clearPartitions(),
+                            repeat=args.repeat,
+                            setup=lambda: stacked_storage(size))
+        b = stacked_storage(size)
+        devices = len(b.devicetree.devices)
+        b.clearPartitions()
+        rows.append((size, devices, len(b.devicetree.findActions()),
+                     "%.3f" % elapsed, "%.1f" % (elapsed * 1e3 / size)))
+
+    print_table("Blivet.clearPartitions",
+                ("disks", "devices", "actions", "clearpart (s)", "msec/disk"),
+                rows)
+
+if __name__ == "__main__":
+    main()
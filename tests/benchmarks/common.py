@@ -0,0 +1,81 @@
+# common.py
+# Helpers shared by the scaling benchmarks.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+from __future__ import print_function
+
+import argparse
+import logging
+import time
+
+def best_time(func, repeat=3, setup=None):
+    """ Return the best wall clock time of several calls to func.
+
+        :param func: the function to time
+        :type func: callable
+        :keyword int repeat: how many times to call func
+        :keyword setup: a function to call, untimed, before each call to func;
+                        its return value is passed to func
+        :type setup: callable or None
+        :returns: the shortest time in seconds
+        :rtype: float
+    """
+    best = None
+    for _i in range(repeat):
+        arg = setup() if setup else None
+        start = time.time()
+        if setup:
+            func(arg)
+        else:
+            func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+def print_table(title, header, rows):
+    """ Print benchmark results as a simple text table. """
+    print(title)
+    widths = [max(len(str(c)) for c in column) for column in zip(header, *rows)]
+    fmt = "  ".join("%%%ds" % w for w in widths)
+    print(fmt % tuple(header))
+    for row in rows:
+        print(fmt % tuple(row))
+
+def get_parser(description, sizes):
+    """ Return an argument parser with the options all benchmarks accept.
+
+        :param str description: the benchmark's description
+        :param sizes: default problem sizes
+        :type sizes: list of int
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--sizes", default=",".join(str(s) for s in sizes),
+                        help="comma-separated list of problem sizes")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of runs per size; the best is reported")
+    return parser
+
+def parse_args(parser):
+    """ Parse the command line and quiet the library's logging. """
+    args = parser.parse_args()
+    args.sizes = [int(s) for s in args.sizes.split(",")]
+    logging.getLogger("blivet").setLevel(logging.CRITICAL)
+    return args
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+#
+# lvmshell_benchmark.py
+# Compare running lvm commands in an lvm shell with starting lvm for each.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# Usage (as root): PYTHONPATH=.:tests/ python tests/benchmarks/lvmshell_benchmark.py
+#
+
+from __future__ import print_function
+
+import os
+import tempfile
+import time
+
+from blivet.devicelibs import lvm
+from blivet.flags import flags
+from blivet.size import Size
+from blivet import util
+
+from benchmarks.common import get_parser, parse_args, print_table
+
+VG_NAME = "blivet-bench-vg"
+LV_SIZE = Size("4 MiB")
+
+def setup_vg(count):
+    """ Create a VG on a loop device with room for count LVs.
+
+        :returns: the loop device and its backing file
+        :rtype: tuple of str
+    """
+    (fd, backing) = tempfile.mkstemp(prefix="lvmshell-bench-")
+    os.ftruncate(fd, int(LV_SIZE * (count + 16)))
+    os.close(fd)
+    dev = util.capture_output(["losetup", "-f", "--show", backing]).strip()
+    lvm.pvcreate(dev)
+    lvm.vgcreate(VG_NAME, [dev], LV_SIZE)
+    return (dev, backing)
+
+def teardown_vg(dev, backing):
+    lvm.vgdeactivate(VG_NAME)
+    lvm.vgremove(VG_NAME)
+    lvm.pvremove(dev)
+    util.run_program(["losetup", "-d", dev])
+    os.unlink(backing)
+
+def run(count, repeat):
+    """ Return the best times to create and to activate count LVs. """
+    best_create = best_activate = None
+    for _i in range(repeat):
+        (dev, backing) = setup_vg(count)
+        try:
+            start = time.time()
+            for i in range(count):
+                lvm.lvcreate(VG_NAME, "lv%d" % i, LV_SIZE)
+            create = time.time() - start
+
+            lvm.vgdeactivate(VG_NAME)
+            start = time.time()
+            for i in range(count):
+                lvm.lvactivate(VG_NAME, "lv%d" % i)
+            activate = time.time() - start
+        finally:
+            teardown_vg(dev, backing)
+            lvm.stop_shell()
+
+        best_create = min(create, best_create or create)
+        best_activate = min(activate, best_activate or activate)
+
+    return (best_create, best_activate)
+
+def main():
+    parser = get_parser("Time creating and activating LVs one at a time, "
+                        "starting lvm for each command and running them all "
+                        "in one lvm shell.",
+                        [100, 500])
+    args = parse_args(parser)
+    if os.geteuid() != 0:
+        print("lvm shell benchmark skipped: it creates a VG on a loop device "
+              "and must be run as root")
+        return
+
+    rows = []
+    for size in args.sizes:
+        for shell in (False, True):
+            flags.lvm_shell = shell
+            (create, activate) = run(size, args.repeat)
+            rows.append((size, "shell" if shell else "process",
+                         "%.3f" % create, "%.3f" % activate,
+                         "%.1f" % ((create + activate) * 1e3 / (2 * size))))
+
+    print_table("lvm.lvcreate and lvm.lvactivate",
+                ("LVs", "backend", "create (s)", "activate (s)", "msec/command"),
+                rows)
+
+if __name__ == "__main__":
+    main()
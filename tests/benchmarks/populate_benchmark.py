@@ -0,0 +1,143 @@
+#!/usr/bin/python
+#
+# populate_benchmark.py
+# Measure how DeviceTree.populate scales with the number of devices.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# Usage: PYTHONPATH=.:tests/ python tests/benchmarks/populate_benchmark.py
+#
+# With --record FILE, populate from the running system instead, saving every
+# command, sysfs read and udev query to FILE. With --replay FILE, time
+# populate answering those queries from FILE, e.g. on another machine.
+#
+
+from __future__ import print_function
+
+from mock import patch
+
+from blivet.backend import RecordingBackend, ReplayBackend, load, set_backend
+from blivet.devicetree import DeviceTree
+from blivet import udev
+from blivet import util
+from blivet.devicelibs import mpath
+
+from benchmarks.common import best_time, get_parser, parse_args, print_table
+
+def udev_disks(count):
+    """ Return udev db entries for count swap-formatted disks. """
+    disks = []
+    for i in range(count):
+        name = "sd%d" % i
+        disks.append({"name": name,
+                      "sysfs_path": "/devices/virtual/block/%s" % name,
+                      "DEVTYPE": "disk",
+                      "MAJOR": "8",
+                      "MINOR": str(i),
+                      "ID_FS_TYPE": "swap",
+                      "ID_FS_UUID": "00000000-0000-0000-0000-%012d" % i,
+                      "symlinks": ["/dev/disk/by-id/wwn-%d" % i]})
+    return disks
+
+def populate(disks):
+    tree = DeviceTree()
+    with patch.object(udev, "udev_get_block_devices", return_value=disks), \
+         patch.object(udev, "udev_settle"), \
+         patch.object(util, "get_sysfs_attr", return_value="0"), \
+         patch.object(mpath, "is_multipath_member", return_value=False):
+        tree.populate()
+
+    return tree
+
+def lookup_all(tree, disks):
+    """ Look up every disk by name, format uuid, sysfs path and path. """
+    for disk in disks:
+        tree.getDeviceByName(disk["name"])
+        tree.getDeviceByUuid(disk["ID_FS_UUID"])
+        tree.getDeviceBySysfsPath(disk["sysfs_path"])
+        tree.getDeviceByPath("/dev/" + disk["name"])
+
+def record(path):
+    """ Populate from the running system, saving its answers to path. """
+    backend = RecordingBackend()
+    previous = set_backend(backend)
+    try:
+        tree = DeviceTree()
+        tree.populate()
+    finally:
+        set_backend(previous)
+
+    backend.save(path)
+    print("recorded %d devices to %s" % (len(tree.devices), path))
+
+def replay(path, repeat):
+    """ Time populate with the answers recorded in path. """
+    records = load(path)
+
+    def run(backend):
+        previous = set_backend(backend)
+        try:
+            tree = DeviceTree()
+            tree.populate()
+        finally:
+            set_backend(previous)
+        return tree
+
+    elapsed = best_time(run, repeat=repeat,
+                        setup=lambda: ReplayBackend(records))
+    tree = run(ReplayBackend(records))
+    print_table("DeviceTree.populate replaying %s" % path,
+                ("devices", "populate (s)", "usec/device"),
+                [(len(tree.devices), "%.3f" % elapsed,
+                  "%.1f" % (elapsed * 1e6 / max(len(tree.devices), 1)))])
+
+def main():
+    parser = get_parser("Time DeviceTree.populate against the number of disks.",
+                        [250, 500, 1000, 2000])
+    parser.add_argument("--record", metavar="FILE",
+                        help="populate from this system, saving what it "
+                             "reported to FILE")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="time populate with what a --record run saved "
+                             "to FILE instead of with synthetic disks")
+    args = parse_args(parser)
+
+    if args.record:
+        record(args.record)
+        return
+    elif args.replay:
+        replay(args.replay, args.repeat)
+        return
+
+    rows = []
+    for size in args.sizes:
+        disks = udev_disks(size)
+        elapsed = best_time(lambda: populate([dict(d) for d in disks]),
+                            repeat=args.repeat)
+        tree = populate(disks)
+        lookups = best_time(lambda: lookup_all(tree, disks),
+                            repeat=args.repeat)
+        rows.append((size, "%.3f" % elapsed, "%.1f" % (elapsed * 1e6 / size),
+                     "%.3f" % lookups, "%.1f" % (lookups * 1e6 / size)))
+
+    print_table("DeviceTree.populate and lookups",
+                ("devices", "populate (s)", "usec/device",
+                 "lookups (s)", "usec/device"),
+                rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/python
+#
+# scaling_benchmark.py
+# Measure how the main tree, action and partitioning operations scale with
+# the number of disks in a synthetic device tree.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# Usage: PYTHONPATH=.:tests/ python tests/benchmarks/scaling_benchmark.py \
+#            [--sizes 100,1000] [--json results.json] [--baseline old.json]
+#
+# The disks are sparse images in /tmp, see benchmarks.topology. Save the
+# results of one run with --json and pass them to a later run with
+# --baseline to see how each operation changed; the run fails if any got
+# slower by more than --threshold.
+#
+
+from __future__ import print_function
+
+import json
+import os
+import sys
+import time
+
+from pykickstart.constants import CLEARPART_TYPE_NONE
+
+from blivet.flags import flags
+from blivet.partitioning import doPartitioning
+from blivet.partitioning import growLVM
+
+from benchmarks.common import best_time, get_parser, parse_args, print_table
+from benchmarks.topology import add_requests
+from benchmarks.topology import reformat
+from benchmarks.topology import remove_images
+from benchmarks.topology import synthetic_storage
+
+def lookups(storage, repeat):
+    """ Look up every device by name, by path and by uuid. """
+    tree = storage.devicetree
+    devices = tree.devices[:]
+
+    def lookup():
+        for device in devices:
+            tree.getDeviceByName(device.name)
+            tree.getDeviceByPath(device.path)
+            if device.uuid or device.format.uuid:
+                tree.getDeviceByUuid(device.uuid or device.format.uuid)
+
+    return (best_time(lookup, repeat=repeat), len(devices))
+
+def dependents(storage, repeat):
+    """ Find the devices built on each disk. """
+    tree = storage.devicetree
+    disks = storage.disks
+
+    def find():
+        for disk in disks:
+            tree.getDependentDevices(disk)
+
+    return (best_time(find, repeat=repeat), len(disks))
+
+def _scheduled(storage):
+    """ Return a copy of storage with more actions, and its actions. """
+    work = storage.copy()
+    reformat(work)
+    return (work.devicetree, work.devicetree._actions[:])
+
+def prune(storage, repeat):
+    (tree, actions) = _scheduled(storage)
+
+    def setup():
+        tree._actions = actions[:]
+
+    return (best_time(lambda _a: tree.pruneActions(), repeat=repeat,
+                      setup=setup),
+            len(actions))
+
+def sort(storage, repeat):
+    (tree, actions) = _scheduled(storage)
+    tree._actions = actions
+    tree.pruneActions()
+    actions = tree._actions[:]
+
+    def setup():
+        tree._actions = actions[:]
+
+    return (best_time(lambda _a: tree.sortActions(), repeat=repeat,
+                      setup=setup),
+            len(actions))
+
+def partitioning(storage, repeat):
+    # doPartitioning changes the requests it allocates, so each run is on a
+    # new copy
+    return (best_time(doPartitioning, repeat=repeat, setup=storage.copy),
+            len(storage.disks))
+
+def _partitioned(storage):
+    work = storage.copy()
+    doPartitioning(work)
+    return work
+
+def grow(storage, repeat):
+    return (best_time(growLVM, repeat=repeat,
+                      setup=lambda: _partitioned(storage)),
+            len(storage.vgs))
+
+def copy(storage, repeat):
+    return (best_time(storage.copy, repeat=repeat),
+            len(storage.devicetree.devices))
+
+def snapshot(storage, repeat):
+    def take():
+        storage.snapshot().release()
+
+    return (best_time(take, repeat=repeat), len(storage.devicetree.devices))
+
+def free_space(storage, repeat):
+    return (best_time(lambda: storage.getFreeSpace(clearPartType=CLEARPART_TYPE_NONE),
+                      repeat=repeat),
+            len(storage.disks))
+
+def ksdata(storage, repeat):
+    return (best_time(storage.updateKSData, repeat=repeat),
+            len(storage.mountpoints))
+
+# name, function returning the best time and the number of items handled
+OPERATIONS = [("lookups", lookups),
+              ("getDependentDevices", dependents),
+              ("pruneActions", prune),
+              ("sortActions", sort),
+              ("doPartitioning", partitioning),
+              ("growLVM", grow),
+              ("copy", copy),
+              ("snapshot", snapshot),
+              ("getFreeSpace", free_space),
+              ("updateKSData", ksdata)]
+
+def run(count, operations, repeat):
+    """ Return the results of operations on a tree of count disks.
+
+        :returns: a dict per operation, with the number of disks, devices
+                  and items handled and the best time in seconds
+        :rtype: list of dict
+    """
+    start = time.time()
+    storage = synthetic_storage(count, prefix="scaling%d-" % os.getpid())
+    try:
+        add_requests(storage)
+        results = [{"disks": count, "devices": len(storage.devicetree.devices),
+                    "operation": "generate", "items": count,
+                    "seconds": time.time() - start}]
+        for (name, func) in OPERATIONS:
+            if name not in operations:
+                continue
+
+            (seconds, items) = func(storage, repeat)
+            results.append({"disks": count,
+                            "devices": len(storage.devicetree.devices),
+                            "operation": name, "items": items,
+                            "seconds": seconds})
+    finally:
+        remove_images(storage)
+
+    return results
+
+def compare(results, baseline, threshold):
+    """ Add each result's ratio to the baseline's time for the same run.
+
+        :returns: the results that took more than threshold times as long
+        :rtype: list of dict
+    """
+    old = dict(((r["disks"], r["operation"]), r["seconds"])
+               for r in baseline["results"])
+    slower = []
+    for result in results:
+        seconds = old.get((result["disks"], result["operation"]))
+        if not seconds:
+            result["ratio"] = None
+            continue
+
+        result["ratio"] = result["seconds"] / seconds
+        if result["ratio"] > threshold:
+            slower.append(result)
+
+    return slower
+
+def main():
+    parser = get_parser("Time device tree lookups, action pruning and "
+                        "sorting, partitioning, copying, snapshots, free "
+                        "space and kickstart data against the number of "
+                        "disks in a synthetic tree of lvm with thin pools "
+                        "on md, luks and btrfs on gpt partitions.",
+                        [100, 1000, 10000])
+    parser.add_argument("--operations",
+                        default=",".join(name for (name, _f) in OPERATIONS),
+                        help="comma-separated list of operations to time")
+    parser.add_argument("--json", metavar="FILE",
+                        help="write the results to FILE, as JSON")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="compare with results written by --json")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="fail if an operation takes this many times as "
+                             "long as in the baseline")
+    args = parse_args(parser)
+    operations = args.operations.split(",")
+    flags.testing = True
+
+    results = []
+    for count in args.sizes:
+        results.extend(run(count, operations, args.repeat))
+
+    slower = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = compare(results, json.load(f), args.threshold)
+
+    rows = []
+    for result in results:
+        row = [result["disks"], result["devices"], result["operation"],
+               result["items"], "%.3f" % result["seconds"],
+               "%.1f" % (result["seconds"] * 1e6 / max(result["items"], 1))]
+        if args.baseline:
+            ratio = result.get("ratio")
+            row.append("%.2f" % ratio if ratio is not None else "-")
+        rows.append(row)
+
+    header = ["disks", "devices", "operation", "items", "time (s)",
+              "usec/item"]
+    if args.baseline:
+        header.append("vs baseline")
+    print_table("Scaling with the number of disks", header, rows)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results": results}, f, indent=2, sort_keys=True)
+
+    for result in slower:
+        print("%s on %d disks took %.2f times as long as the baseline"
+              % (result["operation"], result["disks"], result["ratio"]),
+              file=sys.stderr)
+
+    if slower:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/python
+#
+# size_benchmark.py
+# Microbenchmarks of Size construction and arithmetic.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# Usage: PYTHONPATH=.:tests/ python tests/benchmarks/size_benchmark.py
+#
+
+from decimal import Decimal, ROUND_DOWN
+
+from blivet.size import Size
+
+from benchmarks.common import best_time, get_parser, parse_args, print_table
+
+def _decimal(value):
+    """ What constructing a Size cost when it was a Decimal subclass. """
+    return Decimal(value).to_integral_value(rounding=ROUND_DOWN)
+
+# name, setup, operation; each operation is run on the values from its setup
+OPERATIONS = [
+    ("construct from int",
+     lambda mk: 1073741824, lambda mk, v: mk(v)),
+    ("construct from spec",
+     lambda mk: "1.5 GiB", lambda mk, v: Size(v)),
+    ("a + b",
+     lambda mk: (mk(1073741824), mk(4096)), lambda mk, v: v[0] + v[1]),
+    ("a - int",
+     lambda mk: (mk(1073741824), 4096), lambda mk, v: v[0] - v[1]),
+    ("a * int",
+     lambda mk: (mk(4194304), 255), lambda mk, v: v[0] * v[1]),
+    ("a * Decimal",
+     lambda mk: (mk(4194304), Decimal("1.1")), lambda mk, v: v[0] * v[1]),
+    ("a / b",
+     lambda mk: (mk(1073741824), mk(4194304)), lambda mk, v: v[0] / v[1]),
+    ("a % b",
+     lambda mk: (mk(1073741825), mk(4096)), lambda mk, v: v[0] % v[1]),
+    ("a < b",
+     lambda mk: (mk(1073741824), mk(4096)), lambda mk, v: v[0] < v[1]),
+    ("str",
+     lambda mk: mk(58929971), lambda mk, v: str(v)),
+    ("sum of 10",
+     lambda mk: [mk(i * 4096) for i in range(10)], lambda mk, v: sum(v)),
+]
+
+def run(count, repeat, mk, setup, operation):
+    """ Return the best time, in usec, of one operation. """
+    value = setup(mk)
+    loop = range(count)
+
+    def bench():
+        for _i in loop:
+            operation(mk, value)
+
+    return best_time(bench, repeat=repeat) * 1e6 / count
+
+def main():
+    parser = get_parser("Time constructing Size objects and doing arithmetic "
+                        "on them, against the same operations on Decimal.",
+                        [100000])
+    args = parse_args(parser)
+
+    rows = []
+    for count in args.sizes:
+        for (name, setup, operation) in OPERATIONS:
+            size_usec = run(count, args.repeat, Size, setup, operation)
+            decimal_usec = run(count, args.repeat, _decimal, setup, operation)
+            rows.append((name, count, "%.2f" % size_usec,
+                         "%.2f" % decimal_usec))
+
+    print_table("Size construction and arithmetic",
+                ("operation", "iterations", "Size (usec)", "Decimal (usec)"),
+                rows)
+
+if __name__ == "__main__":
+    main()
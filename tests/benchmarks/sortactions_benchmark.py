@@ -0,0 +1,58 @@
+#!/usr/bin/python
+#
+# sortactions_benchmark.py
+# Measure how DeviceTree.sortActions scales with the number of actions.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# Usage: PYTHONPATH=.:tests/ python tests/benchmarks/sortactions_benchmark.py
+#
+
+from blivet.flags import flags
+
+from benchmarks.clearpart_benchmark import stacked_storage
+from benchmarks.common import best_time, get_parser, parse_args, print_table
+
+def main():
+    parser = get_parser("Time DeviceTree.sortActions against the number of "
+                        "actions needed to clear and relabel disks holding "
+                        "lvm on md on partitions.",
+                        [100, 250, 500, 1000])
+    args = parse_args(parser)
+    flags.testing = True
+
+    rows = []
+    for size in args.sizes:
+        b = stacked_storage(size)
+        b.clearPartitions()
+        tree = b.devicetree
+        actions = tree._actions[:]
+
+        def sort():
+            tree._actions = actions[:]
+            tree.sortActions()
+
+        elapsed = best_time(sort, repeat=args.repeat)
+        rows.append((size, len(actions), "%.3f" % elapsed,
+                     "%.1f" % (elapsed * 1e6 / len(actions))))
+
+    print_table("DeviceTree.sortActions",
+                ("disks", "actions", "sort (s)", "usec/action"),
+                rows)
+
+if __name__ == "__main__":
+    main()
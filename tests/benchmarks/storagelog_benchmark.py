@@ -0,0 +1,92 @@
+#!/usr/bin/python
+#
+# storagelog_benchmark.py
+# Microbenchmarks of log_method_call with debug logging on and off.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# Usage: PYTHONPATH=.:tests/ python tests/benchmarks/storagelog_benchmark.py
+#
+
+import inspect
+import logging
+
+from blivet import storage_log
+
+from benchmarks.common import best_time, get_parser, parse_args, print_table
+
+def _stack_call(d, *args, **kwargs):
+    """ What log_method_call cost when it always walked inspect.stack(). """
+    classname = d.__class__.__name__
+    stack = inspect.stack()
+    (methodname, depth) = (stack[1][3], len(stack) - 1)
+    storage_log.log.debug("%s%s.%s: %s %s", depth * ' ', classname,
+                          methodname, args, kwargs)
+
+class Device(object):
+    def __init__(self, log_call):
+        self.log_call = log_call
+
+    def setup(self):
+        self.log_call(self, "sda", status=True)
+
+def run(count, repeat, log_call, level, timing=False):
+    """ Return the best time, in usec, of one traced method call. """
+    device = Device(log_call)
+    loop = range(count)
+
+    def bench():
+        for _i in loop:
+            device.setup()
+
+    storage_log.log.setLevel(level)
+    if timing:
+        storage_log.method_timer.start()
+    try:
+        return best_time(bench, repeat=repeat) * 1e6 / count
+    finally:
+        storage_log.method_timer.stop()
+        storage_log.method_timer.resetStats()
+
+def main():
+    parser = get_parser("Time a method that calls log_method_call, with "
+                        "debug logging off and on, against walking "
+                        "inspect.stack() on every call.", [10000])
+    args = parse_args(parser)
+
+    # log to nowhere, so only the tracing itself is timed
+    storage_log.log.propagate = False
+
+    rows = []
+    for count in args.sizes:
+        for (name, level) in (("off", logging.INFO), ("on", logging.DEBUG)):
+            new_usec = run(count, args.repeat, storage_log.log_method_call,
+                           level)
+            stack_usec = run(count, args.repeat, _stack_call, level)
+            rows.append((name, count, "%.2f" % new_usec, "%.2f" % stack_usec))
+
+        timed_usec = run(count, args.repeat, storage_log.log_method_call,
+                         logging.INFO, timing=True)
+        rows.append(("timer", count, "%.2f" % timed_usec, "-"))
+
+    print_table("log_method_call",
+                ("debug", "calls", "log_method_call (usec)",
+                 "inspect.stack (usec)"),
+                rows)
+
+if __name__ == "__main__":
+    main()
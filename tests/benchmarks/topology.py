@@ -0,0 +1,274 @@
+# topology.py
+# Synthetic device trees of many disks for the scaling benchmarks.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+
+import os
+import uuid
+
+import parted
+
+from pykickstart.version import makeVersion
+
+import blivet
+from blivet.devices import BTRFSSubVolumeDevice
+from blivet.devices import BTRFSVolumeDevice
+from blivet.devices import DMDevice
+from blivet.devices import DiskDevice
+from blivet.devices import LUKSDevice
+from blivet.devices import LVMLogicalVolumeDevice
+from blivet.devices import LVMThinLogicalVolumeDevice
+from blivet.devices import LVMThinPoolDevice
+from blivet.devices import LVMVolumeGroupDevice
+from blivet.devices import MDRaidArrayDevice
+from blivet.devices import PartitionDevice
+from blivet.formats import getFormat
+from blivet.size import Size
+
+# parted names a partition by dropping the first five characters, meant to
+# be "/dev/", of its node's path, so the images must be in a directory whose
+# path is four characters long for the names to come out right
+IMAGE_DIR = "/tmp"
+
+DISK_SIZE = Size("32 GiB")
+
+# the existing gpt partitions on each disk, in order; the rest of the disk
+# is left free for new partitions
+PARTITIONS = [("mdmember", Size("4 GiB")),
+              ("luks", Size("2 GiB")),
+              ("btrfs", Size("4 GiB"))]
+
+class ImageDiskDevice(DiskDevice):
+    """ A disk whose device node is a sparse image file in :data:`IMAGE_DIR`.
+
+        parted reads and writes the image like it would a disk, so the
+        disklabel and partitions are real, but nothing needs root.
+    """
+    _devDir = IMAGE_DIR
+
+def _uuid(n):
+    return str(uuid.UUID(int=n))
+
+def _write_disklabel(path):
+    """ Create a sparse image at path with a gpt disklabel holding
+        :data:`PARTITIONS`.
+    """
+    with open(path, "w") as f:
+        f.truncate(int(DISK_SIZE))
+
+    device = parted.Device(path=path)
+    disk = parted.freshDisk(device, "gpt")
+    start = int(Size("1 MiB")) // device.sectorSize
+    for (_fmt_type, size) in PARTITIONS:
+        length = int(size) // device.sectorSize
+        geometry = parted.Geometry(device=device, start=start, length=length)
+        partition = parted.Partition(disk=disk, type=parted.PARTITION_NORMAL,
+                                     geometry=geometry)
+        disk.addPartition(partition=partition,
+                          constraint=parted.Constraint(exactGeom=geometry))
+        start += length
+
+    disk.commitToDevice()
+
+def _deactivate():
+    """ Report the synthetic devices as inactive without asking the system.
+
+        This is what :class:`~storagetestcase.StorageTestCase` does, for the
+        same reason: none of the md, lvm or dm devices really exist.
+    """
+    DMDevice.status = False
+    LUKSDevice.status = False
+    LVMVolumeGroupDevice.status = False
+    MDRaidArrayDevice.status = False
+
+def _add_disk(tree, name):
+    """ Add disk name, with its partitions, to tree.
+
+        :returns: the partitions
+        :rtype: list of :class:`~.devices.PartitionDevice`
+    """
+    path = "%s/%s" % (IMAGE_DIR, name)
+    _write_disklabel(path)
+
+    disk = ImageDiskDevice(name, exists=True)
+    disk.format = getFormat("disklabel", device=disk.path, exists=True)
+    tree._addDevice(disk)
+
+    parts = []
+    for (number, (fmt_type, _size)) in enumerate(PARTITIONS, start=1):
+        # flags.testing stops PartitionDevice from looking up its parted
+        # partition, which is done here instead
+        part = PartitionDevice("%sp%d" % (name, number), exists=True,
+                               parents=[disk])
+        part.partedPartition = disk.format.partedDisk.getPartitionByPath(part.path)
+        part.probe()
+        part.format = getFormat(fmt_type, device=part.path, exists=True)
+        tree._addDevice(part)
+        parts.append(part)
+
+    return parts
+
+def _add_stacks(tree, n, first, second):
+    """ Add the devices on the partitions of disk pair number n.
+
+        - raid1 of the first partitions, holding a volume group with a thin
+          pool of two thin volumes and a plain logical volume
+        - luks on each of the second partitions
+        - raid1 btrfs volume of the third partitions, with two subvolumes
+    """
+    md = MDRaidArrayDevice("md%d" % n, level="raid1",
+                           memberDevices=2, totalDevices=2,
+                           parents=[first[0], second[0]])
+    md.exists = True
+    md.format = getFormat("lvmpv", device=md.path, exists=True)
+    tree._addDevice(md)
+
+    vg = LVMVolumeGroupDevice("vg%d" % n, parents=[md], exists=True)
+    tree._addDevice(vg)
+
+    pool = LVMThinPoolDevice("pool", parents=[vg], size=Size("2 GiB"),
+                             segType="thin-pool", exists=True)
+    tree._addDevice(pool)
+
+    for i in range(2):
+        thin = LVMThinLogicalVolumeDevice("thin%d" % i, parents=[pool],
+                                          size=Size("2 GiB"),
+                                          segType="thin", exists=True)
+        thin.format = getFormat("ext4", device=thin.path, exists=True,
+                                uuid=_uuid(thin.id),
+                                mountpoint="/srv/vg%d/thin%d" % (n, i))
+        tree._addDevice(thin)
+
+    lv = LVMLogicalVolumeDevice("lv", parents=[vg], size=Size("1 GiB"),
+                                exists=True)
+    lv.format = getFormat("ext4", device=lv.path, exists=True,
+                          uuid=_uuid(lv.id), mountpoint="/srv/vg%d/lv" % n)
+    tree._addDevice(lv)
+
+    for part in (first[1], second[1]):
+        part.format = getFormat("luks", device=part.path, exists=True,
+                                uuid=_uuid(part.id))
+        luks = LUKSDevice(part.format.mapName, parents=[part], exists=True)
+        luks.format = getFormat("ext4", device=luks.path, exists=True,
+                                uuid=_uuid(luks.id),
+                                mountpoint="/srv/%s" % part.name)
+        tree._addDevice(luks)
+
+    label = "data%d" % n
+    members = [first[2], second[2]]
+    vol_uuid = _uuid(members[0].id)
+    for part in members:
+        part.format = getFormat("btrfs", device=part.path, exists=True,
+                                label=label, volUUID=vol_uuid)
+
+    volume = BTRFSVolumeDevice(label, parents=members, uuid=vol_uuid,
+                               dataLevel="raid1", metaDataLevel="raid1",
+                               exists=True)
+    tree._addDevice(volume)
+
+    for (vol_id, name) in enumerate(("home", "snapshots"), start=256):
+        fmt = getFormat("btrfs", device=volume.path, exists=True,
+                        volUUID=volume.format.volUUID,
+                        mountopts="subvol=%s" % name,
+                        mountpoint="/srv/%s/%s" % (label, name))
+        subvol = BTRFSSubVolumeDevice("%s-%s" % (label, name), vol_id=vol_id,
+                                      fmt=fmt, parents=[volume], exists=True)
+        tree._addDevice(subvol)
+
+def synthetic_storage(count, prefix="topology"):
+    """ Return a Blivet instance holding count synthetic disks.
+
+        :param int count: the number of disks
+        :keyword str prefix: the start of the disks' names, which are also
+                             the names of their images in :data:`IMAGE_DIR`
+
+        Each disk is a sparse image with a gpt disklabel. The disks are
+        paired and each pair holds, besides free space for new partitions:
+
+        - lvm, with a thin pool and thin volumes, on md raid1
+        - a filesystem on luks on each disk
+        - a raid1 btrfs volume with subvolumes
+
+        Every filesystem has a mountpoint. :data:`~.flags.Flags.testing`
+        must be set. Remove the images with :func:`remove_images`.
+    """
+    _deactivate()
+    b = blivet.Blivet(ksdata=makeVersion())
+    tree = b.devicetree
+    disks = []
+    try:
+        for i in range(count):
+            disks.append(_add_disk(tree, "%s%d" % (prefix, i)))
+
+        for n in range(count // 2):
+            _add_stacks(tree, n, disks[2 * n], disks[2 * n + 1])
+    except Exception:
+        remove_images(b)
+        raise
+
+    return b
+
+def add_requests(storage):
+    """ Schedule creation of new lvm on the free space of each disk pair.
+
+        Each disk gets a new growable partition. Each pair of them holds a
+        new volume group with a growable thin pool holding a thin volume and
+        with a growable logical volume. None of it is allocated, that is for
+        :func:`~.partitioning.doPartitioning` and
+        :func:`~.partitioning.growLVM` to do.
+    """
+    disks = storage.disks
+    for n in range(len(disks) // 2):
+        pvs = []
+        for disk in disks[2 * n:2 * n + 2]:
+            part = storage.newPartition(fmt_type="lvmpv", size=Size("1 GiB"),
+                                        grow=True, parents=[disk])
+            storage.createDevice(part)
+            pvs.append(part)
+
+        vg = LVMVolumeGroupDevice("newvg%d" % n, parents=pvs)
+        storage.createDevice(vg)
+
+        pool = LVMThinPoolDevice("pool", parents=[vg], size=Size("1 GiB"),
+                                 grow=True)
+        storage.createDevice(pool)
+
+        thin = LVMThinLogicalVolumeDevice("thin", parents=[pool],
+                                          size=Size("1 GiB"),
+                                          fmt=getFormat("ext4"))
+        storage.createDevice(thin)
+
+        lv = LVMLogicalVolumeDevice("lv", parents=[vg], size=Size("1 GiB"),
+                                    grow=True, fmt=getFormat("ext4"))
+        storage.createDevice(lv)
+
+def reformat(storage):
+    """ Schedule creating a filesystem on each luks device, twice over.
+
+        The first of the two is obsoleted by the second, which gives
+        :meth:`~.devicetree.DeviceTree.pruneActions` something to prune.
+    """
+    for device in storage.devicetree.getDevicesByType("luks/dm-crypt"):
+        for fmt_type in ("ext4", "ext3"):
+            storage.formatDevice(device, getFormat(fmt_type))
+
+def remove_images(storage):
+    """ Remove the images of the disks of storage. """
+    for disk in storage.disks:
+        if isinstance(disk, ImageDiskDevice) and os.path.exists(disk.path):
+            os.unlink(disk.path)
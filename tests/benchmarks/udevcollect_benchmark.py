@@ -0,0 +1,131 @@
+#!/usr/bin/python
+#
+# udevcollect_benchmark.py
+# Measure how udev.udev_get_block_devices scales with its number of threads.
+#
+# Copyright (C) 2014  Red Hat, Inc.
+#
+# This copyrighted material is made available to anyone wishing to use,
+# modify, copy, or redistribute it subject to the terms and conditions of
+# the GNU General Public License v.2, or (at your option) any later version.
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY expressed or implied, including the implied warranties of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General
+# Public License for more details.  You should have received a copy of the
+# GNU General Public License along with this program; if not, write to the
+# Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA
+# 02110-1301, USA.  Any Red Hat trademarks that are incorporated in the
+# source code or documentation are not subject to the GNU General Public
+# License and may only be used or replicated with the express permission of
+# Red Hat, Inc.
+#
+# Usage: PYTHONPATH=.:tests/ python tests/benchmarks/udevcollect_benchmark.py
+#
+
+import os
+import shutil
+import tempfile
+import time
+
+from mock import patch
+
+from blivet import udev
+
+from benchmarks.common import best_time, get_parser, parse_args, print_table
+
+class FixtureDevice(dict):
+    pass
+
+class FixtureUdev(object):
+    """ A udev context reading device properties from a fixture directory.
+
+        Each lookup sleeps for latency seconds first, standing in for the
+        udev database and sysfs reads of a busy host.
+    """
+    def __init__(self, latency):
+        self.latency = latency
+
+    def create_device(self, syspath):
+        time.sleep(self.latency)
+        dev = FixtureDevice()
+        dev.sysname = os.path.basename(syspath)
+        dev["symlinks"] = []
+        with open(os.path.join(syspath, "udev_db")) as f:
+            for line in f:
+                (key, _eq, value) = line.strip().partition("=")
+                dev[key] = value
+
+        return dev
+
+    def unref(self):
+        pass
+
+def make_fixture(topdir, count):
+    """ Create a synthetic sysfs tree with count disks and md arrays.
+
+        :returns: the devices' sysfs paths, relative to /sys like the ones
+                  udev_enumerate_devices returns
+        :rtype: list of str
+    """
+    paths = []
+    for i in range(count):
+        if i % 10 == 9:
+            name = "md%d" % i
+            devdir = os.path.join(topdir, "devices/virtual/block", name)
+            os.makedirs(os.path.join(devdir, "md"))
+            with open(os.path.join(devdir, "md", "array_state"), "w") as f:
+                f.write("clean\n")
+        else:
+            name = "sd%d" % i
+            devdir = os.path.join(topdir, "devices/pci0000:00/block", name)
+            os.makedirs(devdir)
+
+        with open(os.path.join(devdir, "uevent"), "w") as f:
+            f.write("MAJOR=8\nMINOR=%d\nDEVNAME=%s\nDEVTYPE=disk\n" % (i, name))
+        with open(os.path.join(devdir, "udev_db"), "w") as f:
+            f.write("ID_FS_TYPE=swap\nID_FS_UUID=%032d\n" % i)
+
+        # /sys/.. is /, so udev's /sys prefix leads into the fixture
+        paths.append("/.." + devdir)
+
+    return paths
+
+def main():
+    parser = get_parser("Time udev.udev_get_block_devices against the number "
+                        "of threads collecting device information from a "
+                        "synthetic sysfs tree.",
+                        [500, 2000])
+    parser.add_argument("--jobs", default="1,2,4,8,16",
+                        help="comma-separated list of thread counts")
+    parser.add_argument("--latency", type=float, default=1.0,
+                        help="simulated udev lookup latency in milliseconds")
+    args = parse_args(parser)
+    jobs = [int(j) for j in args.jobs.split(",")]
+    fixture_udev = FixtureUdev(args.latency / 1000.0)
+
+    rows = []
+    for size in args.sizes:
+        topdir = tempfile.mkdtemp()
+        try:
+            paths = make_fixture(topdir, size)
+            with patch.object(udev, "udev_enumerate_devices", return_value=paths), \
+                 patch.object(udev, "udev_settle"), \
+                 patch.object(udev, "global_udev", fixture_udev), \
+                 patch.object(udev.pyudev, "Udev", return_value=fixture_udev):
+                serial = None
+                for count in jobs:
+                    elapsed = best_time(lambda: udev.udev_get_block_devices(jobs=count),
+                                        repeat=args.repeat)
+                    serial = serial or elapsed
+                    rows.append((size, count, "%.3f" % elapsed,
+                                 "%.1f" % (elapsed * 1e6 / size),
+                                 "%.1fx" % (serial / elapsed)))
+        finally:
+            shutil.rmtree(topdir)
+
+    print_table("udev.udev_get_block_devices",
+                ("devices", "jobs", "collect (s)", "usec/device", "speedup"),
+                rows)
+
+if __name__ == "__main__":
+    main()
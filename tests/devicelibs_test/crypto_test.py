@@ -1,8 +1,10 @@
 #!/usr/bin/python
 import unittest
 
+import json
 import tempfile
 import os
+import struct
 
 from blivet.devicelibs import crypto
 from blivet.errors import CryptoError
@@ -52,6 +54,12 @@ class CryptoTestCase(baseclass.DevicelibsTestCase):
         self.assertEqual(crypto.luks_format(_LOOP_DEV0, passphrase="secret", cipher="aes-cbc-essiv:sha256", key_size=256), None)
         self.assertEqual(crypto.is_luks(_LOOP_DEV0), 0)
 
+        header = crypto.luks_header(_LOOP_DEV0)
+        self.assertEqual(header.cipher, "aes-cbc-essiv:sha256")
+        self.assertEqual(header.key_size, 256)
+        self.assertEqual(header.key_slots, [0])
+        self.assertEqual(header.uuid, crypto.luks_uuid(_LOOP_DEV0))
+
         # make a key file
         handle, keyfile = tempfile.mkstemp(prefix="key", text=False)
         os.write(handle, "nobodyknows")
@@ -202,5 +210,60 @@ class CryptoTestCase2(baseclass.DevicelibsTestCase):
            crypto.luks_close,
            "encrypted")
 
+class LUKSHeaderTestCase(unittest.TestCase):
+    UUID = "0fe5d7c3-8e8a-4a5c-a4b2-62de4cd4a0c1"
+
+    def _image(self, *chunks):
+        (fd, path) = tempfile.mkstemp(prefix="luks-header-test-")
+        self.addCleanup(os.unlink, path)
+        with os.fdopen(fd, "wb") as f:
+            f.truncate(64 * 1024)
+            for (offset, data) in chunks:
+                f.seek(offset)
+                f.write(data)
+        return path
+
+    def testLUKS1(self):
+        hdr = bytearray(592)
+        struct.pack_into(">6sH32s32s32sII", hdr, 0, crypto.LUKS_MAGIC, 1,
+                         b"aes", b"xts-plain64", b"sha256", 4096, 64)
+        struct.pack_into(">40s", hdr, 168, self.UUID.encode())
+        for slot in (0, 3):
+            struct.pack_into(">I", hdr, 208 + slot * 48, 0x00AC71F3)
+        for slot in (1, 2, 4, 5, 6, 7):
+            struct.pack_into(">I", hdr, 208 + slot * 48, 0x0000DEAD)
+
+        path = self._image((0, bytes(hdr)))
+        header = crypto.luks_header(path)
+        self.assertEqual(header, (1, self.UUID, "aes-xts-plain64", 512, [0, 3],
+                                  2 * 1024 * 1024))
+        self.assertEqual(crypto.is_luks(path), 0)
+        self.assertEqual(crypto.luks_uuid(path), self.UUID)
+
+    def testLUKS2(self):
+        metadata = {"keyslots": {"1": {"type": "luks2", "key_size": 64}},
+                    "segments": {"0": {"type": "crypt", "offset": "16777216",
+                                       "size": "dynamic",
+                                       "encryption": "aes-xts-plain64"}}}
+        hdr = bytearray(4096)
+        struct.pack_into(">6sHQ", hdr, 0, crypto.LUKS_MAGIC, 2, 16384)
+        struct.pack_into(">40s", hdr, 168, self.UUID.encode())
+
+        path = self._image((0, bytes(hdr)), (4096, json.dumps(metadata).encode()))
+        header = crypto.luks_header(path)
+        self.assertEqual(header, (2, self.UUID, "aes-xts-plain64", 512, [1],
+                                  16 * 1024 * 1024))
+
+        # unparsable metadata
+        path = self._image((0, bytes(hdr)), (4096, b"{"))
+        self.assertIsNone(crypto.luks_header(path))
+
+    def testNotLUKS(self):
+        path = self._image()
+        self.assertIsNone(crypto.luks_header(path))
+        self.assertEqual(crypto.is_luks(path), -22)
+        self.assertIsNone(crypto.luks_uuid(path))
+        self.assertRaises(IOError, crypto.luks_header, "/not/existing/device")
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,16 @@
 #!/usr/bin/python
 import os
+import shutil
+import sys
+import tempfile
 import unittest
 
 import blivet.devicelibs.lvm as lvm
+from blivet import backend
+from blivet.instrumentation import recorder
+from blivet.flags import flags
 from blivet.size import Size
-from blivet.errors import LVMError
+from blivet.errors import LVMError, LVMShellError
 
 from tests.devicelibs_test import baseclass
 
@@ -24,6 +30,158 @@ class LVMTestCase(unittest.TestCase):
  True),
                          Size("12 MiB"))
 
+    def testLVMReport(self):
+        def lv(vg_name, lv_name, attr, origin="", pool=""):
+            return {"LVM2_VG_NAME": vg_name, "LVM2_LV_NAME": lv_name,
+                    "LVM2_LV_ATTR": attr, "LVM2_ORIGIN": origin,
+                    "LVM2_POOL_LV": pool}
+
+        pv_info = {"/dev/sda1": {"LVM2_PV_NAME": "/dev/sda1",
+                                 "LVM2_VG_NAME": "vg0",
+                                 "LVM2_VG_UUID": "abc",
+                                 "LVM2_VG_SIZE": "20480.00",
+                                 "LVM2_VG_FREE": "4096.00",
+                                 "LVM2_VG_EXTENT_SIZE": "4096.00",
+                                 "LVM2_VG_EXTENT_COUNT": "5",
+                                 "LVM2_VG_FREE_COUNT": "1",
+                                 "LVM2_PV_COUNT": "1"},
+                   "/dev/sdb": {"LVM2_PV_NAME": "/dev/sdb",
+                                "LVM2_VG_NAME": ""}}
+        lv_info = {"vg0-root": lv("vg0", "root", "-wi-a-----"),
+                   "vg0-snap": lv("vg0", "snap", "swi-a-s---", origin="root"),
+                   "vg0-thin": lv("vg0", "thin", "Vwi-a-tz--", pool="pool"),
+                   "vg1-home": lv("vg1", "home", "-wi-a-----")}
+        report = lvm.LVMReport(pv_info, lv_info)
+
+        self.assertEqual(sorted(report.vgLVs("vg0").keys()),
+                         ["vg0-root", "vg0-snap", "vg0-thin"])
+        self.assertEqual(report.vgLVs("vg1").keys(), ["vg1-home"])
+        self.assertEqual(report.vgLVs("vg2"), {})
+
+        self.assertEqual(report.lvorigin("vg0", "snap"), "root")
+        self.assertEqual(report.lvorigin("vg0", "root"), "")
+        self.assertEqual(report.thinlvpoolname("vg0", "thin"), "pool")
+        self.assertEqual(report.thinlvpoolname("vg0", "missing"), "")
+
+# a stand-in for lvm: run with arguments it prints them, and without any it
+# acts as a shell that reports "fail" commands as failed and exits on "exit"
+FAKE_LVM = """#!%s
+import os
+import sys
+
+if len(sys.argv) > 1:
+    print("direct " + " ".join(sys.argv[1:]))
+    sys.exit(0)
+
+report = os.fdopen(int(os.environ["LVM_REPORT_FD"]), "w")
+while True:
+    sys.stdout.write("lvm> ")
+    sys.stdout.flush()
+    line = sys.stdin.readline()
+    if not line or line.startswith("exit"):
+        break
+
+    sys.stdout.write("shell " + line)
+    sys.stdout.flush()
+    report.write("  RetCode\\n  %%d\\n" %% (5 if line.startswith("fail") else 1))
+    report.flush()
+""" % sys.executable
+
+class LVMShellTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        path = os.path.join(self.tmpdir, "lvm")
+        with open(path, "w") as f:
+            f.write(FAKE_LVM)
+        os.chmod(path, 0755)
+
+        self._path = os.environ["PATH"]
+        os.environ["PATH"] = "%s:%s" % (self.tmpdir, self._path)
+        self._flag = flags.lvm_shell
+
+    def tearDown(self):
+        lvm.stop_shell()
+        flags.lvm_shell = self._flag
+        os.environ["PATH"] = self._path
+        shutil.rmtree(self.tmpdir)
+
+    def testRun(self):
+        shell = lvm.LVMShell()
+        shell.start()
+        self.assertTrue(shell.running)
+
+        (rc, out) = shell.run(["lvs", "--config", "devices { a=\"b c\" }", "vg"])
+        self.assertEqual(rc, 0)
+        self.assertTrue(out.startswith("shell lvs --config 'devices { a=\"b c\" }"))
+        self.assertIn("report_command_log=1", out)
+        self.assertTrue(out.endswith(" vg\n"))
+
+        self.assertEqual(shell.run(["fail"])[0], 5)
+
+        shell.stop()
+        self.assertFalse(shell.running)
+        self.assertRaises(LVMShellError, shell.run, ["lvs"])
+
+    def testInheritedFDs(self):
+        # only the report pipe is passed on to the shell
+        leaked = open(os.path.join(self.tmpdir, "leaked"), "w")
+        try:
+            shell = lvm.LVMShell()
+            shell.start()
+            fd_dir = "/proc/%d/fd" % shell._proc.pid
+            targets = [os.readlink(os.path.join(fd_dir, fd))
+                       for fd in os.listdir(fd_dir)]
+            shell.stop()
+        finally:
+            leaked.close()
+
+        self.assertNotIn(leaked.name, targets)
+
+    def testBackend(self):
+        flags.lvm_shell = True
+        recording = backend.RecordingBackend()
+        previous = backend.set_backend(recording)
+        try:
+            recorder.reset()
+            (rc, out) = lvm._run(["lvs"])
+            self.assertEqual(rc, 0)
+            self.assertTrue(out.startswith("shell lvs"))
+            self.assertEqual(recorder.toDict()["commands"]["lvm"]["count"], 1)
+
+            # commands run in the shell are recorded like other programs
+            records = recording.records["run"]["lvm lvs"]
+            self.assertEqual(records, [{"result": (rc, out)}])
+
+            # and replayed without running lvm at all
+            lvm.stop_shell()
+            os.environ["PATH"] = self._path
+            backend.set_backend(backend.ReplayBackend(recording.records))
+            self.assertEqual(lvm._run(["lvs"]), (rc, out))
+        finally:
+            backend.set_backend(previous)
+
+    def testQuote(self):
+        self.assertEqual(lvm.LVMShell._quote("vg/lv"), "vg/lv")
+        self.assertEqual(lvm.LVMShell._quote(""), "''")
+        self.assertEqual(lvm.LVMShell._quote('a "b"'), "'a \"b\"'")
+        self.assertEqual(lvm.LVMShell._quote("it's"), '"it\'s"')
+        self.assertRaises(LVMShellError, lvm.LVMShell._quote, "'\"")
+
+    def testFallback(self):
+        flags.lvm_shell = False
+        self.assertEqual(lvm._run(["lvs"]), (0, "direct lvs\n"))
+
+        flags.lvm_shell = True
+        self.assertTrue(lvm._run(["lvs"])[1].startswith("shell lvs"))
+
+        # commands the shell cannot take run lvm directly
+        self.assertEqual(lvm._run(["lvs", "'\""]), (0, "direct lvs '\"\n"))
+
+        # a command that takes the shell down is not run again, but the ones
+        # after it run lvm directly
+        self.assertRaises(LVMError, lvm._run, ["exit"])
+        self.assertEqual(lvm._run(["lvs"]), (0, "direct lvs\n"))
+
 # FIXME: Some of these tests expect behavior that is not entirely correct.
 #
 # The following is a list of the known incorrect behaviors:
@@ -3,6 +3,8 @@ import os
 import unittest
 import time
 
+from mock import patch
+
 import blivet.devicelibs.mdraid as mdraid
 from blivet.errors import MDRaidError
 from blivet.size import Size
@@ -48,6 +50,41 @@ class MDRaidTestCase(unittest.TestCase):
                                                          version="version"),
                          mdraid.MD_SUPERBLOCK_SIZE)
 
+    def testMDExamineDevices(self):
+        out = ("ARRAY /dev/md/home  level=raid1 metadata=1.2 num-devices=2 "
+               "UUID=4d2e9a2f:b4dc2e8a:6a1d1e33:9c4b0b6e name=host:home\n"
+               "   devices=/dev/sda1,/dev/sdb1\n"
+               "ARRAY /dev/md0 level=raid5 num-devices=3 "
+               "UUID=0a1b2c3d:4e5f6a7b:8c9d0e1f:2a3b4c5d\n"
+               "   spares=1   devices=/dev/sdc,/dev/sdd,/dev/sde,/dev/sdf\n"
+               "ARRAY metadata=imsm UUID=11111111:22222222:33333333:44444444\n"
+               "   devices=/dev/sdg,/dev/sdh\n"
+               "ARRAY /dev/md/Volume0 container=11111111:22222222:33333333:44444444 "
+               "member=0 UUID=55555555:66666666:77777777:88888888\n")
+        devices = ["/dev/sda1", "/dev/sdb1", "/dev/sdc", "/dev/sdd",
+                   "/dev/sde", "/dev/sdf", "/dev/sdg", "/dev/sdh", "/dev/sdi"]
+        with patch.object(mdraid.util, "capture_output",
+                          return_value=out) as capture_output:
+            info = mdraid.mdexamine_devices(devices)
+
+        # all of the devices are examined at once
+        self.assertEqual(capture_output.call_count, 1)
+        self.assertEqual(capture_output.call_args[0][0][-len(devices):],
+                         devices)
+
+        self.assertEqual(sorted(info.keys()), devices[:6])
+        self.assertEqual(info["/dev/sdb1"],
+                         {"DEVICE": "/dev/md/home",
+                          "MD_LEVEL": "raid1",
+                          "MD_METADATA": "1.2",
+                          "MD_DEVICES": "2",
+                          "MD_UUID": "4d2e9a2f:b4dc2e8a:6a1d1e33:9c4b0b6e",
+                          "MD_NAME": "host:home"})
+        self.assertEqual(info["/dev/sdf"]["DEVICE"], "/dev/md0")
+        self.assertFalse("MD_METADATA" in info["/dev/sdf"])
+
+        self.assertEqual(mdraid.mdexamine_devices([]), {})
+
 
 class MDRaidAsRootTestCase(baseclass.DevicelibsTestCase):
 
@@ -0,0 +1,186 @@
+#!/usr/bin/python
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import uuid
+
+from blivet.devicelibs import superblock
+from blivet import util
+
+UUID = "0fe5d7c3-8e8a-4a5c-a4b2-62de4cd4a0c1"
+
+class SuperblockTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="superblock-test-")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _image(self, size, *chunks):
+        """ Return the path of a new image file of size bytes.
+
+            chunks are (offset, data) pairs to write to the image.
+        """
+        path = os.path.join(self.tmpdir, "image%d" % len(os.listdir(self.tmpdir)))
+        with open(path, "wb") as f:
+            f.truncate(size)
+            for (offset, data) in chunks:
+                f.seek(offset)
+                f.write(data)
+        return path
+
+    def testExt2(self):
+        sb = bytearray(1024)
+        struct.pack_into("<6I", sb, 0x4, 0x1000, 0, 0x800, 0, 0, 2)
+        struct.pack_into("<HH", sb, 0x38, 0xEF53, 3)
+        struct.pack_into("<I", sb, 0x60, 0x80)
+        struct.pack_into("<3I", sb, 0x150, 1, 0, 1)
+        sb[0x68:0x78] = uuid.UUID(UUID).bytes
+        sb[0x78:0x7d] = b"root\0"
+        path = self._image(8192, (1024, bytes(sb)))
+
+        info = superblock.read_superblock(path, "ext2")
+        self.assertEqual(info.block_size, 4096)
+        self.assertEqual(info.block_count, (1 << 32) + 0x1000)
+        self.assertEqual(info.free_blocks, (1 << 32) + 0x800)
+        self.assertEqual(info.uuid, UUID)
+        self.assertEqual(info.label, "root")
+        self.assertFalse(info.dirty)
+        self.assertTrue(info.errors)
+
+        # not an ext2 filesystem
+        self.assertIsNone(superblock.read_superblock(self._image(8192), "ext2"))
+
+    @unittest.skipUnless(util.find_program_in_path("mke2fs") and
+                         util.find_program_in_path("dumpe2fs"),
+                         "requires e2fsprogs")
+    def testExt4Tools(self):
+        path = self._image(64 * 1024 * 1024)
+        util.run_program(["mke2fs", "-q", "-F", "-t", "ext4", "-L", "data",
+                          "-U", UUID, path])
+        fields = dict(line.split(":", 1) for line in
+                      util.capture_output(["dumpe2fs", "-h", path]).splitlines()
+                      if ":" in line)
+
+        info = superblock.read_superblock(path, "ext2")
+        self.assertEqual(info.block_size, int(fields["Block size"]))
+        self.assertEqual(info.block_count, int(fields["Block count"]))
+        self.assertEqual(info.free_blocks, int(fields["Free blocks"]))
+        self.assertEqual(info.uuid, UUID)
+        self.assertEqual(info.label, "data")
+        self.assertFalse(info.dirty)
+
+    def testXFS(self):
+        sb = bytearray(512)
+        sb[0:4] = b"XFSB"
+        struct.pack_into(">IQ", sb, 4, 4096, 25600)
+        sb[32:48] = uuid.UUID(UUID).bytes
+        sb[108:120] = b"xfslabel1234"
+        struct.pack_into(">Q", sb, 144, 24000)
+        path = self._image(8192, (0, bytes(sb)))
+
+        info = superblock.read_superblock(path, "xfs")
+        self.assertEqual((info.block_size, info.block_count, info.free_blocks),
+                         (4096, 25600, 24000))
+        self.assertEqual(info.uuid, UUID)
+        self.assertEqual(info.label, "xfslabel1234")
+
+    def testBTRFS(self):
+        sb = bytearray(4096)
+        sb[0x20:0x30] = uuid.UUID(UUID).bytes
+        sb[0x40:0x48] = b"_BHRfS_M"
+        struct.pack_into("<4QI", sb, 0x70, 256 << 20, 1 << 20, 6, 1, 4096)
+        sb[0x12b:0x130] = b"pool\0"
+        path = self._image(0x20000, (0x10000, bytes(sb)))
+
+        info = superblock.read_superblock(path, "btrfs")
+        self.assertEqual((info.block_size, info.block_count, info.free_blocks),
+                         (4096, 65536, 65280))
+        self.assertEqual(info.uuid, UUID)
+        self.assertEqual(info.label, "pool")
+
+        # members of multi-device volumes have no size of their own
+        struct.pack_into("<Q", sb, 0x88, 2)
+        path = self._image(0x20000, (0x10000, bytes(sb)))
+        info = superblock.read_superblock(path, "btrfs")
+        self.assertIsNone(info.block_count)
+        self.assertEqual(info.label, "pool")
+
+    def testVFAT(self):
+        # FAT16, with no label in the root directory
+        bs = bytearray(512)
+        struct.pack_into("<HBHBHH", bs, 11, 512, 4, 1, 2, 512, 20480)
+        struct.pack_into("<H", bs, 22, 20)
+        struct.pack_into("<I", bs, 39, 0x1234abcd)
+        bs[43:54] = b"BOOT       "
+        bs[510:512] = b"\x55\xaa"
+        path = self._image(20480 * 512, (0, bytes(bs)))
+
+        info = superblock.read_superblock(path, "vfat")
+        self.assertEqual((info.block_size, info.block_count, info.free_blocks),
+                         (512, 20480, None))
+        self.assertEqual(info.uuid, "1234-ABCD")
+        self.assertEqual(info.label, "BOOT")
+
+        # the label in the root directory, which follows the FATs, wins over
+        # the stale one in the boot sector; long names and deleted entries
+        # are skipped
+        root = bytearray(4 * 32)
+        root[0:11] = b"A          "
+        root[11] = 0x0F
+        root[32:43] = b"\xe5OLD       "
+        root[43] = 0x08
+        root[64:75] = b"DATA       "
+        root[75] = 0x08
+        path = self._image(20480 * 512, (0, bytes(bs)),
+                           ((1 + 2 * 20) * 512, bytes(root)))
+        self.assertEqual(superblock.read_superblock(path, "vfat").label, "DATA")
+
+        # FAT32, with the free cluster count in the FSInfo sector and no
+        # label at all
+        bs = bytearray(512)
+        struct.pack_into("<HBHBHH", bs, 11, 512, 8, 32, 2, 0, 0)
+        struct.pack_into("<I", bs, 32, 1048576)
+        struct.pack_into("<IHHI", bs, 36, 1, 0, 0, 2)
+        struct.pack_into("<H", bs, 48, 1)
+        struct.pack_into("<I", bs, 67, 0xdeadbeef)
+        bs[71:82] = b"NO NAME    "
+        bs[510:512] = b"\x55\xaa"
+        fsinfo = bytearray(512)
+        fsinfo[0:4] = b"RRaA"
+        struct.pack_into("<I", fsinfo, 488, 1000)
+        path = self._image(8192, (0, bytes(bs)), (512, bytes(fsinfo)))
+
+        info = superblock.read_superblock(path, "vfat")
+        self.assertEqual((info.block_size, info.block_count, info.free_blocks),
+                         (512, 1048576, 8000))
+        self.assertEqual(info.uuid, "DEAD-BEEF")
+        self.assertEqual(info.label, "")
+
+        # the FAT32 root directory is a chain of clusters, here 2 and 3, and
+        # the label is in the second one
+        fat = bytearray(16)
+        struct.pack_into("<IIII", fat, 0, 0x0FFFFFF8, 0x0FFFFFFF, 3, 0x0FFFFFFF)
+        files = bytearray(b"FILE    TXT\x20" + b"\0" * 20) * (4096 // 32)
+        label = bytearray(32)
+        label[0:11] = b"ESP        "
+        label[11] = 0x08
+        data = (32 + 2) * 512
+        path = self._image(data + 2 * 4096, (0, bytes(bs)), (512, bytes(fsinfo)),
+                           (32 * 512, bytes(fat)), (data, bytes(files)),
+                           (data + 4096, bytes(label)))
+        self.assertEqual(superblock.read_superblock(path, "vfat").label, "ESP")
+
+    def testFailures(self):
+        path = self._image(512)
+        for fstype in ("ext2", "xfs", "btrfs", "vfat"):
+            self.assertIsNone(superblock.read_superblock(path, fstype))
+
+        self.assertIsNone(superblock.read_superblock(path, "jfs"))
+        self.assertIsNone(superblock.read_superblock("/not/existing/device",
+                                                     "ext2"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,12 +7,14 @@ from mock import Mock
 import blivet
 
 from blivet.errors import DeviceError
+from blivet.errors import DiskLabelCommitError
 from blivet.errors import MDRaidError
 
 from blivet.devices import BTRFSSubVolumeDevice
 from blivet.devices import BTRFSVolumeDevice
 from blivet.devices import MDRaidArrayDevice
 from blivet.devices import OpticalDevice
+from blivet.devices import PartitionDevice
 from blivet.devices import StorageDevice
 from blivet.devices import ParentList
 from blivet.devicelibs import btrfs
@@ -502,6 +504,77 @@ class BTRFSDeviceTestCase(DeviceStateTestCase):
            "cannot directly set size of btrfs volume"):
             self.dev1.size = 32
 
+class PartitionBatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.disk = Mock()
+        self.partitions = [Mock(disk=self.disk, partedPartition=Mock())
+                           for _i in range(3)]
+
+    def testCreateMany(self):
+        PartitionDevice.createMany(self.partitions)
+        self.assertEqual(self.disk.format.addPartition.call_count, 3)
+        self.assertEqual(self.disk.format.commit.call_count, 1)
+        for partition in self.partitions:
+            self.assertTrue(partition._wipe.called)
+            self.assertTrue(partition._postCreate.called)
+
+        # after a failed commit the partitions are removed from the disklabel
+        # again, last first
+        self.disk.format.commit.side_effect = DiskLabelCommitError()
+        removed = []
+        for (i, partition) in enumerate(self.partitions):
+            partition.reset_mock()
+            partition._removeNewPartition.side_effect = lambda i=i: removed.append(i)
+
+        with self.assertRaises(DiskLabelCommitError):
+            PartitionDevice.createMany(self.partitions)
+
+        self.assertEqual(removed, [2, 1, 0])
+        for partition in self.partitions:
+            self.assertFalse(partition._postCreate.called)
+
+    def testDestroyMany(self):
+        self.partitions[0]._hasCurrentCopy = True
+        PartitionDevice.destroyMany(self.partitions)
+        self.assertEqual(self.disk.originalFormat.removePartition.call_count, 3)
+        self.assertEqual(self.disk.originalFormat.commit.call_count, 1)
+        self.assertEqual(self.disk.format.removePartition.call_count, 3)
+        self.assertEqual(self.disk.format.commit.call_count, 1)
+        for partition in self.partitions:
+            self.assertTrue(partition._postDestroy.called)
+
+        # after a failed commit the partitions are added back
+        self.disk.originalFormat.commit.side_effect = DiskLabelCommitError()
+        for partition in self.partitions:
+            partition.reset_mock()
+
+        with self.assertRaises(DiskLabelCommitError):
+            PartitionDevice.destroyMany(self.partitions)
+
+        self.assertEqual(self.disk.originalFormat.addPartition.call_count, 3)
+        for partition in self.partitions:
+            self.assertFalse(partition._postDestroy.called)
+
+        # a partition that fails to be removed leaves the disklabel as it was
+        self.disk.originalFormat.reset_mock()
+        self.disk.originalFormat.commit.side_effect = None
+        self.disk.originalFormat.removePartition.side_effect = [None, RuntimeError("gone")]
+        with self.assertRaises(RuntimeError):
+            PartitionDevice.destroyMany(self.partitions)
+
+        self.disk.originalFormat.addPartition.assert_called_once_with(
+            self.partitions[0].partedPartition)
+        self.assertFalse(self.disk.originalFormat.commit.called)
+
+        # all of the partitions are prepared before any is removed
+        self.disk.originalFormat.reset_mock()
+        self.disk.originalFormat.removePartition.side_effect = None
+        self.partitions[1]._preDestroy.side_effect = DeviceError("busy")
+        with self.assertRaises(DeviceError):
+            PartitionDevice.destroyMany(self.partitions)
+
+        self.assertFalse(self.disk.originalFormat.removePartition.called)
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,543 @@
+#!/usr/bin/python
+
+import copy
+import unittest
+
+from mock import Mock, patch
+
+from blivet.deviceaction import ACTION_TYPE_CREATE, ACTION_TYPE_DESTROY
+from blivet.deviceaction import ActionCreateDevice
+from blivet.deviceaction import ActionCreateFormat
+from blivet.devicetree import DeviceTree
+from blivet.devicelibs import lvm
+from blivet.devicelibs import mdraid
+from blivet.devicelibs import mpath
+from blivet.errors import DeviceTreeError, DiskLabelCommitError
+from blivet.devices import DiskDevice
+from blivet.devices import LVMLogicalVolumeDevice
+from blivet.devices import LVMVolumeGroupDevice
+from blivet.devices import PartitionDevice
+from blivet.devices import StorageDevice
+from blivet.formats import getFormat
+from blivet.size import Size
+from blivet import udev
+from blivet import util
+
+class DeviceTreeLookupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tree = DeviceTree()
+        self.disk = DiskDevice("sda", size=Size("10 GiB"),
+                               sysfsPath="/devices/virtual/block/sda")
+        self.tree._addDevice(self.disk)
+
+    def testLookups(self):
+        tree = self.tree
+        disk = self.disk
+        self.assertEqual(tree.getDeviceByName("sda"), disk)
+        self.assertEqual(tree.getDeviceByPath("/dev/sda"), disk)
+        self.assertEqual(tree.getDeviceBySysfsPath("/devices/virtual/block/sda"), disk)
+        self.assertEqual(tree.getDeviceByID(disk.id), disk)
+        self.assertEqual(tree.getDeviceByName("sdb"), None)
+
+    def testFormatKeys(self):
+        tree = self.tree
+        disk = self.disk
+        disk.format = getFormat("ext4", uuid="1234-abcd", label="root")
+        self.assertEqual(tree.getDeviceByUuid("1234-abcd"), disk)
+        self.assertEqual(tree.getDeviceByLabel("root"), disk)
+
+        # changes made directly to the format are picked up, too
+        disk.format.uuid = "5678-ef01"
+        disk.format.label = "data"
+        self.assertEqual(tree.getDeviceByUuid("1234-abcd"), None)
+        self.assertEqual(tree.getDeviceByUuid("5678-ef01"), disk)
+        self.assertEqual(tree.getDeviceByLabel("root"), None)
+        self.assertEqual(tree.getDeviceByLabel("data"), disk)
+
+        disk.format = getFormat(None)
+        self.assertEqual(tree.getDeviceByUuid("5678-ef01"), None)
+
+    def testRename(self):
+        tree = self.tree
+        disk = self.disk
+        disk.format = getFormat("lvmpv", device=disk.path, exists=True)
+        vg = LVMVolumeGroupDevice("vg0", parents=[disk], exists=True)
+        tree._addDevice(vg)
+        lv = LVMLogicalVolumeDevice("root", parents=[vg], size=Size("1 GiB"),
+                                    exists=True)
+        tree._addDevice(lv)
+        self.assertEqual(tree.getDeviceByName("vg0-root"), lv)
+        self.assertEqual(tree.getDeviceByPath("/dev/mapper/vg0-root"), lv)
+
+        # renaming the vg changes the lv's name and path
+        vg._name = "my-vg"
+        self.assertEqual(tree.getDeviceByName("vg0-root"), None)
+        self.assertEqual(tree.getDeviceByName("my-vg-root"), lv)
+        self.assertEqual(tree.getDeviceByName("my--vg-root"), lv)
+        self.assertEqual(tree.getDeviceByPath("/dev/mapper/my--vg-root"), lv)
+
+        disk.sysfsPath = "/devices/virtual/block/sdz"
+        self.assertEqual(tree.getDeviceBySysfsPath("/devices/virtual/block/sda"), None)
+        self.assertEqual(tree.getDeviceBySysfsPath("/devices/virtual/block/sdz"), disk)
+
+    def testOrder(self):
+        tree = self.tree
+        # when several devices match, the first one added wins
+        dup = StorageDevice("sda", exists=True)
+        tree._devices = tree._devices[:] + [dup]
+        self.assertEqual(tree.getDeviceByName("sda"), self.disk)
+        tree._removeDevice(self.disk)
+        self.assertEqual(tree.getDeviceByName("sda"), dup)
+
+    def testHidden(self):
+        tree = self.tree
+        disk = self.disk
+        tree.hide(disk)
+        self.assertEqual(tree.getDeviceByName("sda"), None)
+        self.assertEqual(tree.getDeviceByName("sda", hidden=True), disk)
+        self.assertEqual(tree.getDeviceByID(disk.id), None)
+        self.assertEqual(tree.getDeviceByID(disk.id, hidden=True), disk)
+
+        tree.unhide(disk)
+        self.assertEqual(tree.getDeviceByName("sda"), disk)
+        self.assertEqual(tree._hidden, [])
+
+    def testCopy(self):
+        new = copy.deepcopy(self.tree)
+        new_disk = new.getDeviceByID(self.disk.id)
+        self.assertNotEqual(new_disk, None)
+        self.assertFalse(new_disk is self.disk)
+        self.assertEqual(new.getDeviceByName("sda"), new_disk)
+
+        # renaming a device in the copy does not affect the original
+        new_disk._name = "sdb"
+        self.assertEqual(new.getDeviceByName("sdb"), new_disk)
+        self.assertEqual(self.tree.getDeviceByName("sdb"), None)
+        self.assertEqual(self.tree.getDeviceByName("sda"), self.disk)
+
+class DeviceTreeDevicesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tree = DeviceTree()
+        self.disk = DiskDevice("sda", size=Size("10 GiB"))
+        self.tree._addDevice(self.disk)
+
+    def testCaching(self):
+        tree = self.tree
+        devices = tree._completeDevices
+        self.assertEqual(devices, (self.disk,))
+        self.assertTrue(tree._completeDevices is devices)
+
+        # callers get a list of their own
+        self.assertEqual(tree.devices, [self.disk])
+        tree.devices.append(DiskDevice("sdc", size=Size("10 GiB")))
+        self.assertEqual(tree.devices, [self.disk])
+
+        disk2 = DiskDevice("sdb", size=Size("10 GiB"))
+        tree._addDevice(disk2)
+        self.assertEqual(tree.devices, [self.disk, disk2])
+        self.assertTrue(tree._completeDevices is tree._completeDevices)
+
+        tree._removeDevice(self.disk)
+        self.assertEqual(tree.devices, [disk2])
+
+    def testComplete(self):
+        tree = self.tree
+        disk = self.disk
+        disk.format = getFormat("lvmpv", device=disk.path, exists=True)
+        vg = LVMVolumeGroupDevice("vg0", parents=[disk], exists=True, pvCount=2)
+        tree._addDevice(vg)
+        self.assertEqual(tree.devices, [disk])
+
+        # the view reflects changes in completeness
+        vg._complete = True
+        self.assertEqual(tree.devices, [disk, vg])
+
+    def testDuplicateUUIDs(self):
+        tree = self.tree
+        self.assertEqual(tree.devices, [self.disk])
+        tree._addDevice(StorageDevice("a", uuid="1234", exists=True))
+        dup = StorageDevice("b", uuid="1234", exists=True)
+        tree._devices = tree._devices[:] + [dup]
+        with self.assertRaises(DeviceTreeError):
+            _devices = tree.devices
+
+        tree._removeDevice(dup)
+        self.assertEqual(len(tree.devices), 2)
+
+class DeviceTreeDependencyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tree = DeviceTree()
+        self.disk1 = DiskDevice("sda", size=Size("10 GiB"))
+        self.disk2 = DiskDevice("sdb", size=Size("10 GiB"))
+        self.tree._addDevice(self.disk1)
+        self.tree._addDevice(self.disk2)
+        for disk in (self.disk1, self.disk2):
+            disk.format = getFormat("lvmpv", device=disk.path, exists=True)
+
+        self.vg = LVMVolumeGroupDevice("vg0", parents=[self.disk1], exists=True)
+        self.tree._addDevice(self.vg)
+        self.lv = LVMLogicalVolumeDevice("root", parents=[self.vg],
+                                         size=Size("1 GiB"), exists=True)
+        self.tree._addDevice(self.lv)
+
+    def testChildren(self):
+        tree = self.tree
+        self.assertEqual(tree.getChildren(self.disk1), [self.vg])
+        self.assertEqual(tree.getChildren(self.disk2), [])
+        self.assertEqual(tree.getChildren(self.vg), [self.lv])
+        self.assertEqual(tree.getChildren(self.lv), [])
+
+    def testDependentDevices(self):
+        tree = self.tree
+        self.assertEqual(tree.getDependentDevices(self.disk1), [self.vg, self.lv])
+        self.assertEqual(tree.getDependentDevices(self.vg), [self.lv])
+        self.assertEqual(tree.getDependentDevices(self.lv), [])
+        self.assertEqual(tree.getDependentDevices(self.disk2), [])
+
+    def testReparent(self):
+        tree = self.tree
+        vg = self.vg
+        self.assertTrue(self.lv.dependsOn(self.disk1))
+        self.assertFalse(self.lv.dependsOn(self.disk2))
+
+        # changes to the parent lists are reflected in the results
+        vg.parents.append(self.disk2)
+        vg.parents.remove(self.disk1)
+        self.assertEqual(tree.getChildren(self.disk1), [])
+        self.assertEqual(tree.getChildren(self.disk2), [vg])
+        self.assertEqual(tree.getDependentDevices(self.disk2), [vg, self.lv])
+        self.assertFalse(self.lv.dependsOn(self.disk1))
+        self.assertTrue(self.lv.dependsOn(self.disk2))
+        self.assertEqual(set(self.lv.ancestors),
+                         set([self.lv, vg, self.disk2]))
+
+    def testReparentDuringWalk(self):
+        vg = self.vg
+        ancestors = vg._getAncestorSet()
+
+        def walk():
+            # another thread changes a parent list while lv's are collected
+            vg.parents.append(self.disk2)
+            return ancestors
+
+        with patch.object(vg, "_getAncestorSet", side_effect=walk):
+            self.assertFalse(self.lv.dependsOn(self.disk2))
+
+        # the result collected before the change is not kept as current
+        self.assertTrue(self.lv.dependsOn(self.disk2))
+
+    def testRemove(self):
+        tree = self.tree
+        tree._removeDevice(self.lv)
+        self.assertEqual(tree.getChildren(self.vg), [])
+        self.assertEqual(tree.getDependentDevices(self.disk1), [self.vg])
+
+    def testStaleDevices(self):
+        tree = self.tree
+        # the members of a volume group are rescanned with it
+        self.assertEqual(tree._getStaleDevices([self.lv]),
+                         set([self.lv, self.vg, self.disk1]))
+        self.assertEqual(tree._getStaleDevices([self.disk2]), set([self.disk2]))
+
+def udev_disk(index, fstype="swap"):
+    name = "sd%d" % index
+    return {"name": name,
+            "sysfs_path": "/devices/virtual/block/%s" % name,
+            "DEVTYPE": "disk",
+            "MAJOR": "8",
+            "MINOR": str(index),
+            "ID_FS_TYPE": fstype,
+            "ID_FS_UUID": "00000000-0000-0000-0000-%012d" % index,
+            "symlinks": []}
+
+class DeviceTreeUpdateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.udev = dict((d["sysfs_path"], d) for d in
+                         (udev_disk(i) for i in range(3)))
+
+        def get_block_devices(cache=None):
+            return [dict(self.udev[p]) for p in sorted(self.udev)]
+
+        def get_block_device(path):
+            return dict(self.udev[path]) if path in self.udev else None
+
+        patches = [patch.object(udev, "udev_get_block_devices",
+                                side_effect=get_block_devices),
+                   patch.object(udev, "udev_get_block_device",
+                                side_effect=get_block_device),
+                   patch.object(udev, "udev_get_dependent_paths", return_value=[]),
+                   patch.object(udev, "udev_settle"),
+                   patch.object(util, "get_sysfs_attr", return_value="0"),
+                   patch.object(mpath, "is_multipath_member", return_value=False)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+        self.tree = DeviceTree()
+        self.tree.populate()
+
+    def testAdd(self):
+        tree = self.tree
+        disks = list(tree.devices)
+        self.udev["/devices/virtual/block/sd3"] = udev_disk(3)
+        with patch.object(tree, "addUdevDevice", wraps=tree.addUdevDevice) as add:
+            tree.updateDevices(added=["/devices/virtual/block/sd3"])
+            self.assertEqual(add.call_count, 1)
+
+        self.assertEqual(list(tree.devices), disks + [tree.getDeviceByName("sd3")])
+
+    def testChange(self):
+        tree = self.tree
+        (sd0, sd1, sd2) = tree.devices
+        self.udev["/devices/virtual/block/sd1"]["MINOR"] = "9"
+        tree.updateDevicesFromEvents([("change", "/sys/devices/virtual/block/sd1")])
+
+        # only the changed device is replaced
+        new_sd1 = tree.getDeviceByName("sd1")
+        self.assertFalse(new_sd1 is sd1)
+        self.assertEqual(new_sd1.minor, 9)
+        self.assertEqual(list(tree.devices), [sd0, sd2, new_sd1])
+
+        # devices with actions registered cannot be updated
+        tree.registerAction(ActionCreateFormat(sd2, getFormat("ext4")))
+        with self.assertRaises(DeviceTreeError):
+            tree.updateDevices(changed=["/devices/virtual/block/sd2"])
+
+    def testRemove(self):
+        tree = self.tree
+        (sd0, _sd1, sd2) = tree.devices
+        del self.udev["/devices/virtual/block/sd1"]
+        tree.updateDevicesFromEvents([("change", "/sys/devices/virtual/block/sd1"),
+                                      ("remove", "/sys/devices/virtual/block/sd1")])
+        self.assertEqual(list(tree.devices), [sd0, sd2])
+        self.assertFalse("sd1" in tree.names)
+
+    def testChangeHidden(self):
+        tree = self.tree
+        (sd0, sd1, sd2) = tree.devices
+        tree.ignoredDisks = ["sd1"]
+        tree._hideIgnoredDisks([sd1])
+        self.addCleanup(lvm.lvm_cc_removeFilterRejectRegexp, "sd1")
+        self.assertEqual(tree._hidden, [sd1])
+
+        # the hidden disk is rescanned and hidden again, not duplicated
+        self.udev["/devices/virtual/block/sd1"]["MINOR"] = "9"
+        tree.updateDevicesFromEvents([("change", "/sys/devices/virtual/block/sd1")])
+        self.assertEqual(list(tree.devices), [sd0, sd2])
+        self.assertEqual(len(tree._hidden), 1)
+        self.assertFalse(tree._hidden[0] is sd1)
+        self.assertEqual(tree._hidden[0].minor, 9)
+        self.assertEqual(tree.names.count("sd1"), 1)
+
+        del self.udev["/devices/virtual/block/sd1"]
+        tree.updateDevices(removed=["/devices/virtual/block/sd1"])
+        self.assertEqual(tree._hidden, [])
+
+class DeviceTreeProcessActionsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tree = DeviceTree()
+        self.disks = []
+        for name in ("sda", "sdb", "sdc"):
+            disk = DiskDevice(name, size=Size("10 GiB"), exists=True)
+            self.tree._addDevice(disk)
+            self.disks.append(disk)
+
+        self.actions = []
+        for disk in self.disks:
+            action = ActionCreateFormat(disk, getFormat("ext4", device=disk.path))
+            self.tree.registerAction(action)
+            self.actions.append(action)
+
+    def testSerial(self):
+        tree = self.tree
+        with patch.object(ActionCreateFormat, "execute") as execute, \
+             patch("blivet.devicetree.udev.UdevEventWatch") as watch_class, \
+             patch("blivet.devicetree.udev.udev_settle") as settle:
+            tree.processActions()
+            self.assertEqual(execute.call_count, 3)
+            self.assertFalse(settle.called)
+
+        # one watch is shared by all of the actions, which only wait for
+        # udev to finish with their own disks, and all of the disks are
+        # waited for at the end
+        self.assertEqual(watch_class.call_count, 1)
+        watch = watch_class.return_value
+        names = [c[0][0] for c in watch.wait.call_args_list]
+        self.assertEqual(names,
+                         [set([a.device.name]) for a in tree._completed_actions] +
+                         [set(["sda", "sdb", "sdc"])])
+        self.assertTrue(watch.close.called)
+
+        self.assertEqual(tree.findActions(), [])
+        self.assertEqual(sorted(tree._completed_actions), sorted(self.actions))
+
+    def testParallel(self):
+        tree = self.tree
+        with patch.object(ActionCreateFormat, "execute") as execute, \
+             patch("blivet.devicetree.udev.UdevEventWatch") as watch_class, \
+             patch("blivet.devicetree.udev.udev_settle"):
+            tree.processActions(jobs=2)
+            self.assertEqual(execute.call_count, 3)
+
+        # each action waits for its own events
+        self.assertEqual(watch_class.call_count, 3)
+
+        self.assertEqual(tree.findActions(), [])
+        self.assertEqual(sorted(tree._completed_actions), sorted(self.actions))
+
+    def testDryRun(self):
+        tree = self.tree
+        with patch.object(ActionCreateFormat, "execute") as execute, \
+             patch("blivet.devicetree.log") as log:
+            tree.processActions(dryRun=True, jobs=2)
+            self.assertEqual(execute.call_count, 0)
+
+        # the planned steps are logged
+        steps = [c[0][1] for c in log.info.call_args_list
+                    if c[0][0].startswith("step")]
+        self.assertEqual(steps, [1, 1, 2])
+        self.assertEqual(len(tree.findActions()), 3)
+
+class DeviceTreeConcurrencyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tree = DeviceTree()
+        self.disks = []
+        for i in range(16):
+            # nothing exists, so that no sizes are read from the system
+            disk = DiskDevice("sd%s" % chr(ord("a") + i), size=Size("10 GiB"),
+                              exists=False)
+            disk.format = getFormat("lvmpv", device=disk.path)
+            self.tree._addDevice(disk)
+            vg = LVMVolumeGroupDevice("vg%d" % i, parents=[disk])
+            self.tree._addDevice(vg)
+            self.disks.append(disk)
+
+        for disk in self.disks:
+            vg = self.tree.getChildren(disk)[0]
+            lv = LVMLogicalVolumeDevice("lv", parents=[vg], size=Size("1 GiB"))
+            self.tree.registerAction(ActionCreateDevice(lv))
+            self.tree.registerAction(ActionCreateFormat(lv, getFormat("ext4")))
+
+    def testParallel(self):
+        tree = self.tree
+
+        def execute(action):
+            # change indexed attributes and look devices up while other
+            # actions do the same
+            device = action.device
+            for n in range(50):
+                if action.isFormat:
+                    device.format.uuid = "%d-%d" % (device.format.id, n)
+                    device.format.label = "label-%d" % device.format.id
+                else:
+                    device.uuid = "lv-%d-%d" % (device.id, n)
+
+                tree.getDeviceByName(device.name)
+                tree.getDependentDevices(device.vg)
+
+            device.exists = True
+
+        with patch.object(ActionCreateDevice, "execute", autospec=True,
+                          side_effect=execute), \
+             patch.object(ActionCreateFormat, "execute", autospec=True,
+                          side_effect=execute), \
+             patch("blivet.devicetree.udev.UdevEventWatch"), \
+             patch("blivet.devicetree.udev.udev_settle"):
+            tree.processActions(jobs=8)
+
+        self.assertEqual(tree.findActions(), [])
+        for disk in self.disks:
+            lv = tree.getDependentDevices(disk)[-1]
+            self.assertTrue(lv.exists)
+            self.assertIs(tree.getDeviceByUuid("%d-49" % lv.format.id), lv)
+            self.assertIs(tree.getDeviceByUuid("lv-%d-49" % lv.id), lv)
+            self.assertIs(tree.getDeviceByLabel("label-%d" % lv.format.id), lv)
+            self.assertIs(tree.getDeviceByName(lv.name), lv)
+            self.assertIn(lv, tree.getChildren(lv.vg))
+
+class DeviceTreeBatchTestCase(unittest.TestCase):
+    def _action(self, action_type, name, disk=None):
+        if disk:
+            device = Mock(spec=PartitionDevice, disk=disk, disks=[disk])
+        else:
+            device = Mock(disks=[])
+
+        device.exists = action_type == ACTION_TYPE_DESTROY
+        action = Mock(type=action_type, device=device, isDevice=True,
+                      isCreate=action_type == ACTION_TYPE_CREATE,
+                      isDestroy=action_type == ACTION_TYPE_DESTROY)
+        action.name = name
+        return action
+
+    def testBatches(self):
+        (sda, sdb) = (Mock(id=1), Mock(id=2))
+        actions = [self._action(ACTION_TYPE_DESTROY, "-sda1", sda),
+                   self._action(ACTION_TYPE_DESTROY, "-sdb1", sdb),
+                   self._action(ACTION_TYPE_DESTROY, "-sda2", sda),
+                   self._action(ACTION_TYPE_CREATE, "+lv"),
+                   self._action(ACTION_TYPE_CREATE, "+sda1", sda),
+                   self._action(ACTION_TYPE_CREATE, "+sdb1", sdb),
+                   self._action(ACTION_TYPE_CREATE, "+sda2", sda),
+                   self._action(ACTION_TYPE_DESTROY, "-sda3", sda)]
+
+        # runs of partition creates or destroys are grouped by disk
+        batches = DeviceTree._getActionBatches(actions)
+        self.assertEqual([[a.name for a in batch] for batch in batches],
+                         [["-sda1", "-sda2"], ["-sdb1"], ["+lv"],
+                          ["+sda1", "+sda2"], ["+sdb1"], ["-sda3"]])
+
+    def testCommitFailure(self):
+        sda = Mock(id=1)
+        tree = DeviceTree()
+        actions = [self._action(ACTION_TYPE_CREATE, "+sda%d" % i, sda)
+                   for i in range(1, 4)]
+        actions[0].executePartitions.side_effect = DiskLabelCommitError()
+        watch = Mock()
+        with patch.object(DeviceTree, "_getUdevNames", return_value=set()), \
+             patch.object(DeviceTree, "_getProbePaths", return_value=set()), \
+             patch.object(DeviceTree, "_executeAction") as execute:
+            # nothing was created, so the actions are executed one at a time
+            tree._actions = actions[:]
+            tree._executeBatch(actions, watch)
+            self.assertEqual([c[0][0] for c in execute.call_args_list], actions)
+            self.assertEqual(tree._actions, [])
+            self.assertEqual(tree._completed_actions, actions)
+
+            # some of the partitions were created, so the error is raised
+            execute.reset_mock()
+            tree._actions = actions[:]
+            actions[0].device.exists = True
+            with self.assertRaises(DiskLabelCommitError):
+                tree._executeBatch(actions, watch)
+            self.assertFalse(execute.called)
+            self.assertEqual(tree._actions, actions)
+
+class DeviceTreeMDExamineTestCase(unittest.TestCase):
+    def testBatch(self):
+        def udev_info(name, fmt):
+            return {"name": name, "DEVNAME": "/dev/%s" % name,
+                    "sysfs_path": "/devices/virtual/block/%s" % name,
+                    "ID_FS_TYPE": fmt}
+
+        tree = DeviceTree()
+        tree._addMDCandidates([udev_info("sda", "linux_raid_member"),
+                               udev_info("sdb", "linux_raid_member"),
+                               udev_info("sdc", "ext4")])
+        sda = Mock(path="/dev/sda", sysfsPath="/devices/virtual/block/sda")
+        sdb = Mock(path="/dev/sdb", sysfsPath="/devices/virtual/block/sdb")
+        examined = {"/dev/sda": {"MD_UUID": "1"}}
+        with patch.object(mdraid, "mdexamine_devices",
+                          return_value=examined) as mdexamine_devices, \
+             patch.object(mdraid, "mdexamine",
+                          return_value={"MD_UUID": "2"}) as mdexamine:
+            self.assertEqual(tree._mdExamine(sda), {"MD_UUID": "1"})
+            self.assertEqual(tree._mdExamine(sda), {"MD_UUID": "1"})
+            mdexamine_devices.assert_called_once_with(["/dev/sda", "/dev/sdb"])
+
+            # members the batch did not report on are examined on their own
+            self.assertEqual(tree._mdExamine(sdb), {"MD_UUID": "2"})
+            mdexamine.assert_called_once_with("/dev/sdb")
+            self.assertEqual(mdexamine_devices.call_count, 1)
+
+if __name__ == "__main__":
+    unittest.main()
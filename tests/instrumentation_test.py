@@ -0,0 +1,125 @@
+#!/usr/bin/python
+
+import json
+import os
+import tempfile
+import unittest
+
+from blivet import util
+from blivet.flags import flags
+from blivet.instrumentation import Recorder, recorder
+
+class RecorderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.enabled = flags.instrumentation
+        flags.instrumentation = True
+        self.recorder = Recorder()
+
+    def tearDown(self):
+        flags.instrumentation = self.enabled
+
+    def testSpans(self):
+        with self.recorder.span("populate"):
+            for name in ("sda", "sdb"):
+                with self.recorder.span("populate.addUdevDevice") as span:
+                    span.name += ".disk"
+
+        with self.recorder.span("processActions.execute", detail="create sda1"):
+            pass
+
+        self.assertRaises(RuntimeError, self._fail)
+
+        spans = self.recorder.toDict()["spans"]
+        self.assertEqual(sorted(spans.keys()),
+                         ["populate", "populate.addUdevDevice.disk",
+                          "processActions.execute", "teardown"])
+        self.assertEqual(spans["populate.addUdevDevice.disk"]["count"], 2)
+        self.assertEqual(spans["teardown"]["count"], 1)
+        self.assertGreaterEqual(spans["populate"]["seconds"],
+                                spans["populate.addUdevDevice.disk"]["seconds"])
+
+        # only the spans with a detail are kept individually
+        events = self.recorder.toDict()["events"]
+        self.assertEqual([(e["name"], e["detail"]) for e in events],
+                         [("processActions.execute", "create sda1")])
+
+        self.recorder.reset()
+        self.assertEqual(self.recorder.toDict(),
+                         {"spans": {}, "events": [], "dropped": 0,
+                          "commands": {}})
+
+    def testEventLimit(self):
+        self.recorder.maxEvents = 3
+        self.recorder.reset()
+        for i in range(5):
+            with self.recorder.span("processActions.execute", detail=str(i)):
+                pass
+
+        # only the last events are kept, but all runs are counted
+        data = self.recorder.toDict()
+        self.assertEqual([e["detail"] for e in data["events"]], ["2", "3", "4"])
+        self.assertEqual(data["dropped"], 2)
+        self.assertEqual(data["spans"]["processActions.execute"]["count"], 5)
+
+        self.assertEqual(len(self.recorder.summary()), 4)
+        self.assertEqual(len(self.recorder.summary(events=False)), 1)
+
+    def _fail(self):
+        @self.recorder.timed("teardown")
+        def teardown():
+            raise RuntimeError("busy")
+
+        teardown()
+
+    def testCommands(self):
+        self.recorder.command(["/sbin/lvm", "pvs"], 0.5, 0)
+        self.recorder.command(["lvm", "vgs"], 0.25, 5)
+        self.recorder.command(["mdadm"], 0.0, None)
+
+        commands = self.recorder.toDict()["commands"]
+        self.assertEqual(commands["lvm"],
+                         {"count": 2, "seconds": 0.75,
+                          "returncodes": {"0": 1, "5": 1}})
+        self.assertEqual(commands["mdadm"]["returncodes"], {"None": 1})
+
+        summary = self.recorder.summary()
+        self.assertEqual(len(summary), 2)
+        self.assertTrue(summary[0].startswith("command lvm "))
+        self.assertTrue(summary[0].endswith(", 1 failed"))
+
+    def testDisabled(self):
+        flags.instrumentation = False
+        with self.recorder.span("populate"):
+            pass
+        self.recorder.command(["lvm"], 1.0, 0)
+        self.assertEqual(self.recorder.toDict(),
+                         {"spans": {}, "events": [], "dropped": 0,
+                          "commands": {}})
+
+    def testExport(self):
+        with self.recorder.span("populate.udev"):
+            pass
+        self.recorder.command(["udevadm", "settle"], 0.1, 0)
+
+        (fd, path) = tempfile.mkstemp(prefix="instrumentation-test-")
+        os.close(fd)
+        try:
+            self.recorder.save(path)
+            with open(path) as f:
+                self.assertEqual(json.load(f), self.recorder.toDict())
+        finally:
+            os.unlink(path)
+
+    def testRunProgram(self):
+        recorder.reset()
+        util.run_program(["true"])
+        util.run_program(["false"])
+        self.assertRaises(OSError, util.run_program, ["/nonexistent/program"])
+
+        commands = recorder.toDict()["commands"]
+        self.assertEqual(commands["true"]["returncodes"], {"0": 1})
+        self.assertEqual(commands["false"]["returncodes"], {"1": 1})
+        self.assertEqual(commands["program"]["returncodes"], {"None": 1})
+
+if __name__ == "__main__":
+    unittest.main()
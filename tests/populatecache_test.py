@@ -0,0 +1,173 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock, patch
+
+from blivet import populatecache
+from blivet.populatecache import PopulateCache
+
+class PopulateCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "cache.json")
+        self.fingerprints = {"/devices/sda": "8:0:a", "/devices/sdb": "8:16:b"}
+        patcher = patch.object(populatecache, "device_fingerprint",
+                               side_effect=lambda p: self.fingerprints.get(p))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testProbe(self):
+        probe = Mock(side_effect=lambda name: {"name": name})
+
+        cache = PopulateCache(self.path)
+        self.assertEqual(cache.probe("/devices/sda", "udev", probe, "sda"),
+                         {"name": "sda"})
+        self.assertEqual(cache.probe("/devices/sdb", "udev", probe, "sdb"),
+                         {"name": "sdb"})
+
+        # devices without a fingerprint are probed every time
+        cache.probe("/devices/sdc", "udev", probe, "sdc")
+        cache.probe("/devices/sdc", "udev", probe, "sdc")
+        self.assertEqual(probe.call_count, 4)
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+        # results are copies
+        cache.probe("/devices/sda", "udev", probe, "sda")["name"] = "foo"
+        self.assertEqual(cache.probe("/devices/sda", "udev", probe, "sda"),
+                         {"name": "sda"})
+        self.assertEqual(probe.call_count, 4)
+        cache.save()
+
+        # only devices whose fingerprint changed are probed again
+        self.fingerprints["/devices/sdb"] = "8:16:c"
+        probe.reset_mock()
+        cache = PopulateCache(self.path)
+        result = cache.probe("/devices/sda", "udev", probe, "sda")
+        self.assertEqual(result, {"name": "sda"})
+        self.assertTrue(isinstance(result["name"], str))
+        cache.probe("/devices/sdb", "udev", probe, "sdb")
+        self.assertEqual([c[0] for c in probe.call_args_list], [("sdb",)])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def testProbeDevice(self):
+        probe = Mock(side_effect=lambda name: ("dumpe2fs output", name))
+        nodes = {"/dev/sda": "/devices/sda"}
+        with patch.object(populatecache, "sysfs_path_of",
+                          side_effect=nodes.get):
+            cache = PopulateCache(self.path)
+            info = Mock(return_value="Block count: 100")
+            for _i in range(2):
+                self.assertEqual(cache.probeDevice("/dev/sda", "dumpe2fs -h", info),
+                                 "Block count: 100")
+            self.assertEqual(info.call_count, 1)
+
+            # results json cannot represent are not cached
+            for _i in range(2):
+                self.assertEqual(cache.probeDevice("/dev/sda", "sb", probe, "sda"),
+                                 ("dumpe2fs output", "sda"))
+            self.assertEqual(probe.call_count, 2)
+
+            # nodes that are not block devices are probed every time
+            cache.probeDevice("/dev/foo", "dumpe2fs -h", info)
+            cache.probeDevice("/dev/foo", "dumpe2fs -h", info)
+            self.assertEqual(info.call_count, 3)
+            cache.save()
+
+            cache = PopulateCache(self.path)
+            self.assertEqual(cache.probeDevice("/dev/sda", "dumpe2fs -h", info),
+                             "Block count: 100")
+            self.assertEqual(info.call_count, 3)
+
+    def testProbeSystem(self):
+        probe = Mock(return_value={"vg-lv": {"LVM2_LV_NAME": "lv"}})
+
+        cache = PopulateCache(self.path)
+        for path in self.fingerprints:
+            cache.fingerprint(path)
+        cache.probeSystem("lvs", probe)
+        cache.save()
+
+        cache = PopulateCache(self.path)
+        for path in self.fingerprints:
+            cache.fingerprint(path)
+        self.assertEqual(cache.probeSystem("lvs", probe),
+                         {"vg-lv": {"LVM2_LV_NAME": "lv"}})
+        self.assertEqual(probe.call_count, 1)
+
+        # any change to any device invalidates the result
+        self.fingerprints["/devices/sda"] = "8:0:b"
+        cache = PopulateCache(self.path)
+        for path in self.fingerprints:
+            cache.fingerprint(path)
+        cache.probeSystem("lvs", probe)
+        self.assertEqual(probe.call_count, 2)
+
+    def testSave(self):
+        probe = Mock(return_value={})
+        cache = PopulateCache(self.path)
+        cache.probe("/devices/sda", "udev", probe)
+        cache.probe("/devices/sdb", "udev", probe)
+        cache.save()
+
+        # entries for devices that were not looked up are dropped
+        cache = PopulateCache(self.path)
+        cache.probe("/devices/sda", "udev", probe)
+        cache.save()
+        cache = PopulateCache(self.path)
+        cache.probe("/devices/sdb", "udev", probe)
+        self.assertEqual(probe.call_count, 3)
+
+        # unreadable or outdated files are ignored
+        with open(self.path, "w") as f:
+            f.write("{")
+        cache = PopulateCache(self.path)
+        cache.probe("/devices/sda", "udev", probe)
+        self.assertEqual(probe.call_count, 4)
+
+class DeviceFingerprintTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testFingerprint(self):
+        # a regular file stands in for the device node
+        node = os.path.join(self.tmpdir, "node")
+        with open(node, "w") as f:
+            f.write("\0" * 300 * 1024)
+
+        files = {"/sys/devices/sda/dev": "8:0\n",
+                 "/sys/devices/sda/size": "600\n",
+                 "/run/udev/data/b8:0": "S:disk/by-id/foo\nI:1234\n"}
+        real_open = os.open
+        with patch.object(populatecache, "_read", side_effect=files.get), \
+             patch.object(populatecache.os, "open",
+                          side_effect=lambda p, flags: real_open(node, flags)):
+            fingerprint = populatecache.device_fingerprint("/devices/sda")
+            self.assertTrue(fingerprint.startswith("8:0:600:1234:"))
+
+            # the checksum covers the end of the device
+            with open(node, "r+") as f:
+                f.seek(299 * 1024)
+                f.write("md")
+            self.assertNotEqual(populatecache.device_fingerprint("/devices/sda"),
+                                fingerprint)
+
+            files["/sys/devices/sda/size"] = "1200\n"
+            self.assertNotEqual(populatecache.device_fingerprint("/devices/sda"),
+                                fingerprint)
+
+            del files["/sys/devices/sda/dev"]
+            self.assertEqual(populatecache.device_fingerprint("/devices/sda"),
+                             None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import Mock, patch
+
+from blivet import probecache
+from blivet.flags import flags
+from blivet.probecache import ProbeCache
+
+class ProbeCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tokens = {"/dev/sda": ("8:0", "100", 1.0),
+                       "/dev/sdb": ("8:16", "100", 1.0)}
+        patcher = patch.object(probecache, "change_token",
+                               side_effect=lambda p: self.tokens.get(p))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = ProbeCache()
+        self.probe = Mock(side_effect=lambda p: {"device": p})
+
+    def testProbe(self):
+        cache = self.cache
+        for _i in range(2):
+            self.assertEqual(cache.probe("/dev/sda", "info", self.probe, "/dev/sda"),
+                             {"device": "/dev/sda"})
+        self.assertEqual(self.probe.call_count, 1)
+
+        # results are copies
+        cache.probe("/dev/sda", "info", self.probe, "/dev/sda")["device"] = None
+        self.assertEqual(cache.probe("/dev/sda", "info", self.probe, "/dev/sda"),
+                         {"device": "/dev/sda"})
+
+        # a new token drops the device's results
+        self.tokens["/dev/sda"] = ("8:0", "200", 1.0)
+        cache.probe("/dev/sda", "info", self.probe, "/dev/sda")
+        self.assertEqual(self.probe.call_count, 2)
+
+        # devices without a token are not cached
+        cache.probe("/dev/sdc", "info", self.probe, "/dev/sdc")
+        cache.probe("/dev/sdc", "info", self.probe, "/dev/sdc")
+        self.assertEqual(self.probe.call_count, 4)
+
+        self.assertEqual(cache.stats, {"info": (3, 2)})
+
+    def testInvalidating(self):
+        cache = self.cache
+        cache.probe("/dev/sda", "info", self.probe, "/dev/sda")
+        cache.probe("/dev/sdb", "info", self.probe, "/dev/sdb")
+        with cache.invalidating(["/dev/sda"]):
+            # devices being changed are probed every time
+            cache.probe("/dev/sda", "info", self.probe, "/dev/sda")
+            cache.probe("/dev/sda", "info", self.probe, "/dev/sda")
+            cache.probe("/dev/sdb", "info", self.probe, "/dev/sdb")
+        self.assertEqual(self.probe.call_count, 4)
+
+        cache.probe("/dev/sda", "info", self.probe, "/dev/sda")
+        cache.probe("/dev/sda", "info", self.probe, "/dev/sda")
+        self.assertEqual(self.probe.call_count, 5)
+
+        cache.invalidate(["/dev/sdb"])
+        cache.probe("/dev/sdb", "info", self.probe, "/dev/sdb")
+        self.assertEqual(self.probe.call_count, 6)
+
+    def testStore(self):
+        # results that are not in memory come from the store
+        cache = self.cache
+        cache.store = Mock()
+        cache.store.probeDevice.return_value = {"device": "stored"}
+        for _i in range(2):
+            self.assertEqual(cache.probe("/dev/sda", "info", self.probe, "/dev/sda"),
+                             {"device": "stored"})
+        cache.store.probeDevice.assert_called_once_with("/dev/sda", "info",
+                                                        self.probe, "/dev/sda")
+        self.assertFalse(self.probe.called)
+
+    def testDisabled(self):
+        saved = flags.probe_cache
+        flags.probe_cache = False
+        try:
+            self.cache.probe("/dev/sda", "info", self.probe, "/dev/sda")
+            self.cache.probe("/dev/sda", "info", self.probe, "/dev/sda")
+        finally:
+            flags.probe_cache = saved
+        self.assertEqual(self.probe.call_count, 2)
+
+class ChangeTokenTestCase(unittest.TestCase):
+    def testFile(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmpdir, "image")
+            with open(path, "w") as f:
+                f.write("a")
+            token = probecache.change_token(path)
+            self.assertEqual(probecache.change_token(path), token)
+
+            with open(path, "a") as f:
+                f.write("b")
+            self.assertNotEqual(probecache.change_token(path), token)
+            self.assertEqual(probecache.change_token(path + "x"), None)
+        finally:
+            shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+    unittest.main()
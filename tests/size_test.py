@@ -21,10 +21,13 @@
 #
 # Red Hat Author(s): David Cantrell <dcantrell@redhat.com>
 
+import copy
+from decimal import Decimal
+import pickle
 import unittest
 
 from blivet.errors import SizePlacesError
-from blivet.size import Size, _prefixes
+from blivet.size import Size, _prefixes, _LRUCache
 
 class SizeTestCase(unittest.TestCase):
     def testExceptions(self):
@@ -103,11 +106,73 @@ class SizeTestCase(unittest.TestCase):
         self.assertEquals(s.humanReadable(), "-500 MiB")
         self.assertEquals(s.convertTo(spec="b"), -524288000)
 
+    def testCopy(self):
+        s = Size("12.5 MiB")
+        self.assertEqual(copy.deepcopy(s), s)
+        self.assertEqual(pickle.loads(pickle.dumps(s)), s)
+        self.assertEqual(pickle.loads(pickle.dumps(s, 2)), s)
+
     def testPartialBytes(self):
         self.assertEquals(Size(1024.6), Size(1024))
         self.assertEquals(Size("%s KiB" % (1/1025.0,)), Size(0))
         self.assertEquals(Size("%s KiB" % (1/1023.0,)), Size(1))
 
+    def testArithmetic(self):
+        s = Size("1 GiB")
+        self.assertEqual(s + Size(1), Size(1073741825))
+        self.assertEqual(s - 1, Size(1073741823))
+        self.assertEqual(s * 2, Size("2 GiB"))
+        self.assertEqual(s / 3, Size(357913941))
+        self.assertEqual(s % 1000, Size(824))
+        self.assertEqual(sum([s, s]), Size("2 GiB"))
+        for value in (s + Size(1), s - 1, 1 + s, s * 2, s / 3, s % 1000,
+                      sum([s, s]), s * Decimal("1.1")):
+            self.assertIsInstance(value, Size)
+
+        # partial bytes are dropped, rounding toward zero
+        self.assertEqual(Size(1000) * Decimal("1.1"), Size(1100))
+        self.assertEqual(Size(7) / 2, Size(3))
+        self.assertEqual(Size(-7) / 2, Size(-3))
+        self.assertEqual(Size(-7) % 2, Size(-1))
+        self.assertEqual(Size(10) / Decimal("2.5"), Size(4))
+        self.assertEqual(Size(10) + Decimal("0.5"), Size(10))
+
+        # operations that do not yield a size
+        self.assertEqual(-s, Decimal(-1073741824))
+        self.assertEqual(1 / Size(4), Decimal("0.25"))
+        self.assertNotIsInstance(-s, Size)
+
+    def testComparison(self):
+        s = Size(1024)
+        self.assertEqual(s, 1024)
+        self.assertEqual(s, Decimal(1024))
+        self.assertEqual(s, Size("1 KiB"))
+        self.assertNotEqual(s, None)
+        self.assertLess(s, Decimal("1024.5"))
+        self.assertGreater(s, 1023.5)
+        self.assertEqual(hash(s), hash(1024))
+        self.assertEqual(sorted([Size(3), 2, Decimal("2.5")]),
+                         [2, Decimal("2.5"), Size(3)])
+        self.assertEqual("%d" % s, "1024")
+        self.assertEqual(int(s), 1024)
+        self.assertTrue(Size(1))
+        self.assertFalse(Size(0))
+
+    def testCache(self):
+        cache = _LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+
+        # cached results are the same as freshly computed ones
+        for _i in range(2):
+            self.assertEqual(Size("12.5 GiB"), Size(13421772800))
+            self.assertEqual(Size("12.5 GiB").humanReadable(), "12.5 GiB")
+            self.assertEqual(Size("12.5 GiB").humanReadable(places=0), "13 GiB")
+
     def testTranslated(self):
         import locale
         import os
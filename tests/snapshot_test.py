@@ -0,0 +1,186 @@
+#!/usr/bin/python
+
+import unittest
+
+from mock import Mock
+
+import parted
+
+from blivet.deviceaction import ActionCreateDevice
+from blivet.deviceaction import ActionCreateFormat
+from blivet.deviceaction import ActionDestroyDevice
+from blivet.devicetree import DeviceTree
+from blivet.devices import DiskDevice
+from blivet.devices import LVMLogicalVolumeDevice
+from blivet.devices import LVMVolumeGroupDevice
+from blivet.devices import PartitionDevice
+from blivet.formats import getFormat
+from blivet.size import Size
+from blivet.snapshot import Snapshot
+
+class SnapshotTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tree = DeviceTree()
+        self.storage = Mock(devicetree=self.tree, roots=[])
+        # the disk does not exist, so that its size is not read from the host
+        self.disk = DiskDevice("sda", size=Size("10 GiB"), exists=False)
+        self.disk.format = getFormat("lvmpv", device=self.disk.path,
+                                     exists=True)
+        self.tree._addDevice(self.disk)
+        self.vg = LVMVolumeGroupDevice("vg0", parents=[self.disk], exists=True)
+        self.tree._addDevice(self.vg)
+        self.lv = LVMLogicalVolumeDevice("root", parents=[self.vg],
+                                         size=Size("1 GiB"), exists=True)
+        self.lv.format = getFormat("ext4", device=self.lv.path, exists=True,
+                                   uuid="1234-abcd")
+        self.tree._addDevice(self.lv)
+        self.snapshot = None
+
+    def tearDown(self):
+        if self.snapshot is not None:
+            self.snapshot.release()
+
+    def _change(self):
+        tree = self.tree
+        tree.registerAction(ActionCreateFormat(self.lv, getFormat("xfs")))
+        tree.registerAction(ActionDestroyDevice(self.lv))
+        home = LVMLogicalVolumeDevice("home", parents=[self.vg],
+                                      size=Size("1 GiB"),
+                                      fmt=getFormat("ext4"))
+        tree.registerAction(ActionCreateDevice(home))
+        return home
+
+    def testRestore(self):
+        tree = self.tree
+        devices = tree.devices[:]
+        fmt = self.lv.format
+        self.snapshot = Snapshot(self.storage)
+        home = self._change()
+        self.assertNotEqual(tree.devices, devices)
+        self.assertEqual(self.vg.lvs, [home])
+
+        self.snapshot.restore()
+        self.assertEqual(tree.devices, devices)
+        self.assertEqual(tree._actions, [])
+        self.assertEqual(self.vg.lvs, [self.lv])
+        self.assertEqual(self.vg.kids, 1)
+        self.assertIs(self.lv.format, fmt)
+        self.assertEqual(fmt.type, "ext4")
+        self.assertIs(tree.getDeviceByID(self.lv.id), self.lv)
+        self.assertIs(tree.getDeviceByName("vg0-root"), self.lv)
+        self.assertIs(tree.getDeviceByUuid("1234-abcd"), self.lv)
+        self.assertEqual(tree.getDeviceByName("vg0-home"), None)
+
+        # the snapshot can be restored again after more changes
+        self._change()
+        self.snapshot.restore()
+        self.assertEqual(tree.devices, devices)
+        self.assertEqual(self.vg.lvs, [self.lv])
+
+    def testContents(self):
+        origins = self.vg.voriginSnapshots
+        origins["snap"] = Size("1 GiB")
+        self.snapshot = Snapshot(self.storage)
+
+        # lists and dicts are changed in place, without setting an attribute
+        origins["snap"] = Size("2 GiB")
+        origins["other"] = Size("1 GiB")
+        self.snapshot.restore()
+        self.assertIs(self.vg.voriginSnapshots, origins)
+        self.assertEqual(origins, {"snap": Size("1 GiB")})
+
+        del origins["snap"]
+        self.snapshot.restore()
+        self.assertEqual(origins, {"snap": Size("1 GiB")})
+
+    def _addPartition(self):
+        """ Add a disk with a disklabel and a partition on it.
+
+            :returns: the disk's parted disk and the partition's parted
+                      partition, which are mocks
+        """
+        disk = DiskDevice("sdb", size=Size("10 GiB"), exists=False)
+        disk.format = getFormat("disklabel")
+        parted_disk = Mock(name="parted disk")
+        disk.format._partedDisk = parted_disk
+        disk.format._origPartedDisk = Mock(name="original parted disk")
+        self.tree._addDevice(disk)
+
+        partition = PartitionDevice("sdb1", parents=[disk], size=Size("1 GiB"))
+        partition.parents = [disk]
+        partition._partedPartition = Mock(name="parted partition",
+                                          disk=parted_disk,
+                                          type=parted.PARTITION_NORMAL)
+        self.tree._addDevice(partition)
+        return (disk, partition)
+
+    def testPartedDisk(self):
+        (disk, partition) = self._addPartition()
+        parted_disk = disk.format._partedDisk
+        orig_parted_disk = disk.format._origPartedDisk
+        self.snapshot = Snapshot(self.storage)
+
+        # the parted disk is changed in place, so it is duplicated, once,
+        # before it is handed out
+        self.assertIs(disk.format.partedDisk, parted_disk)
+        disk.format.partedDisk.addPartition(Mock())
+        self.assertEqual(parted_disk.duplicate.call_count, 1)
+        self.assertEqual(orig_parted_disk.duplicate.call_count, 1)
+        disk.format._partedDisk = Mock(name="fresh parted disk")
+
+        self.snapshot.restore()
+        self.assertIs(disk.format._partedDisk, parted_disk.duplicate.return_value)
+        self.assertIs(disk.format._origPartedDisk,
+                      orig_parted_disk.duplicate.return_value)
+
+        # the duplicate is duplicated again when restoring a second time
+        disk.format.partedDisk.removePartition(Mock())
+        self.snapshot.restore()
+        duplicate = parted_disk.duplicate.return_value
+        self.assertIs(disk.format._partedDisk, duplicate.duplicate.return_value)
+
+    def testPartition(self):
+        (disk, partition) = self._addPartition()
+        parted_disk = disk.format._partedDisk
+        self.snapshot = Snapshot(self.storage)
+
+        # allocating partitions changes the parted partition and the disk
+        partition.partedPartition.geometry = Mock()
+        partition._partedPartition = Mock(name="new parted partition",
+                                          disk=parted_disk,
+                                          type=parted.PARTITION_NORMAL)
+        self.tree._removeDevice(partition, moddisk=False)
+        self.assertEqual(disk.kids, 0)
+
+        self.snapshot.restore()
+        duplicate = parted_disk.duplicate.return_value
+        duplicate.getPartitionByPath.assert_called_with(partition.path)
+        self.assertIs(partition._partedPartition,
+                      duplicate.getPartitionByPath.return_value)
+        self.assertEqual(list(partition.parents), [disk])
+        self.assertEqual(disk.kids, 1)
+        self.assertIn(partition, self.tree.devices)
+
+    def testShared(self):
+        self.snapshot = Snapshot(self.storage)
+        self.assertEqual(self.snapshot._saved, {})
+
+        # only what is about to change gets saved
+        self.lv.format.label = "root"
+        self.assertEqual(list(self.snapshot._saved.keys()), [id(self.lv.format)])
+
+        # looking at how devices relate to each other changes nothing
+        self.lv.dependsOn(self.disk)
+        self.assertEqual(list(self.snapshot._saved.keys()), [id(self.lv.format)])
+
+    def testRelease(self):
+        self.snapshot = Snapshot(self.storage)
+        self.assertTrue(self.snapshot.active)
+        self.snapshot.release()
+        self.assertFalse(self.snapshot.active)
+
+        self.lv.format.label = "root"
+        self.assertEqual(self.snapshot._saved, {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+
+import logging
+import unittest
+
+from blivet import storage_log
+
+class Traced(object):
+    def method(self, *args, **kwargs):
+        storage_log.log_method_call(self, *args, **kwargs)
+        return self.inner()
+
+    def inner(self):
+        storage_log.log_method_call(self)
+        storage_log.log_method_return(self, 42)
+        return 42
+
+class StorageLogTestCase(unittest.TestCase):
+    def setUp(self):
+        self.records = []
+        self.handler = logging.Handler()
+        self.handler.emit = self.records.append
+        storage_log.log.addHandler(self.handler)
+        self.level = storage_log.log.level
+
+    def tearDown(self):
+        storage_log.log.removeHandler(self.handler)
+        storage_log.log.setLevel(self.level)
+        storage_log.method_timer.stop()
+        storage_log.method_timer.resetStats()
+
+    def testMessages(self):
+        storage_log.log.setLevel(logging.DEBUG)
+        Traced().method("sda", password="secret")
+        messages = [r.getMessage() for r in self.records]
+        self.assertEqual(len(messages), 3)
+
+        # the indentation is the depth of the stack
+        depth = len(messages[0]) - len(messages[0].lstrip())
+        self.assertEqual(messages[0],
+                         " " * depth + "Traced.method: sda ; password: Skipped ;")
+        self.assertEqual(messages[1], " " * (depth + 1) + "Traced.inner:")
+        self.assertEqual(messages[2],
+                         " " * (depth + 1) + "Traced.inner returned 42")
+
+    def testDisabled(self):
+        storage_log.log.setLevel(logging.INFO)
+        Traced().method("sda")
+        self.assertEqual(self.records, [])
+
+    def testTimer(self):
+        storage_log.log.setLevel(logging.INFO)
+        timer = storage_log.method_timer
+        timer.start()
+        traced = Traced()
+        for _i in range(3):
+            self.assertEqual(traced.method(), 42)
+        timer.stop()
+        traced.method()
+
+        stats = timer.stats
+        self.assertEqual(sorted(stats.keys()),
+                         [("Traced", "inner"), ("Traced", "method")])
+        self.assertEqual(stats[("Traced", "method")][0], 3)
+        self.assertEqual(stats[("Traced", "inner")][0], 3)
+        self.assertGreaterEqual(stats[("Traced", "method")][1],
+                                stats[("Traced", "inner")][1])
+        self.assertEqual(self.records, [])
+
+        timer.resetStats()
+        self.assertEqual(timer.stats, {})
+
+if __name__ == "__main__":
+    unittest.main()
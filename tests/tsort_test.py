@@ -52,5 +52,29 @@ class TopologicalSortTestCase(unittest.TestCase):
         self.failUnless(check_order(order, graph),
                         "ordering constraints not satisfied")
 
+class RankedTopologicalSortTestCase(unittest.TestCase):
+    def testRanks(self):
+        # ranks are equivalent to edges from every ranked item to each item
+        # with a lower rank
+        items = [1, 2, 3, 4, 5, 6]
+        ranks = {1: 10, 2: 100, 3: 10, 5: 100}
+        edges = [(4, 1), (6, 3)]
+        ranked = [(p, c) for p in items for c in items
+                    if p in ranks and c in ranks and ranks[p] > ranks[c]]
+        graph = blivet.tsort.create_graph(items, edges, ranks=ranks)
+        order = blivet.tsort.tsort(graph)
+        self.assertEqual(order,
+                         blivet.tsort.tsort(blivet.tsort.create_graph(items,
+                                                    sorted(edges + ranked))))
+
+        # the graph is not modified
+        self.assertEqual(graph["edges"], edges)
+        self.assertEqual(graph["incoming"], {1: 1, 2: 0, 3: 1, 4: 0, 5: 0, 6: 0})
+
+        graph = blivet.tsort.create_graph(items, [(1, 2)], ranks=ranks)
+        self.failUnlessRaises(blivet.tsort.CyclicGraphError,
+                              blivet.tsort.tsort,
+                              graph)
+
 if __name__ == "__main__":
     unittest.main()
@@ -3,14 +3,27 @@
 import unittest
 import mock
 import os
+import shutil
+import sys
+import tempfile
+import traceback
 
 class UdevTest(unittest.TestCase):
 
     def setUp(self):
         import blivet.udev
+        self._saved = dict((name, getattr(blivet.udev, name))
+                           for name in ("os", "log", "util", "global_udev",
+                                        "udev_enumerate_devices",
+                                        "udev_get_device"))
         blivet.udev.os = mock.Mock()
         blivet.udev.log = mock.Mock()
 
+    def tearDown(self):
+        import blivet.udev
+        for (name, value) in self._saved.items():
+            setattr(blivet.udev, name, value)
+
     def test_udev_enumerate_devices(self):
         import blivet.udev
         ENUMERATE_LIST = [
@@ -150,6 +163,210 @@ class UdevTest(unittest.TestCase):
         blivet.udev.udev_trigger()
         self.assertTrue(blivet.udev.util.run_program.called)
 
+class UdevCollectTest(unittest.TestCase):
+    PATHS = ["/devices/virtual/block/loop%d" % i for i in range(20)] + \
+            ["/devices/virtual/block/ram0"]
+
+    def _get_block_device(self, sysfs_path):
+        import blivet.udev
+        return {"name": os.path.basename(sysfs_path),
+                "udev": getattr(blivet.udev._thread_udev, "udev", None)}
+
+    def test_udev_get_block_devices(self):
+        import blivet.udev
+        contexts = []
+
+        def new_context():
+            contexts.append(mock.Mock())
+            return contexts[-1]
+
+        with mock.patch("blivet.udev.udev_settle"), \
+             mock.patch("blivet.udev.udev_enumerate_devices", return_value=self.PATHS), \
+             mock.patch("blivet.udev.udev_get_block_device", self._get_block_device), \
+             mock.patch("blivet.udev.pyudev.Udev", side_effect=new_context):
+            # blacklisted devices are skipped and the order is kept
+            serial = blivet.udev.udev_get_block_devices(jobs=1)
+            self.assertEqual([d["name"] for d in serial],
+                             ["loop%d" % i for i in range(20)])
+            self.assertEqual(contexts, [])
+
+            threaded = blivet.udev.udev_get_block_devices(jobs=4)
+            self.assertEqual([d["name"] for d in threaded],
+                             [d["name"] for d in serial])
+
+        # each thread has its own udev context, released at the end
+        self.assertEqual(len(contexts), 4)
+        self.assertTrue(all(d["udev"] in contexts for d in threaded))
+        self.assertTrue(all(c.unref.called for c in contexts))
+
+    def test_udev_map_error(self):
+        import blivet.udev
+
+        def fail(path):
+            raise OSError("cannot read %s" % path)
+
+        with mock.patch("blivet.udev.pyudev.Udev"):
+            try:
+                blivet.udev._udev_map(fail, self.PATHS, 4)
+            except OSError:
+                # the traceback leads to where collecting failed
+                tb = traceback.extract_tb(sys.exc_info()[2])
+                self.assertEqual(tb[-1][2], "fail")
+            else:
+                self.fail("no exception raised")
+
+class FakeMonitor(object):
+    """ A monitor returning batches of (action, seqnum, syspath) events.
+
+        Each batch is returned by a separate round of receive_device calls.
+    """
+    def __init__(self, batches):
+        self.batches = batches
+        (self._read, self._write) = os.pipe()
+        os.write(self._write, b"x")
+
+    def fileno(self):
+        return self._read
+
+    def receive_device(self):
+        if not self.batches:
+            return None
+
+        if not self.batches[0]:
+            self.batches.pop(0)
+            return None
+
+        return self.batches[0].pop(0)
+
+    def unref(self):
+        os.close(self._read)
+        os.close(self._write)
+
+class UdevEventWatchTest(unittest.TestCase):
+    SDA1 = "/sys/devices/pci0000:00/0000:00:1f.2/host0/target0:0:0/0:0:0:0/block/sda/sda1"
+    SDB = "/sys/devices/pci0000:00/0000:00:1f.2/host1/target1:0:0/1:0:0:0/block/sdb"
+
+    def _watch(self, kernel, processed):
+        import blivet.udev
+        monitors = [FakeMonitor(kernel), FakeMonitor(processed)]
+        with mock.patch.object(blivet.udev.global_udev, "create_monitor",
+                               side_effect=monitors):
+            return blivet.udev.UdevEventWatch()
+
+    def test_event_device_names(self):
+        from blivet.udev import udev_event_device_names
+        self.assertEqual(udev_event_device_names(self.SDA1), set(["sda", "sda1"]))
+        self.assertEqual(udev_event_device_names(self.SDB), set(["sdb"]))
+
+        # devices under dm and md devices are found through their slaves
+        tmpdir = tempfile.mkdtemp()
+        try:
+            block = os.path.join(tmpdir, "block")
+            os.makedirs(os.path.join(block, "sda", "sda1"))
+            os.makedirs(os.path.join(block, "dm-0", "slaves"))
+            os.symlink(os.path.join(block, "sda", "sda1"),
+                       os.path.join(block, "dm-0", "slaves", "sda1"))
+            self.assertEqual(udev_event_device_names(os.path.join(block, "dm-0")),
+                             set(["dm-0", "sda", "sda1"]))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_wait(self):
+        import blivet.udev
+        kernel = [[("add", 1, self.SDA1), ("change", 2, self.SDB)]]
+        processed = [[("add", 1, self.SDA1)], [], [("change", 2, self.SDB)]]
+        watch = self._watch(kernel, processed)
+        before = blivet.udev.udev_wait_stats()
+        with mock.patch("blivet.udev.util") as util:
+            util.run_program.return_value = 0
+            # the unprocessed event on sdb does not hold up a wait on sda
+            watch.wait(["sda"])
+            stats = blivet.udev.udev_wait_stats()
+            self.assertEqual(stats["waits"] - before["waits"], 1)
+            self.assertEqual(stats["blocked"] - before["blocked"], 0)
+            self.assertEqual(processed, [[], [("change", 2, self.SDB)]])
+
+            watch.wait(["sdb"])
+            stats = blivet.udev.udev_wait_stats()
+            self.assertEqual(stats["waits"] - before["waits"], 2)
+            self.assertEqual(stats["blocked"] - before["blocked"], 1)
+            self.assertEqual(processed, [])
+
+            # udevd is pinged before each wait, but never settled
+            util.run_program.assert_called_with(["udevadm", "control", "--ping",
+                                                 "--timeout=300"])
+            self.assertEqual(util.run_program.call_count, 2)
+
+        watch.close()
+
+    def test_wait_late_change_event(self):
+        import blivet.udev
+        kernel = []
+        processed = []
+
+        def ping(argv):
+            # udevd sends the change event for the closed device node while
+            # handling the ping, and processes it afterwards
+            kernel.append([("change", 1, self.SDB)])
+            processed.extend([[], [("change", 1, self.SDB)]])
+            return 0
+
+        watch = self._watch(kernel, processed)
+        before = blivet.udev.udev_wait_stats()
+        with mock.patch("blivet.udev.util") as util:
+            util.run_program.side_effect = ping
+            watch.wait(["sdb"])
+
+        stats = blivet.udev.udev_wait_stats()
+        self.assertEqual(stats["blocked"] - before["blocked"], 1)
+        self.assertEqual(kernel, [])
+        self.assertEqual(processed, [])
+        watch.close()
+
+    def test_wait_ping_failed(self):
+        kernel = [[("change", 1, self.SDB)]]
+        watch = self._watch(kernel, [])
+        with mock.patch("blivet.udev.util") as util:
+            util.run_program.return_value = 1
+            watch.wait(["sdb"])
+            util.run_program.assert_called_with(["udevadm", "settle",
+                                                 "--timeout=300"])
+
+        watch.close()
+
+    def test_wait_stalled(self):
+        kernel = [[("change", 1, self.SDB)]]
+        watch = self._watch(kernel, [])
+        watch.stall_timeout = 0
+        with mock.patch("blivet.udev.util") as util:
+            util.run_program.return_value = 0
+            watch.wait(["sdb"])
+            util.run_program.assert_called_with(["udevadm", "settle",
+                                                 "--timeout=300"])
+
+        watch.close()
+
+    def test_wait_without_monitor(self):
+        import blivet.udev
+        with mock.patch.object(blivet.udev.global_udev, "create_monitor",
+                               side_effect=OSError("no netlink")):
+            watch = blivet.udev.UdevEventWatch()
+
+        with mock.patch("blivet.udev.util") as util:
+            watch.wait(["sda"])
+            self.assertTrue(util.run_program.called)
+
+    def test_settle_scope(self):
+        import blivet.udev
+        watch = mock.Mock()
+        with mock.patch("blivet.udev.util") as util:
+            with blivet.udev.udev_settle_scope(watch, ["sda"]):
+                blivet.udev.udev_settle()
+                watch.wait.assert_called_once_with(set(["sda"]))
+                self.assertFalse(util.run_program.called)
+
+            blivet.udev.udev_settle()
+            self.assertTrue(util.run_program.called)
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+
+import logging
+import time
+import unittest
+
+from mock import patch
+
+from blivet import util
+
+class RunManyTestCase(unittest.TestCase):
+    def testOrder(self):
+        argvs = [["sh", "-c", "sleep 0.%d; echo %d; exit %d" % (3 - i, i, i)]
+                 for i in range(3)]
+        self.assertEqual(util.run_many(argvs, jobs=3),
+                         [(0, "0\n"), (1, "1\n"), (2, "2\n")])
+        self.assertEqual(util.run_many([]), [])
+
+    def testConcurrent(self):
+        argvs = [["sleep", "0.5"]] * 4
+        start = time.time()
+        util.run_many(argvs, jobs=4)
+        self.assertLess(time.time() - start, 1.5)
+
+    def testLogging(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        util.program_log.addHandler(handler)
+        level = util.program_log.level
+        util.program_log.setLevel(logging.DEBUG)
+        try:
+            util.run_many([["sh", "-c", "echo a; sleep 0.2; echo b"],
+                           ["sh", "-c", "echo c; echo d"]], jobs=2)
+        finally:
+            util.program_log.removeHandler(handler)
+            util.program_log.setLevel(level)
+
+        # each program's output is logged together, after its command line
+        messages = [r.getMessage() for r in records]
+        self.assertEqual(len(messages), 8)
+        for first in (0, 4):
+            self.assertTrue(messages[first].startswith("Running... sh -c"))
+            self.assertEqual(messages[first + 3], "Return code: 0")
+        self.assertEqual(sorted(messages[1:3] + messages[5:7]),
+                         ["a", "b", "c", "d"])
+        self.assertEqual(messages[messages.index("a") + 1], "b")
+
+    def testError(self):
+        argvs = [["true"], ["/nonexistent/program"], ["true"]]
+        self.assertRaises(OSError, util.run_many, argvs, jobs=3)
+
+    def testOtherError(self):
+        ran = []
+
+        def run(argv, **_kwargs):
+            if argv[0].startswith("bad"):
+                raise ValueError(argv[0])
+            ran.append(argv)
+            return (0, "")
+
+        argvs = [["a"], ["bad1"], ["c"], ["bad2"], ["e"], ["f"]]
+        with patch.object(util, "_run_program", side_effect=run):
+            with self.assertRaises(ValueError) as cm:
+                util.run_many(argvs, jobs=2)
+
+        # the first error in argvs is raised once every program has run
+        self.assertEqual(str(cm.exception), "bad1")
+        self.assertEqual(sorted(ran), [["a"], ["c"], ["e"], ["f"]])
+
+        # errors that are not OSErrors are raised too
+        self.assertRaises(TypeError, util.run_many, [["true"], [None]], jobs=2)
+
+if __name__ == "__main__":
+    unittest.main()